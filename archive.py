@@ -0,0 +1,90 @@
+# archive.py
+"""
+Архивация: горячая tasks.db остаётся маленькой, история — в помесячных файлах ARCHIVE_DIR/tasks-ГГГГ-ММ.db.
+
+- раз в сутки (ARCHIVE_CRON) закрытые задачи, не менявшиеся ARCHIVE_AFTER_DAYS дней, переносятся в архив
+  вместе с комментариями, файлами и журналом; журнал действий с сотрудниками — по своей дате;
+- перенос пачками по ARCHIVE_BATCH задач: сначала копия в файл архива (своя транзакция), затем удаление
+  из горячей базы (своя). Обрыв между ними безвреден: в следующий раз копия перезапишется, и строки удалятся;
+- после переноса — PRAGMA incremental_vacuum: освободившиеся страницы возвращаются файлу;
+- чтение прозрачно: карточка, история и файлы задачи ищутся в архиве, если задачи нет в горячей базе
+  (repo.read_archived), /export читает и архив. Счётчики задач считают и архив. Поиск /find и списки
+  задач — только по горячей базе: в архиве лишь давно закрытые задачи.
+"""
+import logging
+import time
+from datetime import timedelta
+from itertools import groupby
+
+import db
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH
+
+log = logging.getLogger(__name__)
+
+VACUUM_STEP_PAGES = 2000  # страниц за один PRAGMA incremental_vacuum — чтобы не держать запись долго
+
+
+def _task_month(updated_at: int) -> str:
+    return db.from_ts(updated_at).strftime("%Y-%m")
+
+
+def _move(month: str, task_ids, audit_ids, before: int) -> int:
+    # на общем соединении записи: пока пачка переносится, хендлеры этого процесса в базу не пишут
+    with db.writer() as conn:
+        db.attach_archive(conn, month)
+        try:
+            with conn:
+                db.copy_to_archive(conn, task_ids, audit_ids, before)
+            with conn:
+                return db.drop_archived(conn, month, task_ids, audit_ids)
+        finally:
+            db.detach_archive(conn)
+
+
+def run(after_days: int = ARCHIVE_AFTER_DAYS, batch: int = ARCHIVE_BATCH) -> dict:
+    """
+    Перенести в архив всё старше after_days дней. Блокирующе — вызывать не из event loop.
+    Возвращает {"tasks": задач, "audit": записей журнала без задачи, "freed_mb": насколько уменьшился файл}.
+    """
+    moved = {"tasks": 0, "audit": 0, "freed_mb": 0.0}
+    if after_days <= 0:
+        return moved
+    before = db.to_ts(db.now_local() - timedelta(days=after_days))
+    before_iso = db.from_ts(before).replace(tzinfo=None).isoformat(timespec="seconds")
+    t0 = time.perf_counter()
+
+    with db.reader() as conn:
+        pages_before = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    while True:
+        with db.reader() as conn:
+            rows = db.archive_candidates(conn, before, batch)
+        if not rows:
+            break
+        for month, group in groupby(sorted(rows, key=lambda r: (r[1], r[0])), key=lambda r: _task_month(r[1])):
+            moved["tasks"] += _move(month, [r[0] for r in group], (), before)
+    while True:
+        with db.reader() as conn:
+            rows = db.archive_audit_candidates(conn, before_iso, batch)
+        if not rows:
+            break
+        for month, group in groupby(rows, key=lambda r: r[1][:7]):
+            ids = [r[0] for r in group]
+            _move(month, (), ids, before)
+            moved["audit"] += len(ids)
+
+    if moved["tasks"] or moved["audit"]:
+        free = None
+        while free != 0:
+            with db.writer() as conn:
+                left = db.incremental_vacuum(conn, VACUUM_STEP_PAGES)
+            if free is not None and left >= free:
+                break  # база без auto_vacuum=INCREMENTAL: страницы не возвращаются
+            free = left
+        with db.writer() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            pages_after = conn.execute("PRAGMA page_count").fetchone()[0]
+        moved["freed_mb"] = round((pages_before - pages_after) * page_size / 2**20, 1)
+        log.info("archive: %d tasks, %d audit records moved, %.1f MB freed in %.1fs",
+                 moved["tasks"], moved["audit"], moved["freed_mb"], time.perf_counter() - t0)
+    return moved
@@ -0,0 +1,211 @@
+# bench/compact_schema.py
+"""
+Схема tasks "до" (статус — русская строка, сроки — ISO-текст) и "после" миграции 6
+(статус — код, сроки — unix-время): размер файла и скорость запросов списков/отчёта.
+
+Генерирует базу в старой схеме (миграции 1–5), меряет, прогоняет миграцию 6
+(отдельно — копирование пачками и финальную транзакцию, на время которой блокируется запись),
+меряет снова. Во время копирования параллельно идут записи в старую таблицу — после миграции
+проверяется, что ни одна не потерялась.
+
+Запуск из корня репозитория:
+    python bench/compact_schema.py --tasks 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import db  # noqa: E402
+
+DEPTS = ("Снабжение", "Финансы", "Бухгалтерия")
+# доли статусов: основная масса — завершённые
+STATUS_WEIGHTS = {db.STATUS_NEW: 5, db.STATUS_IN_PROGRESS: 5, db.STATUS_ON_REVIEW: 3,
+                  db.STATUS_DONE: 80, db.STATUS_CANCELED: 7}
+
+
+def generate(path, tasks, users):
+    migrations = db.MIGRATIONS
+    db.DB_FILE = path
+    db.MIGRATIONS = [m for m in migrations if m[0] <= 5]
+    try:
+        db.init_db(1)
+    finally:
+        db.MIGRATIONS = migrations
+    rnd = random.Random(1)
+    start = datetime(2024, 1, 1)
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+
+    def rows():
+        for i in range(tasks):
+            created = start + timedelta(minutes=i)
+            deadline = created + timedelta(days=rnd.randint(1, 30))
+            updated = created + timedelta(hours=rnd.randint(0, 72))
+            st = rnd.choices(statuses, weights)[0]
+            yield (f"Задача {i}", "описание", db.STATUS_TITLES[st], deadline.isoformat(timespec="seconds"),
+                   100 + i % users, DEPTS[i % len(DEPTS)],
+                   created.isoformat(timespec="seconds"), updated.isoformat(timespec="seconds"))
+
+    with db.transaction() as conn:
+        conn.executemany(
+            "INSERT INTO tasks(title, description, status, deadline, owner_telegram_id, department, "
+            "created_at, updated_at) VALUES(?,?,?,?,?,?,?,?)",
+            rows(),
+        )
+    with db.writer() as conn:
+        conn.execute("ANALYZE")
+    db.close_all()
+
+
+def vacuum_size(path):
+    conn = sqlite3.connect(path)
+    conn.execute("VACUUM")
+    conn.close()
+    return os.path.getsize(path)
+
+
+def queries(legacy: bool, now, cursor):
+    """
+    Запросы хендлеров списков и отчёта в виде, в котором их выполняет каждая схема.
+    """
+    def st(statuses):
+        return db._legacy_status_in(statuses) if legacy else db.status_in(statuses)
+
+    active, review, done = st(db.ACTIVE_STATUSES), st((db.STATUS_ON_REVIEW,)), st((db.STATUS_DONE,))
+    return {
+        "overdue count": (f"SELECT COUNT(*) FROM tasks WHERE {active} AND deadline < ?", (now,)),
+        "active page 1": (f"SELECT * FROM tasks WHERE {active} ORDER BY deadline, id LIMIT 11", ()),
+        "active page N": (f"SELECT * FROM tasks WHERE {active} AND (deadline, id) > (?, ?) "
+                          f"ORDER BY deadline, id LIMIT 11", cursor),
+        "employee page": (f"SELECT * FROM tasks WHERE {active} AND owner_telegram_id=? "
+                          f"ORDER BY deadline, id LIMIT 11", (100,)),
+        "review page": (f"SELECT * FROM tasks WHERE {review} ORDER BY deadline, id LIMIT 11", ()),
+        "done page": (f"SELECT * FROM tasks WHERE {done} ORDER BY updated_at DESC, id DESC LIMIT 11", ()),
+    }
+
+
+def measure(path, legacy, repeat):
+    conn = sqlite3.connect(path)
+    mid = conn.execute("SELECT deadline, id FROM tasks ORDER BY id LIMIT 1 OFFSET "
+                       "(SELECT COUNT(*) / 2 FROM tasks)").fetchone()
+    now = datetime(2025, 6, 1)
+    qs = queries(legacy, now.isoformat(timespec="seconds") if legacy else db.to_ts(now), tuple(mid))
+    out = {}
+    for name, (sql, params) in qs.items():
+        conn.execute(sql, params).fetchall()  # прогрев кэша
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            times.append(time.perf_counter() - t0)
+        out[name] = statistics.median(times) * 1e6
+    conn.close()
+    return out
+
+
+def migrate_online(path, tasks, batch):
+    """
+    Миграция 6 с параллельными записями в старую таблицу. Возвращает (время копирования,
+    время финальной транзакции, число записей во время копирования).
+    """
+    db.DB_FILE = path
+    timings = {}
+    migrations = db.MIGRATIONS
+    version, final, prepare = next(m for m in migrations if m[0] == 6)
+
+    def timed(name, fn):
+        def run(conn, *a):
+            t0 = time.perf_counter()
+            fn(conn, *a)
+            timings[name] = time.perf_counter() - t0
+        return run
+
+    stop = threading.Event()
+    writes = []
+
+    def writer():
+        conn = sqlite3.connect(path, timeout=30)
+        rnd = random.Random(2)
+        while not stop.is_set():
+            task_id = rnd.randint(1, tasks)
+            with conn:
+                conn.execute("UPDATE tasks SET status=?, updated_at=? WHERE id=?",
+                             (db.STATUS_TITLES[db.STATUS_DONE], "2025-06-01T12:00:00", task_id))
+            writes.append(task_id)
+            time.sleep(0.001)
+        conn.close()
+
+    def prepare_with_writes(conn):
+        t = threading.Thread(target=writer)
+        t.start()
+        try:
+            prepare(conn, batch)
+        finally:
+            stop.set()
+            t.join()
+
+    db.MIGRATIONS = [m for m in migrations if m[0] < 6]
+    db.MIGRATIONS.append((6, timed("final", final), timed("copy", prepare_with_writes)))
+    try:
+        with db.writer() as conn:
+            db.migrate(conn)
+    finally:
+        db.MIGRATIONS = migrations
+        db.close_all()
+
+    conn = sqlite3.connect(path)
+    lost = [i for i in set(writes)
+            if conn.execute("SELECT status FROM tasks WHERE id=?", (i,)).fetchone()[0] != db.STATUS_DONE]
+    counters = db.check_counters(conn)
+    conn.close()
+    if lost:
+        raise SystemExit(f"потеряны записи во время миграции: {lost[:10]}")
+    if counters:
+        raise SystemExit(f"счётчики разошлись с задачами: {counters[:10]}")
+    return timings["copy"], timings["final"], len(writes)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tasks", type=int, default=1_000_000)
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--batch", type=int, default=5000)
+    ap.add_argument("--repeat", type=int, default=50)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        t0 = time.perf_counter()
+        generate(path, args.tasks, args.users)
+        print(f"сгенерировано {args.tasks} задач за {time.perf_counter() - t0:.1f}s")
+
+        size_before = vacuum_size(path)
+        before = measure(path, True, args.repeat)
+
+        copy_s, final_s, writes = migrate_online(path, args.tasks, args.batch)
+        print(f"миграция: копирование {copy_s:.1f}s (параллельных записей: {writes}), "
+              f"финальная транзакция {final_s * 1000:.0f}ms")
+
+        with sqlite3.connect(path) as conn:
+            conn.execute("ANALYZE")
+        size_after = vacuum_size(path)
+        after = measure(path, False, args.repeat)
+
+    print(f"\nразмер файла: {size_before / 2**20:.1f} MB -> {size_after / 2**20:.1f} MB "
+          f"({(1 - size_after / size_before) * 100:.0f}% меньше)")
+    print(f"\n{'запрос':<16}{'до, мкс':>12}{'после, мкс':>12}")
+    for name in before:
+        print(f"{name:<16}{before[name]:>12.0f}{after[name]:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
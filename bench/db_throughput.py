@@ -0,0 +1,110 @@
+# bench/db_throughput.py
+"""
+Пропускная способность смешанной нагрузки чтение/запись:
+"до" — новое соединение на каждую операцию, rollback journal (как было в db.get_conn),
+"после" — db.writer() + пул db.reader(), WAL и настройки из config.py.
+
+Запуск из корня репозитория:
+    python bench/db_throughput.py --seconds 5 --readers 4 --write-share 0.2
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import db  # noqa: E402
+
+
+def prepare(path, users, tasks):
+    db.DB_FILE = path
+    db.init_db(1)
+    with db.transaction() as conn:
+        for uid in range(100, 100 + users):
+            db.upsert_employee(conn, uid, f"User {uid}", "Снабжение", 1)
+        for i in range(tasks):
+            db.create_task(conn, f"Task {i}", "desc", db.now_ts(), 100 + i % users, "Снабжение", 1)
+    db.close_all()
+
+
+def legacy_conn(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def op(conn, rnd, users, tasks, write):
+    if write:
+        db.set_task_status(conn, rnd.randint(1, tasks), db.STATUS_IN_PROGRESS, 1, "bench")
+    else:
+        db.list_tasks_page(conn, db.ACTIVE_STATUSES, owner_id=100 + rnd.randrange(users))
+        db.get_user(conn, 100 + rnd.randrange(users))
+
+
+def run(mode, path, seconds, threads, users, tasks, write_share):
+    stop = time.perf_counter() + seconds
+    counts = [0] * threads
+    errors = [0] * threads
+
+    if mode == "before":
+        with legacy_conn(path) as c:
+            c.execute("PRAGMA journal_mode=DELETE")
+    else:
+        with db.writer():
+            pass  # переключает файл в WAL
+
+    def worker(i):
+        rnd = random.Random(i)
+        while time.perf_counter() < stop:
+            write = rnd.random() < write_share
+            try:
+                if mode == "before":
+                    conn = legacy_conn(path)
+                    try:
+                        with conn:
+                            op(conn, rnd, users, tasks, write)
+                    finally:
+                        conn.close()
+                elif write:
+                    with db.transaction() as conn:
+                        op(conn, rnd, users, tasks, True)
+                else:
+                    with db.reader() as conn:
+                        op(conn, rnd, users, tasks, False)
+                counts[i] += 1
+            except sqlite3.OperationalError:
+                errors[i] += 1
+
+    ts = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    db.close_all()
+    total = sum(counts)
+    print(f"[{mode}] {total / seconds:9.0f} ops/s  (ops={total}, locked={sum(errors)})")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--readers", type=int, default=4, help="число потоков нагрузки")
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--tasks", type=int, default=2000)
+    ap.add_argument("--write-share", type=float, default=0.2)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepare(path, args.users, args.tasks)
+        for mode in ("before", "after"):
+            run(mode, path, args.seconds, args.readers, args.users, args.tasks, args.write_share)
+
+
+if __name__ == "__main__":
+    main()
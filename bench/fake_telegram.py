@@ -0,0 +1,136 @@
+# bench/fake_telegram.py
+"""
+Фейковый Bot API на localhost: принимает запросы aiogram (POST /bot<token>/<method>),
+отвечает правдоподобными объектами и считает вызовы по методам. Сеть и Telegram не нужны.
+Бот указывает на него через TELEGRAM_API_URL=http://127.0.0.1:8081 (или session в коде бенчмарка).
+
+Отдельно (бот запускается как обычно; getUpdates отдаёт то, что прислали в POST /updates — JSON-список update):
+    python bench/fake_telegram.py --port 8081 --latency-ms 30
+Из кода: fake, runner, url = await fake_telegram.start("127.0.0.1", 0, record=True)
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import sys
+import time
+
+from aiohttp import web
+
+_MESSAGE_METHODS = frozenset(("sendmessage", "sendphoto", "senddocument", "editmessagetext",
+                              "editmessagereplymarkup", "editmessagecaption", "copymessage", "forwardmessage"))
+
+
+class FakeTelegram:
+    def __init__(self, latency_ms: float = 0, record: bool = False):
+        self.latency = latency_ms / 1000
+        self.record = record
+        self.calls = {}  # метод -> число вызовов
+        self.sent = []  # (метод, chat_id, текст) при record=True
+        self._ids = itertools.count(1000)
+        self._updates = []  # ещё не подтверждённые offset-ом апдейты для getUpdates
+        self._new_updates = asyncio.Event()
+
+    def push(self, updates):
+        self._updates.extend(updates)
+        self._new_updates.set()
+
+    async def _get_updates(self, form):
+        offset = int(form.get("offset") or 0)
+        self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            # long polling: ждём новых, а не крутим цикл бота вхолостую
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), min(1.0, float(form.get("timeout") or 0)))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:int(form.get("limit") or 100)]
+
+    def _message(self, chat_id, text=None) -> dict:
+        msg = {"message_id": next(self._ids), "date": int(time.time()),
+               "chat": {"id": chat_id, "type": "private"}}
+        if text is not None:
+            msg["text"] = text
+        return msg
+
+    def _result(self, method: str, form):
+        if method == "getme":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        if method == "getfile":
+            return {"file_id": form.get("file_id", ""), "file_unique_id": "u", "file_path": "documents/file.bin"}
+        chat_id = _int(form.get("chat_id"))
+        if method == "sendmediagroup":
+            media = json.loads(form.get("media") or "[]")
+            return [self._message(chat_id) for _ in media]
+        if method in _MESSAGE_METHODS:
+            return self._message(chat_id, form.get("text") or form.get("caption"))
+        return True  # answerCallbackQuery, deleteWebhook, setMyCommands, sendChatAction, ...
+
+    async def handle(self, request):
+        method = request.match_info["method"].lower()
+        form = await request.post()
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if self.record:
+            self.sent.append((method, _int(form.get("chat_id")), form.get("text") or form.get("caption")))
+        if method == "getupdates":
+            return web.json_response({"ok": True, "result": await self._get_updates(form)})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return web.json_response({"ok": True, "result": self._result(method, form)})
+
+    async def handle_push(self, request):
+        self.push(await request.json())
+        return web.json_response({"ok": True})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_post("/updates", self.handle_push)
+        return app
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+
+async def start(host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0, record: bool = False):
+    """
+    Поднять фейк. Возвращает (fake, runner, base_url); остановка — await runner.cleanup().
+    port=0 — любой свободный.
+    """
+    fake = FakeTelegram(latency_ms, record)
+    runner = web.AppRunner(fake.app(), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return fake, runner, f"http://{host}:{port}"
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8081)
+    ap.add_argument("--latency-ms", type=float, default=0, help="задержка ответа, как у настоящего API")
+    ap.add_argument("--stats-every", type=float, default=10, help="печатать счётчики вызовов раз в N секунд")
+    args = ap.parse_args()
+
+    fake, runner, url = await start(args.host, args.port, args.latency_ms)
+    print(f"fake Bot API: TELEGRAM_API_URL={url}", file=sys.stderr)
+    try:
+        while True:
+            await asyncio.sleep(args.stats_every)
+            print(" ".join(f"{m}={n}" for m, n in sorted(fake.calls.items())) or "нет вызовов", flush=True)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
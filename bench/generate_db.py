@@ -0,0 +1,170 @@
+# bench/generate_db.py
+"""
+Синтетическая tasks.db для бенчмарков: N сотрудников, M задач за последние --days дней
+с правдоподобными статусами (чем старше задача, тем вероятнее она закрыта), комментариями,
+файлами и журналом, как если бы всё это делалось через бота. Схема — текущая (все миграции),
+счётчики, поисковый индекс и напоминания заполняются теми же триггерами и функциями, что и в боте.
+
+Запуск из корня репозитория:
+    python bench/generate_db.py --out bench.db --users 200 --tasks 100000
+"""
+import argparse
+import logging
+import math
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import db  # noqa: E402
+
+ADMIN_ID = 1
+FIRST_USER_ID = 100_000
+
+_SUBJECTS = ("Счёт", "Акт сверки", "Накладная", "Договор", "Платёжное поручение", "Отчёт", "Заявка", "Смета")
+_OBJECTS = ("поставщика", "подрядчика", "клиента", "за квартал", "по складу", "по командировке", "на закупку")
+_COMMENTS = ("Взял в работу", "Жду ответа от поставщика", "Отправил на согласование", "Нужны оригиналы документов",
+             "Исправил замечания", "Сумма не сходится, уточняю", "Готово, проверьте", "Перенесли оплату")
+_FIRST = ("Анна", "Иван", "Мария", "Сергей", "Ольга", "Дмитрий", "Елена", "Алексей")
+_LAST = ("Иванов", "Петров", "Смирнов", "Кузнецов", "Попов", "Соколов", "Лебедев", "Козлов")
+
+
+def _iso(ts: int) -> str:
+    # отметки времени комментариев, файлов и журнала хранятся как в db.now_iso()
+    return db.from_ts(ts).replace(tzinfo=None).isoformat(timespec="seconds")
+
+
+def _poisson(rnd, mean: float) -> int:
+    limit, k, p = math.exp(-mean), 0, rnd.random()
+    while p > limit:
+        k += 1
+        p *= rnd.random()
+    return k
+
+
+def _status(rnd, age_days: float) -> int:
+    closed = min(0.95, age_days / 20)
+    if rnd.random() < closed:
+        return db.STATUS_CANCELED if rnd.random() < 0.08 else db.STATUS_DONE
+    return rnd.choice((db.STATUS_NEW, db.STATUS_IN_PROGRESS, db.STATUS_IN_PROGRESS, db.STATUS_ON_REVIEW))
+
+
+_PATH = {
+    db.STATUS_NEW: (),
+    db.STATUS_IN_PROGRESS: ("Новая→В процессе",),
+    db.STATUS_ON_REVIEW: ("Новая→В процессе", "В процессе→На проверке"),
+    db.STATUS_DONE: ("Новая→В процессе", "В процессе→На проверке", "На проверке→Готово"),
+    db.STATUS_CANCELED: ("→Отменено",),
+}
+
+
+def _task_batch(rnd, first_id, n, total, users, now, days, comments, files):
+    """
+    Строки задач и всего, что к ним относится, для id first_id .. first_id + n - 1.
+    """
+    tasks, comment_rows, file_rows, audit_rows, jobs = [], [], [], [], []
+    span = days * 86400
+    for task_id in range(first_id, first_id + n):
+        created = now - span + span * (task_id - 1) // max(1, total)
+        owner, dept = users[rnd.randrange(len(users))]
+        deadline = created + rnd.randint(1, 30) * 86400
+        status = _status(rnd, (now - created) / 86400)
+        steps = _PATH[status]
+        t = created
+        audit_rows.append((task_id, ADMIN_ID, "CREATE_TASK", f"to={owner} deadline={db.fmt_ts(deadline)}", _iso(t)))
+
+        for _ in range(min(20, _poisson(rnd, comments))):
+            t = min(now, t + rnd.randint(600, 86400))
+            text = rnd.choice(_COMMENTS)
+            comment_rows.append((task_id, owner, text, _iso(t)))
+            audit_rows.append((task_id, owner, "COMMENT", text, _iso(t)))
+        for _ in range(min(10, _poisson(rnd, files))):
+            t = min(now, t + rnd.randint(600, 86400))
+            kind = "photo" if rnd.random() < 0.4 else "document"
+            name = "photo.jpg" if kind == "photo" else f"doc_{task_id}_{rnd.randrange(1000)}.pdf"
+            file_id = "BQAC" + "".join(rnd.choices(string.ascii_letters + string.digits, k=60))
+            file_rows.append((task_id, owner, file_id, name, kind, _iso(t)))
+            audit_rows.append((task_id, owner, "ADD_FILE", name, _iso(t)))
+        for details in steps:
+            t = min(now, t + rnd.randint(3600, 3 * 86400))
+            actor = ADMIN_ID if details in ("На проверке→Готово", "→Отменено") else owner
+            audit_rows.append((task_id, actor, "STATUS", details, _iso(t)))
+
+        title = f"{rnd.choice(_SUBJECTS)} {rnd.choice(_OBJECTS)} №{task_id}"
+        tasks.append((task_id, title, "Описание задачи " + title.lower(), status, deadline, owner, dept, created, t))
+        if status in (db.STATUS_NEW, db.STATUS_IN_PROGRESS) and deadline > now:
+            jobs.extend(db._task_reminder_jobs(task_id, deadline))
+    return tasks, comment_rows, file_rows, audit_rows, jobs
+
+
+def generate(path, users=200, tasks=100_000, days=180, comments=1.5, files=0.4, seed=1, batch=10_000,
+             inactive_share=0.05):
+    """
+    Создать базу path (файла быть не должно). Возвращает список (telegram_id, отдел) активных сотрудников.
+    """
+    if os.path.exists(path):
+        raise SystemExit(f"{path} уже существует — генератор пишет только в новый файл")
+    rnd = random.Random(seed)
+    db.DB_FILE = path
+    db.init_db(ADMIN_ID)
+    now = db.now_ts()
+
+    people = []
+    for i in range(users):
+        tg_id = FIRST_USER_ID + i
+        people.append((tg_id, f"{rnd.choice(_LAST)} {rnd.choice(_FIRST)}", db.DEPARTMENTS[i % len(db.DEPARTMENTS)],
+                       0 if rnd.random() < inactive_share else 1))
+    with db.transaction() as conn:
+        conn.executemany("INSERT INTO users(telegram_id, full_name, department, role, is_active) "
+                         "VALUES (?,?,?,'employee',?)", people)
+    active = [(tg_id, dept) for tg_id, _, dept, is_active in people if is_active]
+
+    for first in range(1, tasks + 1, batch):
+        task_rows, comment_rows, file_rows, audit_rows, jobs = _task_batch(
+            rnd, first, min(batch, tasks - first + 1), tasks, active, now, days, comments, files)
+        with db.transaction() as conn:
+            conn.executemany("INSERT INTO tasks(id, title, description, status, deadline, owner_telegram_id, "
+                             "department, created_at, updated_at) VALUES (?,?,?,?,?,?,?,?,?)", task_rows)
+            conn.executemany("INSERT INTO comments(task_id, author_telegram_id, text, created_at) VALUES (?,?,?,?)",
+                             comment_rows)
+            conn.executemany("INSERT INTO files(task_id, uploader_telegram_id, telegram_file_id, file_name, kind, "
+                             "created_at) VALUES (?,?,?,?,?,?)", file_rows)
+            conn.executemany("INSERT INTO audit(task_id, actor_telegram_id, action, details, created_at) "
+                             "VALUES (?,?,?,?,?)", audit_rows)
+            db.schedule_jobs(conn, jobs)
+
+    with db.writer() as conn:
+        conn.execute("ANALYZE")
+    db.close_all()
+    return active
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--out", required=True, help="новый файл базы")
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--tasks", type=int, default=100_000)
+    ap.add_argument("--days", type=int, default=180, help="за сколько дней распределить задачи")
+    ap.add_argument("--comments", type=float, default=1.5, help="комментариев на задачу в среднем")
+    ap.add_argument("--files", type=float, default=0.4, help="файлов на задачу в среднем")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    logging.getLogger("metrics").setLevel(logging.ERROR)  # пачки по 10k строк — не "медленные запросы"
+    t0 = time.perf_counter()
+    generate(args.out, args.users, args.tasks, args.days, args.comments, args.files, args.seed)
+    elapsed = time.perf_counter() - t0
+
+    conn = db.get_conn()
+    counts = {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+              for t in ("users", "tasks", "comments", "files", "audit", "jobs")}
+    conn.close()
+    print(f"{args.out}: {os.path.getsize(args.out) / 2**20:.1f} MB за {elapsed:.1f}s")
+    print("  " + ", ".join(f"{t} {n}" for t, n in counts.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# bench/handler_latency.py
+"""
+Латентность хендлеров при конкурентных нажатиях: "до" (sqlite прямо в event loop)
+и "после" (через repo, DB-поток).
+
+Каждый "callback" — как task_action: прочитать пользователя, сменить статус задачи (UPDATE + audit),
+плюс лёгкие callbacks без БД (меню), которые страдают от блокировок loop сильнее всего.
+
+Запуск из корня репозитория:
+    python bench/handler_latency.py --callbacks 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import db  # noqa: E402
+import repo  # noqa: E402
+
+
+def prepare(path, users, tasks):
+    db.DB_FILE = path
+    db.init_db(1)
+    with db.transaction() as conn:
+        for uid in range(100, 100 + users):
+            db.upsert_employee(conn, uid, f"User {uid}", "Финансы", 1)
+        for i in range(tasks):
+            db.create_task(conn, f"Task {i}", "desc", db.now_ts(), 100 + i % users, "Финансы", 1)
+    db.close_all()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def blocking_handler(uid, task_id):
+    conn = db.get_conn()
+    db.get_user(conn, uid)
+    with conn:
+        db.set_task_status(conn, task_id, db.STATUS_IN_PROGRESS, uid, "bench")
+    conn.close()
+
+
+async def run_scenario(mode, n, concurrency, users, tasks, db_share):
+    sem = asyncio.Semaphore(concurrency)
+    lat_db, lat_light = [], []
+
+    async def one(i):
+        async with sem:
+            uid = 100 + i % users
+            task_id = 1 + i % tasks
+            heavy = random.random() < db_share
+            t0 = time.perf_counter()
+            if heavy:
+                if mode == "before":
+                    blocking_handler(uid, task_id)
+                else:
+                    await repo.get_user(uid)
+                    await repo.set_task_status(task_id, db.STATUS_IN_PROGRESS, uid, "bench")
+            # имитация call.answer() / отправки сообщения
+            await asyncio.sleep(0.001)
+            (lat_db if heavy else lat_light).append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return time.perf_counter() - t0, lat_db, lat_light
+
+
+def report(mode, elapsed, lat_db, lat_light):
+    print(f"[{mode}] {len(lat_db) + len(lat_light)} callbacks за {elapsed:.2f}s")
+    for name, values in (("db", lat_db), ("light", lat_light)):
+        if values:
+            print(f"  {name:5} n={len(values):5} p50={statistics.median(values):7.2f}ms "
+                  f"p99={percentile(values, 99):7.2f}ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--callbacks", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--tasks", type=int, default=500)
+    ap.add_argument("--db-share", type=float, default=0.3, help="доля callbacks с записью в БД")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepare(os.path.join(tmp, "bench.db"), args.users, args.tasks)
+        for mode in ("before", "after"):
+            random.seed(1)
+            elapsed, lat_db, lat_light = asyncio.run(
+                run_scenario(mode, args.callbacks, args.concurrency, args.users, args.tasks, args.db_share)
+            )
+            report(mode, elapsed, lat_db, lat_light)
+        repo.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# bench/query_plans.py
+"""
+Проверка планов запросов: прогоняет все запросы хендлеров (функции db.*) на временной базе,
+перехватывает SQL через trace callback и делает EXPLAIN QUERY PLAN для каждого.
+Завершается с кодом 1, если какой-то запрос читает таблицу полным сканированием (SCAN <table> без индекса).
+
+Запуск из корня репозитория (например, в CI после изменения схемы или запросов):
+    python bench/query_plans.py
+"""
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import db  # noqa: E402
+
+# таблицы, которые допустимо сканировать целиком
+ALLOWED_SCANS = {"task_counters"}  # строк не больше, чем (сотрудник, отдел, статус)
+
+FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+def handler_queries(conn):
+    """
+    Вызовы, покрывающие запросы хендлеров main.py. Новый запрос в db.py — добавить сюда.
+    """
+    uid, task_id = 100, 1
+    db.get_user(conn, uid)
+    db.list_employees(conn)
+    db.list_active_employees(conn)
+    db.get_task(conn, task_id)
+    cursor = (db.now_ts(), task_id)
+    for statuses, by, overdue in (
+        (db.ACTIVE_STATUSES, "deadline", False),
+        ((db.STATUS_ON_REVIEW,), "deadline", False),
+        ((db.STATUS_DONE,), "updated", False),
+        (db.ACTIVE_STATUSES, "deadline", True),
+    ):
+        for owner in (None, uid):
+            for cur, back in ((None, False), (cursor, False), (cursor, True)):
+                db.list_tasks_page(conn, statuses, owner_id=owner, overdue=overdue, by=by, cursor=cur, backward=back)
+    for owner in (None, uid):
+        db.search_tasks(conn, "счёт поставщику", owner_id=owner, offset=10)
+    db.get_task_detail(conn, task_id)
+    db.task_history_page(conn, task_id, before_id=100)
+    db.list_task_files(conn, task_id, 30)
+    db.user_task_counts(conn, uid)
+    db.task_counts(conn, department="Финансы")
+    db.report_counts(conn)
+    db.dashboard(conn)
+    db.set_task_status(conn, task_id, db.STATUS_IN_PROGRESS, 1, "plan", from_status=db.STATUS_NEW, notify=True)
+    db.change_deadline(conn, task_id, db.now_ts(), 1)
+    db.create_tasks_bulk(conn, "t", "d", db.now_ts(), [(uid, "Финансы")], 1)
+    db.set_employee_active(conn, uid, True, 1)
+    db.fsm_load(conn, 0)
+    db.fsm_save(conn, uid, "{}", 0)
+    db.fsm_delete(conn, uid)
+    db.fsm_delete_expired(conn, 0)
+    db.ensure_cron_job(conn, "daily_report", "daily_report", "0 9 * * *", 0)
+    db.due_jobs(conn, 0)
+    db.finish_job(conn, 1, 0)
+    db.reschedule_job(conn, 1, 0)
+    db.cancel_jobs(conn, f"remind:{task_id}:")
+    db.next_job_time(conn)
+    db.acquire_lease(conn, "leader", "w0", 15)
+    db.enqueue_updates(conn, [(0, uid, "{}")], "leader", "w0", 1)
+    db.next_updates(conn, 0, 0, 100)
+    db.delete_updates(conn, 0, 1)
+    db.release_lease(conn, "leader", "w0")
+    db.archived_month(conn, task_id)
+    db.archive_candidates(conn, db.now_ts(), 500)
+    db.archive_audit_candidates(conn, db.now_iso(), 500)
+    db.due_outbox(conn, db.now_ts(), 100)
+    db.next_outbox_time(conn)
+    db.outbox_finish(conn, [1], [(2, None, "TelegramForbiddenError")], ["bulk:1"])
+    db.outbox_wake(conn, uid)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        db.DB_FILE = os.path.join(tmp, "plans.db")
+        db.init_db(1)
+        with db.transaction() as conn:
+            db.upsert_employee(conn, 100, "User", "Финансы", 1)
+            db.create_task(conn, "t", "d", db.now_ts(), 100, "Финансы", 1)
+
+        statements = []
+        with db.writer() as conn:
+            conn.set_trace_callback(statements.append)
+            try:
+                handler_queries(conn)
+            finally:
+                conn.set_trace_callback(None)
+                conn.rollback()
+
+            failures = 0
+            seen = set()
+            for sql in statements:
+                sql = " ".join(sql.split())
+                if not re.match(r"^(SELECT|UPDATE|DELETE|INSERT)\b", sql, re.I) or sql in seen:
+                    continue
+                seen.add(sql)
+                plan = [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+                scans = [d for d in plan if FULL_SCAN.match(d) and FULL_SCAN.match(d).group(1) not in ALLOWED_SCANS]
+                mark = "FAIL" if scans else "ok  "
+                failures += bool(scans)
+                print(f"{mark} {sql[:110]}")
+                for d in plan:
+                    print(f"       {d}")
+        db.close_all()
+
+    if failures:
+        print(f"\n{failures} запрос(ов) с полным сканированием таблицы")
+        sys.exit(1)
+    print("\nполных сканирований нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+# bench/render_cost.py
+"""
+Стоимость отрисовки экранов списка задач: текст страницы, клавиатура страницы и, для каждой задачи
+страницы, карточка с кнопками действий (как show_page + show_task без БД и Telegram).
+
+    before — как было: InlineKeyboardBuilder на каждую клавиатуру, тексты форматируются заново;
+    cold   — render.py, кэши очищаются перед каждой страницей (первый показ);
+    warm   — render.py, те же страницы повторно (листание назад, повторное открытие списка).
+
+На задачу: время CPU (мкс), пик памяти за страницу и сколько из неё осталось после (КБ; у render —
+это записи кэша). Память — tracemalloc отдельным проходом, чтобы трассировка не искажала время.
+Строки задач — sqlite3.Row из настоящей базы.
+
+Запуск из корня репозитория:
+    python bench/render_cost.py --tasks 2000 --rounds 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ.setdefault("ADMIN_TELEGRAM_ID", "1")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aiogram.utils.keyboard import InlineKeyboardBuilder  # noqa: E402
+
+import db  # noqa: E402
+import main as bot_main  # noqa: E402
+import render  # noqa: E402
+
+
+def prepare(path, users, tasks):
+    db.DB_FILE = path
+    db.init_db(1)
+    with db.transaction() as conn:
+        db.upsert_employees(conn, [(uid, f"User {uid}", db.DEPARTMENTS[uid % 3]) for uid in range(100, 100 + users)], 1)
+        now = db.now_ts()
+        db.insert_tasks(conn, [(f"Задача {i}: отчёт по поставке №{i * 7}", "Описание задачи " * 8,
+                                db.ACTIVE_STATUSES[i % 3], now + (i % 90) * 86400, 100 + i % users,
+                                db.DEPARTMENTS[i % 3]) for i in range(tasks)], 1)
+    pages = []
+    with db.reader() as conn:
+        cursor = None
+        while True:
+            rows, _, has_next = db.list_tasks_page(conn, db.ACTIVE_STATUSES, cursor=cursor, limit=bot_main.PAGE_SIZE)
+            if not rows:
+                break
+            pages.append(rows)
+            if not has_next:
+                break
+            cursor = (rows[-1]["deadline"], rows[-1]["id"])
+    db.close_all()
+    return pages
+
+
+# ---------- before: как было до render.py ----------
+
+def before_task_actions(task_id: int, status: int, admin: bool):
+    b = InlineKeyboardBuilder()
+    if admin:
+        if status == db.STATUS_ON_REVIEW:
+            b.button(text="✅ Принять (Готово)", callback_data=f"t:{task_id}:done")
+            b.button(text="↩️ Вернуть (В процессе)", callback_data=f"t:{task_id}:back")
+        b.button(text="🗓 Изменить срок", callback_data=f"t:{task_id}:chgdl")
+        b.button(text="🗑 Отменить задачу", callback_data=f"t:{task_id}:cancel")
+    else:
+        if status == db.STATUS_NEW:
+            b.button(text="▶️ В процессе", callback_data=f"t:{task_id}:inprog")
+        if status == db.STATUS_IN_PROGRESS:
+            b.button(text="🟨 На проверке", callback_data=f"t:{task_id}:review")
+        b.button(text="💬 Комментарий", callback_data=f"t:{task_id}:comment")
+        b.button(text="📎 Файл", callback_data=f"t:{task_id}:file")
+    b.adjust(2)
+    return b.as_markup()
+
+
+def before_page_kb(rows):
+    b = InlineKeyboardBuilder()
+    for r in rows:
+        b.button(text=f"#{r['id']} {r['title']}"[:40], callback_data=f"t:{r['id']}:open")
+    b.button(text="⬅️", callback_data=f"pg:active:p:{rows[0]['id']}:{rows[0]['deadline']}")
+    b.button(text="➡️", callback_data=f"pg:active:n:{rows[-1]['id']}:{rows[-1]['deadline']}")
+    b.adjust(*([1] * len(rows)), 2)
+    return b.as_markup()
+
+
+def before_line(row):
+    return (
+        f"#{row['id']} · {db.status_title(row['status'])} · до {db.fmt_ts(row['deadline'])} · {row['department']}\n"
+        f"{row['title'][:100]}"
+    )
+
+
+def before_page_text(rows):
+    return "Список задач\n\n" + "\n\n".join(before_line(r) for r in rows)
+
+
+def before_card(row):
+    return (
+        f"Задача #{row['id']}\n"
+        f"Отдел: {row['department']}\n"
+        f"Статус: {db.status_title(row['status'])}\n"
+        f"Срок: {db.fmt_ts(row['deadline'])}\n"
+        f"Название: {row['title']}\n"
+        f"Описание: {row['description']}"
+    )
+
+
+def before(rows, admin):
+    before_page_text(rows)
+    before_page_kb(rows)
+    for r in rows:
+        before_card(r)
+        before_task_actions(r["id"], r["status"], admin)
+
+
+# ---------- after: render.py через функции main ----------
+
+def after(rows, admin):
+    bot_main.format_task_page("Список задач", rows)
+    bot_main.kb_task_page("active", rows, True, True)
+    task_actions = bot_main.kb_admin_task if admin else bot_main.kb_employee_task
+    for r in rows:
+        bot_main.format_task(r)
+        task_actions(r["id"], r["status"])
+
+
+def measure(pages, rounds: int, fn, clear: bool):
+    """
+    (мкс CPU, КБ пика памяти, КБ оставшейся памяти) на задачу — в среднем по страницам.
+    """
+    tasks = sum(len(rows) for rows in pages)
+    if not clear:
+        for i, rows in enumerate(pages):  # прогрев: страницы уже показывались
+            fn(rows, i % 2 == 0)
+    cpu = 0.0
+    for _ in range(rounds):
+        for i, rows in enumerate(pages):
+            if clear:
+                render.cache_clear()
+            t0 = time.process_time()
+            fn(rows, i % 2 == 0)
+            cpu += time.process_time() - t0
+
+    peak = kept = 0
+    tracemalloc.start()
+    for i, rows in enumerate(pages):
+        if clear:
+            render.cache_clear()
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        fn(rows, i % 2 == 0)
+        current, top = tracemalloc.get_traced_memory()
+        peak += top - base
+        kept += current - base
+    tracemalloc.stop()
+    return cpu / (rounds * tasks) * 1e6, peak / tasks / 1024, kept / tasks / 1024
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--tasks", type=int, default=2000)
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pages = prepare(os.path.join(tmp, "bench.db"), args.users, args.tasks)
+    tasks = sum(len(rows) for rows in pages)
+    print(f"{len(pages)} страниц, {tasks} задач; на задачу: строка списка, кнопка, карточка, кнопки действий")
+    results = {}
+    for mode, fn, clear in (("before", before, False), ("cold", after, True), ("warm", after, False)):
+        render.cache_clear()
+        results[mode] = measure(pages, args.rounds, fn, clear)
+        cpu, peak, kept = results[mode]
+        print(f"  {mode:6} {cpu:8.1f} мкс CPU  {peak:6.2f} КБ пик  {max(kept, 0):6.2f} КБ остаётся   на задачу")
+    base = results["before"][0]
+    print(f"  CPU: cold в {base / results['cold'][0]:.1f} раза меньше, warm — в {base / results['warm'][0]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
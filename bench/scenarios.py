@@ -0,0 +1,267 @@
+# bench/scenarios.py
+"""
+Сквозной прогон бота без Telegram: синтетическая база (generate_db.py) + фейковый Bot API
+(fake_telegram.py) + настоящий Dispatcher из main.build_dispatcher. Апдейты подаются через
+dp.feed_update, как их подавал бы polling/webhook; ответы бота уходят через sender в фейк.
+
+Один админ (последовательно, как живой человек) и --concurrency сотрудников одновременно:
+    lists        — списки (ad:*, em:*), листание, карточки задач
+    transitions  — Новая→В процессе→На проверке у сотрудников, приёмка у админа
+    create       — мастер создания задачи (ad:newtask → сотрудник → название → описание → срок)
+    mixed        — всё вместе
+
+Запуск из корня репозитория:
+    python bench/scenarios.py --scenario mixed --tasks 100000 --updates 20000 --concurrency 50
+    python bench/scenarios.py --db bench.db --api-latency-ms 30   # своя база (копируется, не меняется)
+
+Латентность шага — время dp.feed_update: хендлер целиком, включая ожидание БД и вызовы API,
+которые хендлер ждёт (answerCallbackQuery, editMessageText); сообщения через sender — в фоне.
+"""
+import os
+import sys
+
+os.environ.setdefault("BOT_TOKEN", "123456:BENCH")
+os.environ.setdefault("ADMIN_TELEGRAM_ID", "1")
+# лимиты Telegram бенчмарку не нужны — меряем бота, а не ожидание в очереди отправки
+os.environ.setdefault("SEND_GLOBAL_RATE", "100000")
+os.environ.setdefault("SEND_CHAT_RATE", "100000")
+os.environ.setdefault("SEND_CHAT_BURST", "100000")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import argparse  # noqa: E402
+import asyncio  # noqa: E402
+import itertools  # noqa: E402
+import logging  # noqa: E402
+import random  # noqa: E402
+import sqlite3  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+
+import db  # noqa: E402
+import fake_telegram  # noqa: E402
+import generate_db  # noqa: E402
+import main as bot_main  # noqa: E402
+import metrics  # noqa: E402
+import outbox  # noqa: E402
+import repo  # noqa: E402
+import sender  # noqa: E402
+from config import ADMIN_TELEGRAM_ID  # noqa: E402
+
+SCENARIOS = {
+    # шаг -> вес; шаги, которым нечего делать (например, нет задач на проверке), пропускаются
+    "lists": {"list": 6, "page": 2, "open": 3},
+    "transitions": {"inprog": 3, "review": 3, "accept": 2, "open": 1},
+    "create": {"create": 1},
+    "mixed": {"list": 6, "page": 2, "open": 3, "inprog": 2, "review": 2, "accept": 1, "create": 1},
+}
+
+ADMIN_LISTS = ("ad:active", "ad:dash", "ad:done", "dash:o:0", "dash:r:0")
+EMPLOYEE_LISTS = ("em:my", "em:myreview", "em:done")
+EMPLOYEE_STEPS = frozenset(("list", "page", "open", "inprog", "review"))
+ADMIN_STEPS = frozenset(("list", "page", "open", "accept", "create"))
+
+
+class Bench:
+    def __init__(self, dp, bot, scenario: str, updates: int, seed: int):
+        self.dp, self.bot = dp, bot
+        self.weights = SCENARIOS[scenario]
+        self.left = updates
+        self.rnd = random.Random(seed)
+        self.latency = {}  # шаг -> [мс]
+        self._ids = itertools.count(1)
+        self.tasks = {}  # сотрудник -> {task_id: (status, deadline)} — его активные задачи
+        self.review = []  # задачи на проверке — очередь админа
+        self.active = []  # (task_id, deadline) — курсоры для листания у админа
+
+    def load(self):
+        conn = db.get_readonly_conn()
+        try:
+            for r in conn.execute("SELECT telegram_id FROM users WHERE role='employee' AND is_active=1"):
+                self.tasks[r[0]] = {}
+            for task_id, owner, status, deadline in conn.execute(
+                    "SELECT id, owner_telegram_id, status, deadline FROM tasks WHERE status IN (?,?,?)",
+                    db.ACTIVE_STATUSES):
+                if owner in self.tasks:
+                    self.tasks[owner][task_id] = (status, deadline)
+                self.active.append((task_id, deadline))
+                if status == db.STATUS_ON_REVIEW:
+                    self.review.append(task_id)
+        finally:
+            conn.close()
+
+    # ---------- updates ----------
+
+    def _chat(self, uid: int) -> dict:
+        return {"id": uid, "type": "private"}
+
+    def _from(self, uid: int) -> dict:
+        return {"id": uid, "is_bot": False, "first_name": "bench"}
+
+    def callback(self, uid: int, data: str) -> Update:
+        return Update.model_validate({"update_id": next(self._ids), "callback_query": {
+            "id": str(next(self._ids)), "from": self._from(uid), "chat_instance": "bench", "data": data,
+            "message": {"message_id": next(self._ids), "date": 0, "chat": self._chat(uid), "text": "bench"}}},
+            context={"bot": self.bot})
+
+    def text(self, uid: int, text: str) -> Update:
+        return Update.model_validate({"update_id": next(self._ids), "message": {
+            "message_id": next(self._ids), "date": 0, "chat": self._chat(uid), "from": self._from(uid),
+            "text": text}}, context={"bot": self.bot})
+
+    async def feed(self, step: str, update: Update):
+        self.left -= 1
+        t0 = time.perf_counter()
+        await self.dp.feed_update(self.bot, update)
+        self.latency.setdefault(step, []).append((time.perf_counter() - t0) * 1000)
+
+    # ---------- actors ----------
+
+    def _pick(self, allowed) -> str:
+        steps = [s for s in self.weights if s in allowed]
+        return self.rnd.choices(steps, [self.weights[s] for s in steps])[0]
+
+    async def employee(self, uid: int):
+        mine = self.tasks[uid]
+        while self.left > 0:
+            step = self._pick(EMPLOYEE_STEPS)
+            if step == "list":
+                await self.feed("em:list", self.callback(uid, self.rnd.choice(EMPLOYEE_LISTS)))
+            elif step == "page" and mine:
+                task_id, (_, deadline) = self.rnd.choice(list(mine.items()))
+                await self.feed("em:page", self.callback(uid, f"pg:my:n:{task_id}:{deadline}"))
+            elif step == "open" and mine:
+                await self.feed("em:open", self.callback(uid, f"t:{self.rnd.choice(list(mine))}:open"))
+            elif step in ("inprog", "review"):
+                want = db.STATUS_NEW if step == "inprog" else db.STATUS_IN_PROGRESS
+                ids = [t for t, (s, _) in mine.items() if s == want]
+                if not ids:
+                    await asyncio.sleep(0)  # отдать loop остальным, если шагу нечего делать
+                    continue
+                task_id = self.rnd.choice(ids)
+                await self.feed(f"em:{step}", self.callback(uid, f"t:{task_id}:{step}"))
+                mine[task_id] = (want + 1, mine[task_id][1])
+                if step == "review":
+                    self.review.append(task_id)
+            else:
+                await asyncio.sleep(0)
+
+    async def admin(self):
+        uid = ADMIN_TELEGRAM_ID
+        employees = list(self.tasks)
+        while self.left > 0:
+            step = self._pick(ADMIN_STEPS)
+            if step == "list":
+                await self.feed("ad:list", self.callback(uid, self.rnd.choice(ADMIN_LISTS)))
+            elif step == "page" and self.active:
+                task_id, deadline = self.rnd.choice(self.active)
+                await self.feed("ad:page", self.callback(uid, f"pg:active:n:{task_id}:{deadline}"))
+            elif step == "open" and self.active:
+                await self.feed("ad:open", self.callback(uid, f"t:{self.rnd.choice(self.active)[0]}:open"))
+            elif step == "accept" and self.review:
+                task_id = self.review.pop(self.rnd.randrange(len(self.review)))
+                await self.feed("ad:accept", self.callback(uid, f"t:{task_id}:done"))
+            elif step == "create" and employees:
+                await self.feed("create:start", self.callback(uid, "ad:newtask"))
+                await self.feed("create:pick", self.callback(uid, f"ad:pick:{self.rnd.choice(employees)}"))
+                await self.feed("create:title", self.text(uid, f"Бенчмарк {self.left}"))
+                await self.feed("create:desc", self.text(uid, "Задача из bench/scenarios.py"))
+                await self.feed("create:deadline", self.text(uid, f"days {self.rnd.randint(1, 30)}"))
+            else:
+                await asyncio.sleep(0)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    k = max(0, min(len(values) - 1, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def copy_db(src: str, dst: str):
+    # через backup API — корректно и для базы в WAL с непустым -wal
+    with sqlite3.connect(src) as s, sqlite3.connect(dst) as d:
+        s.backup(d)
+
+
+async def run(args, path):
+    db.DB_FILE = path
+    db.init_db(ADMIN_TELEGRAM_ID)
+    await bot_main.WAIT.load()
+
+    fake, api_runner, url = await fake_telegram.start(latency_ms=args.api_latency_ms)
+    bot = Bot(os.environ["BOT_TOKEN"], session=AiohttpSession(api=TelegramAPIServer.from_base(url)))
+    dp = bot_main.build_dispatcher(bot)
+    sender.start(bot)
+    bot_main.register_jobs()
+    await outbox.start(on_parked=bot_main.report_push_failure,  # push о созданных задачах
+                       on_batch_done=bot_main.report_bulk_push)
+
+    bench = Bench(dp, bot, args.scenario, args.updates, args.seed)
+    bench.load()
+    employees = list(bench.tasks)
+    bench.rnd.shuffle(employees)
+    employees = employees[:args.concurrency] if any(s in EMPLOYEE_STEPS for s in bench.weights) else []
+    actors = [bench.employee(uid) for uid in employees]
+    if any(s in ADMIN_STEPS for s in bench.weights):
+        actors.append(bench.admin())
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*actors)
+    elapsed = time.perf_counter() - t0
+    await outbox.stop()
+    await sender.stop(timeout=30)
+    drained = time.perf_counter() - t0
+
+    diff = await repo.check_counters()
+    if args.metrics_out:
+        metrics.dump(args.metrics_out)
+    await bot.session.close()
+    await api_runner.cleanup()
+    repo.shutdown()
+
+    total = sum(len(v) for v in bench.latency.values())
+    print(f"{args.scenario}: {total} апдейтов за {elapsed:.2f}s — {total / elapsed:.0f} updates/s "
+          f"(очередь отправки разобрана за {drained:.2f}s), сотрудников {len(employees)}")
+    print(f"  {'шаг':16} {'n':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}  мс")
+    for step, values in sorted(bench.latency.items()):
+        print(f"  {step:16} {len(values):6} {percentile(values, 50):8.2f} {percentile(values, 95):8.2f} "
+              f"{percentile(values, 99):8.2f} {max(values):8.2f}")
+    print("  Bot API: " + " ".join(f"{m}={n}" for m, n in sorted(fake.calls.items())))
+    print("  счётчики задач: " + ("сходятся" if not diff else f"РАСХОЖДЕНИЯ {diff[:5]}"))
+    return 1 if diff else 0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    ap.add_argument("--updates", type=int, default=10_000)
+    ap.add_argument("--concurrency", type=int, default=50, help="сотрудников, нажимающих одновременно")
+    ap.add_argument("--db", help="готовая база (иначе генерируется --users/--tasks)")
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--tasks", type=int, default=20_000)
+    ap.add_argument("--api-latency-ms", type=float, default=0, help="задержка ответов фейкового Bot API")
+    ap.add_argument("--metrics-out", help="записать метрики прогона (формат Prometheus) в файл")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)  # строка на каждый апдейт
+    logging.getLogger("metrics").setLevel(logging.ERROR)  # медленные запросы и так видны в p99
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        if args.db:
+            copy_db(args.db, path)
+        else:
+            t0 = time.perf_counter()
+            generate_db.generate(path, args.users, args.tasks, seed=args.seed)
+            print(f"база: {args.users} сотрудников, {args.tasks} задач за {time.perf_counter() - t0:.1f}s")
+        rc = asyncio.run(run(args, path))
+    sys.exit(rc)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# bench/webhook_load.py
+"""
+Нагрузочный тест webhook-режима без Telegram: поднимает webhook.create_app на localhost
+с Dispatcher, который только считает обновления, и с заданной скоростью отправляет
+записанные update JSON (по одному на строку). Без --updates генерирует синтетические
+нажатия кнопок и текстовые сообщения от --users пользователей.
+
+Запуск из корня репозитория:
+    python bench/webhook_load.py --count 20000 --concurrency 200
+    python bench/webhook_load.py --updates recorded.jsonl --rate 2000
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.types import CallbackQuery, Message  # noqa: E402
+from aiohttp import ClientSession, web  # noqa: E402
+
+import webhook  # noqa: E402
+
+SECRET = "bench-secret"
+
+
+def synthetic_updates(n, users):
+    for i in range(n):
+        uid = 1000 + i % users
+        user = {"id": uid, "is_bot": False, "first_name": "u"}
+        chat = {"id": uid, "type": "private"}
+        if i % 3:
+            yield {"update_id": i, "callback_query": {
+                "id": str(i), "from": user, "chat_instance": "x", "data": "em:my",
+                "message": {"message_id": 1, "date": 0, "chat": chat, "text": "menu"}}}
+        else:
+            yield {"update_id": i, "message": {"message_id": i, "date": 0, "chat": chat, "from": user,
+                                               "text": "текст"}}
+
+
+def recorded_updates(path, n):
+    with open(path, encoding="utf-8") as f:
+        lines = [line for line in f if line.strip()]
+    for i, line in zip(range(n), itertools.cycle(lines)):
+        data = json.loads(line)
+        data["update_id"] = i
+        yield data
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--updates", help="файл с update JSON, по одному на строку")
+    ap.add_argument("--count", type=int, default=10000)
+    ap.add_argument("--users", type=int, default=500)
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--rate", type=float, default=0, help="update/s, 0 — без ограничения")
+    ap.add_argument("--port", type=int, default=18080)
+    ap.add_argument("--workers", type=int, default=8)
+    ap.add_argument("--queue-size", type=int, default=1000)
+    args = ap.parse_args()
+
+    handled = 0
+    done = asyncio.Event()
+
+    dp = Dispatcher()
+
+    @dp.message()
+    async def on_message(message: Message):
+        nonlocal handled
+        handled += 1
+        if handled >= args.count:
+            done.set()
+
+    @dp.callback_query()
+    async def on_callback(call: CallbackQuery):
+        nonlocal handled
+        handled += 1
+        if handled >= args.count:
+            done.set()
+
+    bot = Bot("123456:BENCH")
+    app = webhook.create_app(dp, bot, secret=SECRET, path="/webhook", workers=args.workers,
+                             queue_size=args.queue_size, url="")
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", args.port).start()
+
+    source = recorded_updates(args.updates, args.count) if args.updates else synthetic_updates(args.count, args.users)
+    payloads = [json.dumps(u).encode() for u in source]
+    url = f"http://127.0.0.1:{args.port}/webhook"
+    headers = {webhook.SECRET_HEADER: SECRET, "Content-Type": "application/json"}
+    latencies, statuses = [], {}
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async with ClientSession() as session:
+        async def post(i, body):
+            if args.rate:
+                await asyncio.sleep(max(0.0, t0 + i / args.rate - time.perf_counter()))
+            async with sem:
+                t = time.perf_counter()
+                async with session.post(url, data=body, headers=headers) as resp:
+                    statuses[resp.status] = statuses.get(resp.status, 0) + 1
+                latencies.append((time.perf_counter() - t) * 1000)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(post(i, body) for i, body in enumerate(payloads)))
+        accepted = time.perf_counter() - t0
+        try:
+            await asyncio.wait_for(done.wait(), 30)
+        except asyncio.TimeoutError:
+            pass
+        processed = time.perf_counter() - t0
+
+    await runner.cleanup()
+    await bot.session.close()
+
+    latencies.sort()
+    print(f"sent={len(payloads)} statuses={statuses} handled={handled}")
+    print(f"accept: {len(payloads) / accepted:8.0f} req/s   p50={statistics.median(latencies):.2f}ms "
+          f"p99={latencies[int(len(latencies) * 0.99) - 1]:.2f}ms")
+    print(f"end-to-end: {handled / processed:8.0f} updates/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
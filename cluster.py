@@ -0,0 +1,238 @@
+# cluster.py
+"""
+Несколько процессов-воркеров (WORKERS > 1), чтобы бот занимал больше одного ядра.
+
+- main.py запускает supervise(): он один раз выполняет миграции и поднимает WORKERS процессов
+  (и перезапускает упавшие);
+- каждый воркер — полноценный бот со своим Dispatcher; всё общее живёт в tasks.db:
+  задачи, состояние диалогов (FSM_STORAGE=sqlite обязательно), jobs планировщика;
+- апдейты принимает один процесс — лидер — и пишет их в таблицу updates с shard = from.id % WORKERS.
+  Воркер читает только свой shard по порядку id, а внутри раскладывает по полосам тоже по from.id,
+  поэтому шаги диалога одного пользователя обрабатываются строго по очереди;
+- лидер — тот, кто держит аренду строки leases (продлевает каждые LEADER_LEASE_SECONDS / 3).
+  Только лидер принимает апдейты (polling или webhook) и запускает единичные задачи (планировщик:
+  ежедневный отчёт, напоминания; уборка диалогов). Если лидер умер, аренда истекает и её берёт другой;
+  cursor аренды — последний принятый update_id, новый лидер продолжает getUpdates с него;
+- апдейт удаляется из updates после обработки: воркер, упавший посреди пачки, после перезапуска
+  обработает необработанное ещё раз (at-least-once, как и повторная доставка самим Telegram).
+"""
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import time
+
+from aiogram.types import Update
+
+import db
+import metrics
+import repo
+import webhook
+from config import (ADMIN_TELEGRAM_ID, BOT_MODE, FSM_STORAGE, LEADER_LEASE_SECONDS, WEBHOOK_WORKERS, WORKER_BATCH,
+                    WORKER_POLL_MS)
+
+log = logging.getLogger(__name__)
+
+LEADER_LEASE = "leader"
+POLL_TIMEOUT = 25  # секунд long polling у getUpdates
+RESTART_DELAY = 5  # не перезапускать упавший воркер чаще
+
+_inflight = set()  # id строк updates, взятых в работу и ещё не обработанных
+metrics.Gauge("bot_worker_inflight_updates", "Апдейты, взятые воркером из очереди и ещё не обработанные",
+              lambda: len(_inflight))
+
+
+# ---------- supervisor ----------
+
+def supervise(workers: int):
+    """
+    Запустить workers процессов и ждать; упавший процесс перезапускается. Ctrl+C — остановить всех.
+    """
+    if FSM_STORAGE != "sqlite":
+        raise RuntimeError("WORKERS > 1: состояние диалогов должно быть общим — FSM_STORAGE=sqlite")
+    db.init_db(ADMIN_TELEGRAM_ID)
+    with db.transaction() as conn:
+        moved = db.reshard_updates(conn, workers)
+    db.close_all()
+    if moved:
+        log.info("cluster: %d queued updates moved to new shards", moved)
+
+    ctx = multiprocessing.get_context("spawn")  # как на Windows: дочерний процесс не наследует loop и соединения
+    procs, started = {}, {}
+
+    def spawn(worker: int):
+        p = ctx.Process(target=_worker_process, args=(worker,), name=f"worker-{worker}")
+        p.start()
+        procs[worker], started[worker] = p, time.monotonic()
+
+    for i in range(workers):
+        spawn(i)
+    print(f"Бот запущен: {workers} процессов. PowerShell не закрывать.")
+    try:
+        while True:
+            time.sleep(1)
+            for i, p in procs.items():
+                if not p.is_alive() and time.monotonic() - started[i] >= RESTART_DELAY:
+                    log.warning("cluster: worker %d exited with code %s, restarting", i, p.exitcode)
+                    spawn(i)
+    except KeyboardInterrupt:
+        # Ctrl+C получают и воркеры: они сами освобождают аренду и дорабатывают очередь отправки
+        for p in procs.values():
+            p.join(15)
+        for p in procs.values():
+            if p.is_alive():
+                p.terminate()
+
+
+def _worker_process(worker: int):
+    import main  # main импортирует cluster, поэтому здесь — уже в дочернем процессе
+
+    try:
+        asyncio.run(main.main(worker))
+    except KeyboardInterrupt:
+        pass
+
+
+# ---------- worker ----------
+
+def shard_of(user_id: int, workers: int) -> int:
+    return user_id % workers
+
+
+async def run(dp, bot, worker: int, workers: int, start_jobs):
+    """
+    Обрабатывать свой shard и бороться за лидерство до отмены.
+    start_jobs() — запустить единичные задачи лидера, возвращает async-функцию их остановки.
+    """
+    holder = f"{socket.gethostname()}:{os.getpid()}:{worker}"
+    consumer = asyncio.create_task(consume(dp, bot, worker, workers))
+    try:
+        await _lead(dp, bot, holder, workers, start_jobs)
+    finally:
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        try:
+            await repo.write(db.release_lease, LEADER_LEASE, holder)
+        except Exception:
+            log.exception("cluster: lease release failed")
+
+
+async def consume(dp, bot, shard: int, workers: int, lanes: int = WEBHOOK_WORKERS):
+    lanes = max(1, lanes)
+    queues = [asyncio.Queue(maxsize=max(1, WORKER_BATCH // lanes)) for _ in range(lanes)]
+    tasks = [asyncio.create_task(_lane(dp, bot, q)) for q in queues]
+    last = deleted = 0
+    try:
+        while True:
+            done = min(_inflight) - 1 if _inflight else last
+            if done > deleted:
+                await repo.write(db.delete_updates, shard, done)
+                deleted = done
+            rows = await repo.read(db.next_updates, shard, last, WORKER_BATCH)
+            if not rows:
+                await asyncio.sleep(WORKER_POLL_MS / 1000)
+                continue
+            for r in rows:
+                data = json.loads(r["data"])
+                _inflight.add(r["id"])
+                # в shard только from.id с одним остатком от деления на workers — полосу выбираем по частному
+                await queues[webhook.update_user_id(data) // workers % lanes].put((r["id"], data))
+            last = rows[-1]["id"]
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _lane(dp, bot, queue: asyncio.Queue):
+    while True:
+        row_id, data = await queue.get()
+        try:
+            await dp.feed_update(bot, Update.model_validate(data, context={"bot": bot}))
+        except Exception:
+            log.exception("update %s failed", data.get("update_id"))
+        finally:
+            _inflight.discard(row_id)
+
+
+# ---------- leader ----------
+
+async def _lead(dp, bot, holder: str, workers: int, start_jobs):
+    stop_duties, renewed = None, float("-inf")
+    try:
+        while True:
+            now = time.monotonic()
+            cursor = None
+            try:
+                cursor = await repo.write(db.acquire_lease, LEADER_LEASE, holder, LEADER_LEASE_SECONDS)
+                # None — аренду держит другой, значит наша уже истекла
+                renewed = now if cursor is not None else float("-inf")
+            except Exception:
+                log.exception("cluster: lease renewal failed")
+            # считаем от начала запроса: в БД аренда истечёт не раньше
+            held = time.monotonic() - renewed < LEADER_LEASE_SECONDS
+            if held and cursor is not None and stop_duties is None:
+                log.info("cluster: %s is the leader now", holder)
+                stop_duties = await _start_duties(dp, bot, holder, workers, cursor, start_jobs)
+            elif not held and stop_duties is not None:
+                log.warning("cluster: %s lost the lease, stopping leader duties", holder)
+                await stop_duties()
+                stop_duties = None
+            await asyncio.sleep(LEADER_LEASE_SECONDS / 3)
+    finally:
+        if stop_duties is not None:
+            await stop_duties()
+
+
+async def _start_duties(dp, bot, holder: str, workers: int, cursor: int, start_jobs):
+    stop_jobs = await start_jobs()
+
+    async def sink(data: dict) -> bool:
+        user_id = webhook.update_user_id(data)
+        row = (shard_of(user_id, workers), user_id, json.dumps(data, ensure_ascii=False))
+        return await repo.write(db.enqueue_updates, [row], LEADER_LEASE, holder, int(data.get("update_id", 0)))
+
+    if BOT_MODE == "webhook":
+        ingress = asyncio.create_task(webhook.run(dp, bot, sink=sink))
+    else:
+        ingress = asyncio.create_task(_poll(dp, bot, holder, workers, cursor))
+
+    async def stop():
+        ingress.cancel()
+        await asyncio.gather(ingress, return_exceptions=True)
+        await stop_jobs()
+
+    return stop
+
+
+async def _poll(dp, bot, holder: str, workers: int, cursor: int):
+    """
+    getUpdates -> таблица updates. Offset подтверждается Telegram только после записи в БД.
+    """
+    offset = cursor + 1 if cursor else None
+    allowed = dp.resolve_used_update_types()
+    request_timeout = int((bot.session.timeout or 0) + POLL_TIMEOUT)
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed,
+                                            request_timeout=request_timeout)
+        except Exception as e:
+            log.warning("cluster: getUpdates failed: %s: %s", type(e).__name__, e)
+            await asyncio.sleep(5)
+            continue
+        if not updates:
+            continue
+        rows = []
+        for u in updates:
+            data = u.model_dump(mode="json", by_alias=True, exclude_unset=True)
+            user_id = webhook.update_user_id(data)
+            rows.append((shard_of(user_id, workers), user_id, json.dumps(data, ensure_ascii=False)))
+        last = updates[-1].update_id
+        if not await repo.write(db.enqueue_updates, rows, LEADER_LEASE, holder, last):
+            # аренда истекла: offset не сдвигаем — эти апдейты получит тот, кто будет лидером
+            log.warning("cluster: lease lost, %d updates not accepted", len(rows))
+            await asyncio.sleep(LEADER_LEASE_SECONDS / 3)
+            continue
+        offset = last + 1
@@ -6,3 +6,103 @@ load_dotenv()
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "").strip()
 ADMIN_TELEGRAM_ID = int(os.getenv("ADMIN_TELEGRAM_ID", "0"))
+# свой Bot API сервер (telegram-bot-api --local) или фейк из bench/fake_telegram.py; пусто — api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").strip().rstrip("/")
+
+# очередь запросов к БД: сколько обращений может ждать DB-поток, прежде чем хендлеры начнут ждать
+DB_QUEUE_SIZE = int(os.getenv("DB_QUEUE_SIZE", "64"))
+
+# часовой пояс для сроков задач (IANA, напр. Europe/Moscow; на Windows нужен пакет tzdata); пусто — пояс системы
+TIMEZONE = os.getenv("TIMEZONE", "").strip()
+
+# SQLite: файл и настройки соединений
+DB_FILE = os.getenv("DB_FILE", "tasks.db")
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+DB_MMAP_SIZE_MB = int(os.getenv("DB_MMAP_SIZE_MB", "128"))
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL").strip().upper()
+DB_STATEMENT_CACHE = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+
+# исходящие сообщения (sender.py): лимиты Telegram — ~30 msg/s всего и ~1 msg/s в один чат
+SEND_WORKERS = int(os.getenv("SEND_WORKERS", "4"))
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", "25"))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", "1"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "5"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+SEND_FANOUT_LIMIT = int(os.getenv("SEND_FANOUT_LIMIT", "10"))  # одновременных отправок в массовой рассылке
+
+# уведомления админу (digest.py): события одной категории копятся столько секунд и уходят одной сводкой
+# (0 — каждое сразу); срочные категории (через запятую: review, users, push, overdue) — всегда сразу
+ADMIN_DIGEST_SECONDS = float(os.getenv("ADMIN_DIGEST_SECONDS", "60"))
+ADMIN_DIGEST_URGENT = tuple(x.strip() for x in os.getenv("ADMIN_DIGEST_URGENT", "overdue").split(",") if x.strip())
+
+# задач на одной странице списка
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "10"))
+# карточка задачи: сколько последних комментариев, файлов и записей журнала показывать сразу
+TASK_DETAIL_ITEMS = int(os.getenv("TASK_DETAIL_ITEMS", "5"))
+# сводка админа (просроченные и на проверке): сколько секунд отдавать её из кэша, если задачи не менялись
+DASHBOARD_TTL_SECONDS = float(os.getenv("DASHBOARD_TTL_SECONDS", "60"))
+# клавиатуры и тексты задач (render.py): сколько готовых держать в памяти на каждый вид
+RENDER_CACHE_SIZE = int(os.getenv("RENDER_CACHE_SIZE", "2048"))
+
+# состояние диалогов (state.py): sqlite — переживает перезапуск, memory — как раньше, только в памяти
+FSM_STORAGE = os.getenv("FSM_STORAGE", "sqlite").strip().lower()
+FSM_TTL_HOURS = float(os.getenv("FSM_TTL_HOURS", "24"))
+FSM_SWEEP_MINUTES = float(os.getenv("FSM_SWEEP_MINUTES", "30"))
+
+# режим получения обновлений: polling (по умолчанию) или webhook (webhook.py)
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").strip()  # публичный https-адрес; пусто — setWebhook не вызываем
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "8"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+WEBHOOK_ENQUEUE_TIMEOUT = float(os.getenv("WEBHOOK_ENQUEUE_TIMEOUT", "2"))
+
+# несколько процессов (cluster.py): WORKERS > 1 — main.py запускает столько воркеров. Апдейты идут
+# через таблицу updates (воркер — по from.id), приём апдейтов и планировщик — у лидера (аренда в leases)
+WORKERS = int(os.getenv("WORKERS", "1"))
+WORKER_POLL_MS = float(os.getenv("WORKER_POLL_MS", "50"))  # как часто воркер проверяет свою очередь
+WORKER_BATCH = int(os.getenv("WORKER_BATCH", "100"))
+LEADER_LEASE_SECONDS = float(os.getenv("LEADER_LEASE_SECONDS", "15"))
+JOBS_POLL_SECONDS = float(os.getenv("JOBS_POLL_SECONDS", "30"))  # задачи планировщика от других воркеров
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))  # изменения из других воркеров
+
+# кэш пользователей в памяти (repo.py): сколько записей держать
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "2048"))
+
+# импорт из CSV/JSONL (importer.py): строк в одной транзакции и предельный размер файла
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_MAX_MB = int(os.getenv("IMPORT_MAX_MB", "20"))
+
+# планировщик (scheduler.py): ежедневный отчёт (cron: мин час день месяц день_недели) и напоминания о сроках
+DAILY_REPORT_CRON = os.getenv("DAILY_REPORT_CRON", "0 9 * * *")
+COUNTERS_CHECK_CRON = os.getenv("COUNTERS_CHECK_CRON", "30 3 * * *")  # сверка счётчиков задач
+REMIND_BEFORE_HOURS = tuple(int(x) for x in os.getenv("REMIND_BEFORE_HOURS", "24,1").split(",") if x.strip())
+
+# архив (archive.py): закрытые задачи, не менявшиеся ARCHIVE_AFTER_DAYS дней, с комментариями, файлами и журналом
+# переносятся в помесячные файлы ARCHIVE_DIR/tasks-ГГГГ-ММ.db (0 — не архивировать)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_CRON = os.getenv("ARCHIVE_CRON", "0 4 * * *")
+ARCHIVE_BATCH = int(os.getenv("ARCHIVE_BATCH", "500"))  # задач в одной транзакции
+
+# уведомления сотрудникам о задачах (outbox.py): неудачная отправка повторяется через
+# OUTBOX_RETRY_BASE_SECONDS * 2^попытка (не реже OUTBOX_RETRY_MAX_SECONDS), после OUTBOX_MAX_ATTEMPTS —
+# ждёт /start сотрудника; OUTBOX_POLL_SECONDS — как часто лидер смотрит outbox при WORKERS > 1
+OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "30"))
+OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "3600"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BATCH = int(os.getenv("OUTBOX_BATCH", "100"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+
+# метрики (metrics.py): /metrics в формате Prometheus на METRICS_HOST:METRICS_PORT (0 — не поднимать)
+# и/или запись того же текста в файл раз в METRICS_DUMP_SECONDS (пусто — не писать)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1").strip()
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_DUMP_FILE = os.getenv("METRICS_DUMP_FILE", "").strip()
+METRICS_DUMP_SECONDS = float(os.getenv("METRICS_DUMP_SECONDS", "60"))
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))  # медленные SQL-запросы — в лог
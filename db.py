@@ -1,29 +1,268 @@
+import json
+import logging
+import queue
+import re
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
+from pathlib import Path
+from zoneinfo import ZoneInfo
 
-DB_FILE = "tasks.db"
+import config
+import metrics
 
-STATUS_NEW = "Новая"
-STATUS_IN_PROGRESS = "В процессе"
-STATUS_ON_REVIEW = "На проверке"
-STATUS_DONE = "Готово"
-STATUS_CANCELED = "Отменено"
+DB_FILE = config.DB_FILE
+
+log = logging.getLogger(__name__)
+
+# статусы задач хранятся кодами, названия — только для показа
+STATUS_NEW = 1
+STATUS_IN_PROGRESS = 2
+STATUS_ON_REVIEW = 3
+STATUS_DONE = 4
+STATUS_CANCELED = 5
+
+STATUS_TITLES = {
+    STATUS_NEW: "Новая",
+    STATUS_IN_PROGRESS: "В процессе",
+    STATUS_ON_REVIEW: "На проверке",
+    STATUS_DONE: "Готово",
+    STATUS_CANCELED: "Отменено",
+}
 
 ACTIVE_STATUSES = (STATUS_NEW, STATUS_IN_PROGRESS, STATUS_ON_REVIEW)
+ALL_STATUSES = (STATUS_NEW, STATUS_IN_PROGRESS, STATUS_ON_REVIEW, STATUS_DONE, STATUS_CANCELED)
+
+DEPARTMENTS = ("Снабжение", "Финансы", "Бухгалтерия")
+
+# сроки и created_at/updated_at задач — unix-время (сек); показываются в часовом поясе TZ
+TZ = ZoneInfo(config.TIMEZONE) if config.TIMEZONE else None  # None — локальный пояс системы
+
+
+def status_title(status: int) -> str:
+    return STATUS_TITLES.get(status, str(status))
 
 
 def now_iso():
-    return datetime.now().isoformat(timespec="seconds")
+    return datetime.now(TZ).replace(tzinfo=None).isoformat(timespec="seconds")
 
 
-def get_conn():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+def now_ts() -> int:
+    return int(time.time())
+
+
+def now_local() -> datetime:
+    return datetime.now(TZ).astimezone(TZ)
+
+
+def to_ts(dt: datetime) -> int:
+    """
+    datetime -> unix-время; время без пояса считается временем в TZ.
+    """
+    if dt.tzinfo is None and TZ is not None:
+        dt = dt.replace(tzinfo=TZ)
+    return int(dt.timestamp())
+
+
+def from_ts(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts, TZ).astimezone(TZ)
+
+
+def fmt_ts(ts: int) -> str:
+    return from_ts(ts).strftime("%Y-%m-%d %H:%M")
+
+
+def status_in(statuses) -> str:
+    """
+    Условие по статусам литералами, а не параметрами: иначе SQLite не может
+    применить частичные индексы (WHERE status IN (...)). Только константы из кода.
+    """
+    for st in statuses:
+        if st not in ALL_STATUSES:
+            raise ValueError(f"unknown status: {st!r}")
+    return "status IN (" + ",".join(str(int(st)) for st in statuses) + ")"
+
+
+def _legacy_status_in(statuses) -> str:
+    # условие для схемы до миграции 6, где статус хранился текстом
+    return "status IN (" + ",".join(f"'{STATUS_TITLES[st]}'" for st in statuses) + ")"
+
+
+# ---------- connections ----------
+# Одно долгоживущее соединение на запись + пул read-only соединений.
+# WAL: читатели не блокируются писателем, писатель не ждёт читателей.
+
+_writer = None
+_writer_lock = threading.Lock()
+_readers = None  # queue.Queue[sqlite3.Connection]
+_readers_lock = threading.Lock()
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Курсор, который отдаёт время каждого запроса в metrics (медленные — ещё и в лог).
+    """
+
+    def execute(self, sql, parameters=()):
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq_of_parameters):
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            metrics.observe_query(sql, time.perf_counter() - t0)
+
+
+class TimedConnection(sqlite3.Connection):
+    # conn.execute() в C-реализации создаёт обычный курсор — поэтому переопределены и они
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        t0 = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            metrics.observe_query("COMMIT", time.perf_counter() - t0)
+
+    def rollback(self):
+        t0 = time.perf_counter()
+        try:
+            super().rollback()
+        finally:
+            metrics.observe_query("ROLLBACK", time.perf_counter() - t0)
+
+
+def _connect(readonly: bool = False):
+    if readonly:
+        uri = Path(DB_FILE).absolute().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               timeout=config.DB_BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=config.DB_STATEMENT_CACHE, factory=TimedConnection)
+    else:
+        conn = sqlite3.connect(DB_FILE, check_same_thread=False,
+                               timeout=config.DB_BUSY_TIMEOUT_MS / 1000,
+                               cached_statements=config.DB_STATEMENT_CACHE, factory=TimedConnection)
     conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout={config.DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{config.DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size={config.DB_MMAP_SIZE_MB * 1024 * 1024}")
+    if not readonly:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={config.DB_SYNCHRONOUS}")
+        conn.execute("PRAGMA temp_store=MEMORY")
     return conn
 
 
+def get_conn():
+    """
+    Отдельное соединение на запись (скрипты, миграции). Хендлеры используют writer()/reader().
+    """
+    return _connect()
+
+
+def get_readonly_conn():
+    """
+    Отдельное read-only соединение для долгих чтений (выгрузки), чтобы не занимать пул reader().
+    """
+    return _connect(readonly=True)
+
+
+@contextmanager
+def writer():
+    """
+    Общее соединение на запись. Одновременно пишет только один поток;
+    при ошибке незакоммиченные изменения откатываются.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = _connect()
+        try:
+            yield _writer
+        except BaseException:
+            _writer.rollback()
+            raise
+
+
+@contextmanager
+def transaction():
+    """
+    Unit of work: всё, что записано внутри (изменение + его audit), коммитится одним COMMIT
+    или откатывается целиком. Функции записи ниже сами не коммитят.
+    """
+    with writer() as conn:
+        yield conn
+        conn.commit()
+
+
+@contextmanager
+def reader():
+    """
+    Соединение из read-only пула. Если все заняты — ждём освобождения.
+    """
+    global _readers
+    if _readers is None:
+        with _readers_lock:
+            if _readers is None:
+                pool = queue.Queue()
+                for _ in range(max(1, config.DB_READ_POOL_SIZE)):
+                    pool.put(_connect(readonly=True))
+                _readers = pool
+    conn = _readers.get()
+    try:
+        yield conn
+    finally:
+        _readers.put(conn)
+
+
+def close_all():
+    global _writer, _readers
+    with _writer_lock:
+        if _writer is not None:
+            _writer.execute("PRAGMA optimize")
+            _writer.close()
+            _writer = None
+    with _readers_lock:
+        if _readers is not None:
+            while not _readers.empty():
+                _readers.get_nowait().close()
+            _readers = None
+
+
 def init_db(admin_id: int):
-    conn = get_conn()
+    with writer() as conn:
+        migrate(conn)
+
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT telegram_id FROM users WHERE telegram_id=?", (admin_id,))
+        if not cur.fetchone():
+            cur.execute(
+                "INSERT INTO users(telegram_id, full_name, department, role, is_active) VALUES (?,?,?,?,1)",
+                (admin_id, "Админ", "Администрация", "admin"),
+            )
+
+
+# ---------- migrations ----------
+# Версия схемы хранится в PRAGMA user_version. Каждая миграция выполняется
+# в своей транзакции вместе с повышением версии; новые — только дописывать в конец MIGRATIONS.
+
+def _m001_base_schema(conn):
     cur = conn.cursor()
 
     cur.execute("""
@@ -36,11 +275,10 @@ def init_db(admin_id: int):
     )
     """)
 
-    # миграция для старых баз: добавить is_active, если нет
-    try:
+    # старые базы: users без is_active
+    cols = [r["name"] for r in cur.execute("PRAGMA table_info(users)")]
+    if "is_active" not in cols:
         cur.execute("ALTER TABLE users ADD COLUMN is_active INTEGER NOT NULL DEFAULT 1")
-    except sqlite3.OperationalError:
-        pass
 
     cur.execute("""
     CREATE TABLE IF NOT EXISTS tasks (
@@ -88,21 +326,1369 @@ def init_db(admin_id: int):
     )
     """)
 
-    cur.execute("SELECT telegram_id FROM users WHERE telegram_id=?", (admin_id,))
-    if not cur.fetchone():
-        cur.execute(
-            "INSERT INTO users(telegram_id, full_name, department, role, is_active) VALUES (?,?,?,?,1)",
-            (admin_id, "Админ", "Администрация", "admin"),
-        )
 
+def _m002_indexes(conn):
+    active = _legacy_status_in(ACTIVE_STATUSES)
+    cur = conn.cursor()
+    # активные задачи: админские списки / просроченные / отчёт
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_active_deadline ON tasks(deadline, id) WHERE {active}")
+    # активные задачи сотрудника
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_active_owner ON tasks(owner_telegram_id, deadline, id) WHERE {active}")
+    # списки по одному статусу (на проверке / готово) и счётчики
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_deadline ON tasks(status, deadline, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_updated ON tasks(status, updated_at, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_tasks_owner_status ON tasks(owner_telegram_id, status, updated_at, id)")
+    # история по задаче
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_comments_task ON comments(task_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_files_task ON files(task_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_audit_task ON audit(task_id, id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role, is_active, department, full_name)")
+
+
+def _m003_fsm_state(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_state (
+        telegram_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at INTEGER NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state(updated_at)")
+
+
+def _m004_jobs(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL UNIQUE,
+        kind TEXT NOT NULL,
+        fire_at INTEGER NOT NULL,
+        cron TEXT,
+        payload TEXT
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_fire_at ON jobs(fire_at)")
+    # напоминания для уже существующих активных задач — SQL как на этой версии схемы (срок — ISO-строкой),
+    # а не schedule_task_reminders: та пишет по текущей схеме jobs
+    now = time.time()
+    jobs = []
+    for r in conn.execute(
+        f"SELECT id, deadline FROM tasks WHERE {_legacy_status_in((STATUS_NEW, STATUS_IN_PROGRESS))}"
+    ):
+        deadline = to_ts(datetime.fromisoformat(r["deadline"]))
+        for hours in config.REMIND_BEFORE_HOURS + (0,):
+            fire_at = deadline - hours * 3600
+            if hours == 0 or fire_at > now:
+                jobs.append((f"remind:{r['id']}:{hours}h", "task_reminder", fire_at,
+                             json.dumps({"task_id": r["id"], "hours": hours})))
+    conn.executemany("INSERT OR REPLACE INTO jobs(key, kind, fire_at, payload) VALUES (?,?,?,?)", jobs)
+
+
+def _create_task_counters(conn, status_type: str):
+    # число задач по (сотрудник, отдел, статус); поддерживается триггерами на tasks
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS task_counters (
+        owner_telegram_id INTEGER NOT NULL,
+        department TEXT NOT NULL,
+        status {status_type} NOT NULL,
+        n INTEGER NOT NULL,
+        PRIMARY KEY (owner_telegram_id, department, status)
+    ) WITHOUT ROWID
+    """)
+    inc = """
+        INSERT INTO task_counters(owner_telegram_id, department, status, n)
+        VALUES (NEW.owner_telegram_id, NEW.department, NEW.status, 1)
+        ON CONFLICT(owner_telegram_id, department, status) DO UPDATE SET n = n + 1;
+    """
+    dec = """
+        UPDATE task_counters SET n = n - 1
+        WHERE owner_telegram_id=OLD.owner_telegram_id AND department=OLD.department AND status=OLD.status;
+    """
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_tasks_count_ins AFTER INSERT ON tasks BEGIN {inc} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS trg_tasks_count_del AFTER DELETE ON tasks BEGIN {dec} END")
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_count_upd
+    AFTER UPDATE OF status, owner_telegram_id, department ON tasks
+    WHEN OLD.status IS NOT NEW.status OR OLD.owner_telegram_id IS NOT NEW.owner_telegram_id
+      OR OLD.department IS NOT NEW.department
+    BEGIN {dec} {inc} END
+    """)
+
+
+def _m005_task_counters(conn):
+    _create_task_counters(conn, "TEXT")
+    # на этой версии задачи есть только в tasks (archived_tasks — миграция 10)
+    conn.execute("DELETE FROM task_counters")
+    conn.execute(
+        "INSERT INTO task_counters(owner_telegram_id, department, status, n) "
+        "SELECT owner_telegram_id, department, status, COUNT(*) FROM tasks "
+        "GROUP BY owner_telegram_id, department, status"
+    )
+
+
+# Миграция 6: статус — код (INTEGER), сроки и отметки времени — unix-время.
+# Таблица пересобирается "онлайн": строки копируются в tasks_v2 (сразу с индексами) пачками
+# в отдельных коротких транзакциях — старая tasks всё это время доступна и на чтение, и на запись;
+# изменения уже скопированных строк отмечаются триггерами в tasks_v2_dirty. Прерванное копирование
+# продолжается с места остановки. В конце — одна короткая транзакция: докопировать хвост
+# и отмеченные строки, подменить таблицу, перекодировать счётчики.
+# Индексы SQLite не переименовать, поэтому у индексов новой таблицы суффикс _v2.
+
+TASKS_V2_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks_v2 (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    deadline INTEGER NOT NULL,
+    owner_telegram_id INTEGER NOT NULL,
+    department TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    updated_at INTEGER NOT NULL
+)
+"""
+
+_LEGACY_STATUS_CODES = {title: code for code, title in STATUS_TITLES.items()}
+
+
+def _legacy_task(r):
+    status = r["status"]
+    if not isinstance(status, int):
+        if status not in _LEGACY_STATUS_CODES:
+            raise ValueError(f"task #{r['id']}: unknown status {status!r}")
+        status = _LEGACY_STATUS_CODES[status]
+
+    def ts(v):
+        return v if isinstance(v, int) else to_ts(datetime.fromisoformat(v))
+
+    return (r["id"], r["title"], r["description"], status, ts(r["deadline"]), r["owner_telegram_id"],
+            r["department"], ts(r["created_at"]), ts(r["updated_at"]))
+
+
+def _copy_tasks_v2(conn, rows):
+    conn.executemany("INSERT OR REPLACE INTO tasks_v2 VALUES (?,?,?,?,?,?,?,?,?)", [_legacy_task(r) for r in rows])
+
+
+def _m006_prepare(conn, batch: int = 5000):
+    active = status_in(ACTIVE_STATUSES)
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(TASKS_V2_SCHEMA)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_active_deadline_v2 ON tasks_v2(deadline, id) WHERE {active}")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_tasks_active_owner_v2 ON tasks_v2(owner_telegram_id, deadline, id) "
+                 f"WHERE {active}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_deadline_v2 ON tasks_v2(status, deadline, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_status_updated_v2 ON tasks_v2(status, updated_at, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_owner_status_v2 "
+                 "ON tasks_v2(owner_telegram_id, status, updated_at, id)")
+    conn.execute("CREATE TABLE IF NOT EXISTS tasks_v2_dirty (id INTEGER PRIMARY KEY)")
+    for event in ("UPDATE", "DELETE"):
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_tasks_v2_dirty_{event.lower()} AFTER {event} ON tasks "
+            f"BEGIN INSERT OR IGNORE INTO tasks_v2_dirty(id) VALUES (OLD.id); END"
+        )
     conn.commit()
-    conn.close()
+
+    copied = 0
+    while True:
+        with conn:
+            last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tasks_v2").fetchone()[0]
+            rows = conn.execute("SELECT * FROM tasks WHERE id > ? ORDER BY id LIMIT ?", (last, batch)).fetchall()
+            _copy_tasks_v2(conn, rows)
+        copied += len(rows)
+        if len(rows) < batch:
+            break
+        log.info("migration 6: copied %d tasks", copied)
+
+
+def _m006_compact_tasks(conn):
+    # хвост, появившийся после копирования, и изменённые за это время строки
+    last = conn.execute("SELECT COALESCE(MAX(id), 0) FROM tasks_v2").fetchone()[0]
+    _copy_tasks_v2(conn, conn.execute("SELECT * FROM tasks WHERE id > ?", (last,)).fetchall())
+    conn.execute("DELETE FROM tasks_v2 WHERE id IN (SELECT id FROM tasks_v2_dirty)")
+    _copy_tasks_v2(conn, conn.execute("SELECT * FROM tasks WHERE id IN (SELECT id FROM tasks_v2_dirty)").fetchall())
+    conn.execute("DROP TABLE tasks_v2_dirty")
+
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='tasks'").fetchone()
+    conn.execute("DROP TABLE tasks")  # вместе с индексами и триггерами старой схемы
+    conn.execute("ALTER TABLE tasks_v2 RENAME TO tasks")
+    if seq:
+        conn.execute("UPDATE sqlite_sequence SET seq=max(seq, ?) WHERE name='tasks'", (seq[0],))
+
+    # счётчики актуальны (их вели триггеры старой таблицы) — только перекодировать статус
+    conn.execute("ALTER TABLE task_counters RENAME TO task_counters_legacy")
+    _create_task_counters(conn, "INTEGER")
+    codes = " ".join(f"WHEN '{title}' THEN {code}" for code, title in STATUS_TITLES.items())
+    conn.execute(
+        f"INSERT INTO task_counters(owner_telegram_id, department, status, n) "
+        f"SELECT owner_telegram_id, department, CASE status {codes} END, n FROM task_counters_legacy WHERE n != 0"
+    )
+    conn.execute("DROP TABLE task_counters_legacy")
+
+
+# Миграция 7: полнотекстовый поиск (/find). Одна строка task_search на задачу (rowid = id задачи):
+# название, описание и все комментарии через перевод строки; ведётся триггерами на tasks и comments.
+# Существующие задачи индексируются пачками вне общей транзакции (как копирование в миграции 6):
+# триггеры создаются первыми, поэтому новые задачи и комментарии попадают в индекс сами,
+# а пачки добирают только задачи, которых в индексе ещё нет.
+
+def _fold_sql(expr: str) -> str:
+    # unicode61 приводит кириллицу к нижнему регистру, но ё и е для него разные буквы
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def _create_task_search(conn):
+    conn.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS task_search USING fts5(
+        title, description, comments,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """)
+    weights = ", ".join(str(w) for w in SEARCH_WEIGHTS)
+    conn.execute(f"INSERT INTO task_search(task_search, rank) VALUES ('rank', 'bm25({weights})')")
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_search_ins AFTER INSERT ON tasks BEGIN
+        INSERT INTO task_search(rowid, title, description, comments)
+        VALUES (NEW.id, {_fold_sql("NEW.title")}, {_fold_sql("NEW.description")}, '');
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_search_upd AFTER UPDATE OF title, description ON tasks BEGIN
+        UPDATE task_search SET title = {_fold_sql("NEW.title")}, description = {_fold_sql("NEW.description")}
+        WHERE rowid = NEW.id;
+    END
+    """)
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_tasks_search_del AFTER DELETE ON tasks BEGIN
+        DELETE FROM task_search WHERE rowid = OLD.id;
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_comments_search_ins AFTER INSERT ON comments BEGIN
+        UPDATE task_search SET comments = comments || char(10) || {_fold_sql("NEW.text")}
+        WHERE rowid = NEW.task_id;
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_comments_search_del AFTER DELETE ON comments BEGIN
+        UPDATE task_search
+        SET comments = (SELECT COALESCE(group_concat({_fold_sql("text")}, char(10)), '')
+                        FROM comments WHERE task_id = OLD.task_id)
+        WHERE rowid = OLD.task_id;
+    END
+    """)
+
+
+def _m007_prepare(conn, batch: int = 5000):
+    with conn:
+        _create_task_search(conn)
+
+    fill = (
+        f"INSERT INTO task_search(rowid, title, description, comments) "
+        f"SELECT t.id, {_fold_sql('t.title')}, {_fold_sql('t.description')}, "
+        f"(SELECT COALESCE(group_concat({_fold_sql('c.text')}, char(10)), '') FROM comments c WHERE c.task_id = t.id) "
+        f"FROM tasks t WHERE t.id > ? AND t.id <= ? AND NOT EXISTS (SELECT 1 FROM task_search s WHERE s.rowid = t.id)"
+    )
+    last, indexed = 0, 0
+    while True:
+        with conn:
+            hi = conn.execute("SELECT id FROM tasks WHERE id > ? ORDER BY id LIMIT 1 OFFSET ?",
+                              (last, batch - 1)).fetchone()
+            hi = hi[0] if hi else conn.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0]
+            indexed += conn.execute(fill, (last, hi)).rowcount
+        if hi <= last:
+            break
+        last = hi
+        log.info("migration 7: indexed %d tasks", indexed)
+
+
+def _m007_task_search(conn):
+    # индекс заполнен в _m007_prepare, дальше его ведут триггеры — остаётся только поднять версию
+    pass
+
+
+def _m008_file_kind(conn):
+    # фото и документы нельзя смешивать в одной медиагруппе — нужен тип файла.
+    # Раньше фото сохранялись с именем photo.jpg (см. file_flow)
+    conn.execute("ALTER TABLE files ADD COLUMN kind TEXT NOT NULL DEFAULT 'document'")
+    conn.execute("UPDATE files SET kind='photo' WHERE file_name='photo.jpg'")
+
+
+def _m009_cluster(conn):
+    # режим WORKERS > 1 (cluster.py): очередь апдейтов по воркерам и аренда лидера.
+    # AUTOINCREMENT — id не переиспользуются после удаления, на них держится курсор воркера
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS updates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        shard INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        data TEXT NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_updates_shard ON updates(shard, id)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS leases (
+        name TEXT PRIMARY KEY,
+        holder TEXT NOT NULL,
+        expires_at REAL NOT NULL,
+        cursor INTEGER NOT NULL DEFAULT 0
+    )
+    """)
+
+
+def _m010_prepare(conn):
+    # auto_vacuum=INCREMENTAL — чтобы место от перенесённых в архив строк возвращалось файлу
+    # (PRAGMA incremental_vacuum после архивации). На существующей базе режим меняет только VACUUM
+    # целиком: один раз, вне транзакции, на время — как размер базы
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def _m010_archive(conn):
+    # задачи, перенесённые в архив (archive.py): в каком файле искать и кого считать в task_counters
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS archived_tasks (
+        task_id INTEGER PRIMARY KEY,
+        month TEXT NOT NULL,
+        owner_telegram_id INTEGER NOT NULL,
+        department TEXT NOT NULL,
+        status INTEGER NOT NULL
+    )
+    """)
+
+
+def _m011_outbox(conn):
+    # уведомления сотрудникам (outbox.py): пишутся в той же транзакции, что и задача, доставляются фоновым циклом.
+    # next_at NULL — отложено до /start сотрудника (бот заблокирован или попытки кончились)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        kind TEXT NOT NULL,
+        dedupe_key TEXT NOT NULL UNIQUE,
+        payload TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_at INTEGER,
+        last_error TEXT,
+        created_at INTEGER NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_next ON outbox(next_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_chat ON outbox(chat_id)")
+
+
+def _m012_outbox_batches(conn):
+    # рассылка по массово созданным задачам: строки outbox помечены batch, по её завершении —
+    # одна сводка "доставлено N / не доставлено M" тому, кто создавал (chat_id)
+    conn.execute("ALTER TABLE outbox ADD COLUMN batch TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_batch ON outbox(batch, next_at)")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS outbox_batches (
+        batch TEXT PRIMARY KEY,
+        chat_id INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        created_at INTEGER NOT NULL
+    )
+    """)
+
+
+MIGRATIONS = [
+    (1, _m001_base_schema),
+    (2, _m002_indexes),
+    (3, _m003_fsm_state),
+    (4, _m004_jobs),
+    (5, _m005_task_counters),
+    (6, _m006_compact_tasks, _m006_prepare),
+    (7, _m007_task_search, _m007_prepare),
+    (8, _m008_file_kind),
+    (9, _m009_cluster),
+    (10, _m010_archive, _m010_prepare),
+    (11, _m011_outbox),
+    (12, _m012_outbox_batches),
+]
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn):
+    """
+    Применить недостающие миграции. Каждая — атомарно: при ошибке версия не меняется.
+    Необязательный третий элемент MIGRATIONS — подготовка вне общей транзакции
+    (долгое копирование пачками); она должна уметь продолжаться после обрыва.
+    """
+    current = schema_version(conn)
+    for version, fn, *prepare in MIGRATIONS:
+        if version <= current:
+            continue
+        for step in prepare:
+            step(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            fn(conn)
+            conn.execute(f"PRAGMA user_version={version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        current = version
 
 
 def audit(conn, task_id, actor_id, action, details=None):
+    """
+    Запись в журнал. Коммитится вместе с изменением, которое описывает (см. transaction()).
+    """
     cur = conn.cursor()
     cur.execute(
         "INSERT INTO audit(task_id, actor_telegram_id, action, details, created_at) VALUES (?,?,?,?,?)",
         (task_id, actor_id, action, details, now_iso()),
     )
+
+
+def audit_many(conn, entries):
+    """
+    Пакетная запись в журнал для массовых операций.
+    entries: iterable (task_id, actor_id, action, details)
+    """
+    created = now_iso()
+    cur = conn.cursor()
+    cur.executemany(
+        "INSERT INTO audit(task_id, actor_telegram_id, action, details, created_at) VALUES (?,?,?,?,?)",
+        ((task_id, actor_id, action, details, created) for task_id, actor_id, action, details in entries),
+    )
+
+
+# ---------- users ----------
+
+def get_user(conn, tg_id: int):
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM users WHERE telegram_id=?", (tg_id,))
+    return cur.fetchone()
+
+
+def list_employees(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT telegram_id, full_name, department, is_active "
+        "FROM users WHERE role='employee' "
+        "ORDER BY is_active DESC, department, full_name"
+    )
+    return cur.fetchall()
+
+
+def list_active_employees(conn):
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT telegram_id, full_name, department FROM users "
+        "WHERE role='employee' AND is_active=1 ORDER BY department, full_name"
+    )
+    return cur.fetchall()
+
+
+def upsert_employee(conn, tg_id: int, fio: str, dept: str, actor_id: int):
+    upsert_employees(conn, [(tg_id, fio, dept)], actor_id)
+
+
+def upsert_employees(conn, rows, actor_id: int):
+    """
+    rows: [(telegram_id, ФИО, отдел)] — добавить или обновить (и включить) сотрудников.
+    """
+    cur = conn.cursor()
+    cur.executemany(
+        """
+        INSERT INTO users(telegram_id, full_name, department, role, is_active)
+        VALUES(?,?,?,'employee',1)
+        ON CONFLICT(telegram_id) DO UPDATE SET
+            full_name=excluded.full_name,
+            department=excluded.department,
+            role='employee',
+            is_active=1
+        """,
+        rows,
+    )
+    audit_many(conn, ((None, actor_id, "ADD_USER", f"{tg_id}|{fio}|{dept}") for tg_id, fio, dept in rows))
+
+
+def set_employee_active(conn, tg_id: int, active: bool, actor_id: int):
+    """
+    Включить/отключить сотрудника. Возвращает строку пользователя или None, если это не сотрудник.
+    """
+    u = get_user(conn, tg_id)
+    if not u or u["role"] != "employee":
+        return None
+    cur = conn.cursor()
+    cur.execute("UPDATE users SET is_active=? WHERE telegram_id=?", (1 if active else 0, tg_id))
+    action = "ACTIVATE_USER" if active else "DEACTIVATE_USER"
+    audit(conn, None, actor_id, action, f"{tg_id}|{u['full_name']}|{u['department']}")
+    return u
+
+
+# ---------- tasks ----------
+
+def get_task(conn, task_id: int):
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM tasks WHERE id=?", (task_id,))
+    return cur.fetchone()
+
+
+def list_tasks_page(conn, statuses, owner_id=None, overdue=False, by="deadline", cursor=None, backward=False,
+                    limit=10):
+    """
+    Страница списка задач, keyset-пагинация по (deadline, id) или (updated_at, id) без OFFSET.
+    by="deadline" — ближайшие сроки сверху, by="updated" — свежие изменения сверху.
+    cursor — (значение, id) крайней задачи соседней страницы; backward=True — листаем назад.
+    Возвращает (rows, has_prev, has_next).
+    """
+    col = {"deadline": "deadline", "updated": "updated_at"}[by]
+    desc = (by == "updated") != backward
+    where = [status_in(statuses)]
+    params = []
+    if owner_id is not None:
+        where.append("owner_telegram_id=?")
+        params.append(owner_id)
+    if overdue:
+        where.append("deadline < ?")
+        params.append(now_ts())
+    if cursor is not None:
+        where.append(f"({col}, id) {'<' if desc else '>'} (?, ?)")
+        params.extend(cursor)
+    order = "DESC" if desc else "ASC"
+    params.append(limit + 1)
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT * FROM tasks WHERE {' AND '.join(where)} ORDER BY {col} {order}, id {order} LIMIT ?",
+        params,
+    )
+    rows = cur.fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backward:
+        rows.reverse()
+        return rows, more, True
+    return rows, cursor is not None, more
+
+
+def task_counts(conn, owner_id=None, department=None):
+    """
+    Счётчики задач одним запросом по task_counters (без COUNT(*) по tasks).
+    Без фильтров — по всем задачам.
+    """
+    where, params = [], []
+    if owner_id is not None:
+        where.append("owner_telegram_id=?")
+        params.append(owner_id)
+    if department is not None:
+        where.append("department=?")
+        params.append(department)
+    row = conn.execute(
+        f"""
+        SELECT COALESCE(SUM(n), 0) total,
+               COALESCE(SUM(CASE WHEN {status_in(ACTIVE_STATUSES)} THEN n END), 0) active,
+               COALESCE(SUM(CASE WHEN {status_in((STATUS_ON_REVIEW,))} THEN n END), 0) review,
+               COALESCE(SUM(CASE WHEN {status_in((STATUS_DONE,))} THEN n END), 0) done
+        FROM task_counters
+        {"WHERE " + " AND ".join(where) if where else ""}
+        """,
+        params,
+    ).fetchone()
+    return dict(row)
+
+
+def user_task_counts(conn, tg_id: int):
+    return task_counts(conn, owner_id=tg_id)
+
+
+def report_counts(conn):
+    c = task_counts(conn)
+    # просрочка зависит от текущего времени — её не материализовать; считается по частичному индексу
+    overdue = conn.execute(
+        f"SELECT COUNT(*) c FROM tasks WHERE {status_in(ACTIVE_STATUSES)} AND deadline < ?",
+        (now_ts(),),
+    ).fetchone()["c"]
+    return {"overdue": overdue, "review": c["review"], "active": c["active"]}
+
+
+def dashboard(conn):
+    """
+    Сводка для админа из одного снимка: просроченные и на проверке по (отдел, сотрудник), больше задач — выше.
+    {"at": когда посчитано, "overdue": [(department, owner_telegram_id, full_name, n, oldest)], "review": [...]};
+    oldest — самый ранний срок среди просроченных. На проверке — из task_counters.
+    """
+    now = now_ts()
+    conn.execute("BEGIN")
+    try:
+        overdue = conn.execute(
+            f"SELECT t.department, t.owner_telegram_id, u.full_name, COUNT(*) n, MIN(t.deadline) oldest "
+            f"FROM tasks t LEFT JOIN users u ON u.telegram_id = t.owner_telegram_id "
+            f"WHERE t.{status_in(ACTIVE_STATUSES)} AND t.deadline < ? "
+            f"GROUP BY t.department, t.owner_telegram_id ORDER BY t.department, n DESC",
+            (now,),
+        ).fetchall()
+        review = conn.execute(
+            f"SELECT task_counters.department, owner_telegram_id, u.full_name, n, NULL oldest "
+            f"FROM task_counters LEFT JOIN users u ON u.telegram_id = owner_telegram_id "
+            f"WHERE task_counters.{status_in((STATUS_ON_REVIEW,))} AND n > 0 ORDER BY task_counters.department, n DESC"
+        ).fetchall()
+        return {"at": now, "overdue": overdue, "review": review}
+    finally:
+        conn.rollback()
+
+
+def _actual_counts(conn):
+    # задачи в архиве тоже считаются: "Всего" и "Завершенные" у сотрудника не уменьшаются от архивации
+    rows = conn.execute(
+        "SELECT owner_telegram_id, department, status, COUNT(*) n FROM "
+        "(SELECT owner_telegram_id, department, status FROM tasks UNION ALL "
+        "SELECT owner_telegram_id, department, status FROM archived_tasks) "
+        "GROUP BY owner_telegram_id, department, status"
+    )
+    return {(r[0], r[1], r[2]): r[3] for r in rows}
+
+
+def rebuild_counters(conn):
+    conn.execute("DELETE FROM task_counters")
+    conn.executemany(
+        "INSERT INTO task_counters(owner_telegram_id, department, status, n) VALUES (?, ?, ?, ?)",
+        [(*k, n) for k, n in _actual_counts(conn).items()],
+    )
+
+
+def check_counters(conn, fix: bool = False):
+    """
+    Сверить task_counters с пересчётом по tasks и archived_tasks. Возвращает расхождения
+    [(owner, department, status, в счётчиках, на самом деле)]; при fix=True пересобирает счётчики.
+    """
+    stored = {(r[0], r[1], r[2]): r[3] for r in conn.execute(
+        "SELECT owner_telegram_id, department, status, n FROM task_counters WHERE n != 0"
+    )}
+    actual = _actual_counts(conn)
+    diff = [(*k, stored.get(k, 0), actual.get(k, 0))
+            for k in sorted(stored.keys() | actual.keys(), key=repr) if stored.get(k, 0) != actual.get(k, 0)]
+    if diff and fix:
+        rebuild_counters(conn)
+    return diff
+
+
+def set_task_status(conn, task_id: int, status: int, actor_id: int, details: str, from_status=None,
+                    notify: bool = False):
+    """
+    Смена статуса. Если задан from_status — меняем только из него (защита от двойного нажатия).
+    Завершённой задаче напоминания снимаются, вернувшейся в работу — ставятся заново по её сроку.
+    notify — уведомить исполнителя (outbox, в той же транзакции).
+    Возвращает обновлённую задачу или None, если статус не изменился.
+    """
+    cur = conn.cursor()
+    updated = now_ts()
+    if from_status is None:
+        cur.execute("UPDATE tasks SET status=?, updated_at=? WHERE id=?", (status, updated, task_id))
+    else:
+        cur.execute("UPDATE tasks SET status=?, updated_at=? WHERE id=? AND status=?",
+                    (status, updated, task_id, from_status))
+    if cur.rowcount == 0:
+        return None
+    audit(conn, task_id, actor_id, "STATUS", details)
+    t = get_task(conn, task_id)
+    if status in (STATUS_DONE, STATUS_CANCELED):
+        cancel_jobs(conn, f"remind:{task_id}:")
+    elif status in (STATUS_NEW, STATUS_IN_PROGRESS) and from_status == STATUS_ON_REVIEW:
+        schedule_task_reminders(conn, task_id, t["deadline"])
+    if notify:
+        enqueue_outbox(conn, [(t["owner_telegram_id"], "task_status", f"status:{task_id}:{status}:{updated}",
+                               {"task_id": task_id, "status": status})])
+    return t
+
+
+def create_task(conn, title: str, desc: str, deadline: int, owner_id: int, dept: str, actor_id: int):
+    cur = conn.cursor()
+    created = now_ts()
+    cur.execute(
+        """
+        INSERT INTO tasks(title, description, status, deadline, owner_telegram_id, department, created_at, updated_at)
+        VALUES(?,?,?,?,?,?,?,?)
+        """,
+        (title, desc, STATUS_NEW, deadline, owner_id, dept, created, created),
+    )
+    task_id = cur.lastrowid
+    audit(conn, task_id, actor_id, "CREATE_TASK", f"to={owner_id} deadline={fmt_ts(deadline)}")
+    schedule_task_reminders(conn, task_id, deadline)
+    enqueue_outbox(conn, [_assigned_message(task_id, owner_id)])
+    return get_task(conn, task_id)
+
+
+def _assigned_message(task_id: int, owner_id: int):
+    return owner_id, "task_assigned", f"assigned:{task_id}", {"task_id": task_id}
+
+
+def insert_tasks(conn, tasks, actor_id: int):
+    """
+    tasks: [(title, desc, status, deadline, owner_id, dept)] — одной транзакцией с пакетным audit.
+    Напоминания ставятся только незавершённым задачам с ещё не наступившим сроком.
+    Возвращает созданные задачи в порядке tasks.
+    """
+    cur = conn.cursor()
+    created = now_ts()
+    # id — из lastrowid каждой вставки: при WORKERS > 1 "всё после MAX(id)" захватило бы и задачи другого процесса
+    ids = []
+    for t in tasks:
+        cur.execute(
+            """
+            INSERT INTO tasks(title, description, status, deadline, owner_telegram_id, department,
+                              created_at, updated_at)
+            VALUES(?,?,?,?,?,?,?,?)
+            """,
+            (*t, created, created),
+        )
+        ids.append(cur.lastrowid)
+    rows = cur.execute(f"SELECT * FROM tasks WHERE id IN ({_ids(ids)}) ORDER BY id").fetchall()
+    audit_many(conn, ((r["id"], actor_id, "CREATE_TASK",
+                       f"to={r['owner_telegram_id']} deadline={fmt_ts(r['deadline'])}") for r in rows))
+    schedule_jobs(conn, (job for r in rows
+                         if r["status"] in (STATUS_NEW, STATUS_IN_PROGRESS) and r["deadline"] > created
+                         for job in _task_reminder_jobs(r["id"], r["deadline"])))
+    return rows
+
+
+def create_tasks_bulk(conn, title: str, desc: str, deadline: int, targets, actor_id: int):
+    """
+    Одна задача на каждого из targets [(owner_id, dept)]. Уведомления исполнителям — одной рассылкой
+    (batch в outbox): когда она закончится, actor_id получит сводку. Возвращает созданные задачи в порядке targets.
+    """
+    rows = insert_tasks(conn, [(title, desc, STATUS_NEW, deadline, owner_id, dept) for owner_id, dept in targets],
+                        actor_id)
+    batch = f"bulk:{rows[0]['id']}"
+    conn.execute("INSERT INTO outbox_batches(batch, chat_id, total, created_at) VALUES (?,?,?,?)",
+                 (batch, actor_id, len(rows), now_ts()))
+    enqueue_outbox(conn, (_assigned_message(r["id"], r["owner_telegram_id"]) for r in rows), batch=batch)
+    return rows
+
+
+def import_batch(conn, users, tasks, actor_id: int):
+    """
+    Пачка импорта (importer.py): сначала сотрудники, затем задачи — задачи могут ссылаться
+    на сотрудников из этой же пачки. Возвращает созданные задачи.
+    """
+    if users:
+        upsert_employees(conn, users, actor_id)
+    return insert_tasks(conn, tasks, actor_id) if tasks else []
+
+
+def change_deadline(conn, task_id: int, new_deadline: int, actor_id: int):
+    """
+    Исполнитель получает уведомление (outbox, в той же транзакции). Напоминания по новому сроку — только
+    незавершённой задаче (как в insert_tasks), у остальных старые снимаются.
+    Возвращает (старый срок, owner_id) или None, если задачи нет.
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT deadline, owner_telegram_id, status FROM tasks WHERE id=?", (task_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    old = row["deadline"]
+    updated = now_ts()
+    cur.execute("UPDATE tasks SET deadline=?, updated_at=? WHERE id=?", (new_deadline, updated, task_id))
+    audit(conn, task_id, actor_id, "CHANGE_DEADLINE", f"{fmt_ts(old)}→{fmt_ts(new_deadline)}")
+    if row["status"] in (STATUS_NEW, STATUS_IN_PROGRESS):
+        schedule_task_reminders(conn, task_id, new_deadline)
+    else:
+        cancel_jobs(conn, f"remind:{task_id}:")
+    enqueue_outbox(conn, [(row["owner_telegram_id"], "task_deadline", f"deadline:{task_id}:{new_deadline}:{updated}",
+                           {"task_id": task_id, "old": old, "new": new_deadline})])
+    return old, row["owner_telegram_id"]
+
+
+def add_comment(conn, task_id: int, author_id: int, text: str):
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO comments(task_id, author_telegram_id, text, created_at) VALUES(?,?,?,?)",
+        (task_id, author_id, text, now_iso()),
+    )
+    audit(conn, task_id, author_id, "COMMENT", text[:200])
+
+
+def add_file(conn, task_id: int, uploader_id: int, file_id: str, file_name, kind: str = "document"):
+    """
+    kind — "document" или "photo" (как файл отправлять обратно).
+    """
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO files(task_id, uploader_telegram_id, telegram_file_id, file_name, kind, created_at) "
+        "VALUES(?,?,?,?,?,?)",
+        (task_id, uploader_id, file_id, file_name, kind, now_iso()),
+    )
+    audit(conn, task_id, uploader_id, "ADD_FILE", file_name)
+
+
+# ---------- task detail ----------
+# Комментарии, файлы и журнал задачи читаются по индексам (task_id, id), новые сверху.
+
+def task_history_page(conn, task_id: int, before_id=None, limit=10):
+    """
+    Записи журнала задачи с именем автора, от новых к старым; before_id — id самой старой уже показанной.
+    Возвращает (rows, has_more).
+    """
+    where, params = ["a.task_id = ?"], [task_id]
+    if before_id is not None:
+        where.append("a.id < ?")
+        params.append(before_id)
+    params.append(limit + 1)
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT a.*, u.full_name FROM audit a LEFT JOIN users u ON u.telegram_id = a.actor_telegram_id "
+        f"WHERE {' AND '.join(where)} ORDER BY a.id DESC LIMIT ?",
+        params,
+    )
+    rows = cur.fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+def list_task_files(conn, task_id: int, limit=None):
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM files WHERE task_id=? ORDER BY id DESC LIMIT ?",
+                (task_id, -1 if limit is None else limit))
+    return cur.fetchall()
+
+
+def get_task_detail(conn, task_id: int, limit=5):
+    """
+    Карточка задачи за одно обращение к БД: задача, последние limit комментариев (с именами авторов),
+    файлов (и их число) и записей журнала — из одного снимка (одна транзакция чтения).
+    None, если задачи нет.
+    """
+    conn.execute("BEGIN")
+    try:
+        task = get_task(conn, task_id)
+        if task is None:
+            return None
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT c.*, u.full_name FROM comments c LEFT JOIN users u ON u.telegram_id = c.author_telegram_id "
+            "WHERE c.task_id = ? ORDER BY c.id DESC LIMIT ?",
+            (task_id, limit),
+        )
+        comments = cur.fetchall()
+        cur.execute("SELECT COUNT(*) FROM files WHERE task_id=?", (task_id,))
+        files_n = cur.fetchone()[0]
+        history, history_more = task_history_page(conn, task_id, limit=limit)
+        return {
+            "task": task,
+            "comments": comments,
+            "files": list_task_files(conn, task_id, limit),
+            "files_n": files_n,
+            "history": history,
+            "history_more": history_more,
+        }
+    finally:
+        conn.rollback()
+
+
+# ---------- export (exporter.py) ----------
+
+EXPORT_TABLES = ("tasks", "comments", "files", "audit")
+
+
+def _export_where(date_from=None, date_to=None, department=None, statuses=None, owner_id=None):
+    """
+    Условие по задачам (алиас t) для выгрузки. date_from/date_to — unix-время, по created_at задачи.
+    """
+    where, params = [], []
+    if date_from is not None:
+        where.append("t.created_at >= ?")
+        params.append(date_from)
+    if date_to is not None:
+        where.append("t.created_at < ?")
+        params.append(date_to)
+    if department is not None:
+        where.append("t.department = ?")
+        params.append(department)
+    if statuses:
+        where.append("t." + status_in(statuses))
+    if owner_id is not None:
+        where.append("t.owner_telegram_id = ?")
+        params.append(owner_id)
+    return " AND ".join(where) or "1", params
+
+
+def export_rows(conn, table: str, **filters):
+    """
+    Курсор по строкам table для задач, подходящих под filters (см. _export_where), по порядку id.
+    Строки читаются по мере итерации — в памяти не копятся.
+    Журнал без задачи (действия с сотрудниками) попадает в выгрузку, только если нет фильтров по задачам,
+    кроме дат; даты для него сравниваются с created_at записи журнала.
+    """
+    where, params = _export_where(**filters)
+    if table == "tasks":
+        return conn.execute(f"SELECT t.* FROM tasks t WHERE {where} ORDER BY t.id", params)
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"unknown table: {table!r}")
+    if table == "audit" and not any(filters.get(k) is not None for k in ("department", "statuses", "owner_id")):
+        # LEFT JOIN, а не UNION: один проход по audit в порядке id, без сортировки во временной таблице
+        cond, extra = ["x.task_id IS NULL"], []
+        for key, op in (("date_from", ">="), ("date_to", "<")):
+            if filters.get(key) is not None:
+                cond.append(f"x.created_at {op} ?")
+                extra.append(from_ts(filters[key]).replace(tzinfo=None).isoformat(timespec="seconds"))
+        return conn.execute(
+            f"SELECT x.* FROM audit x LEFT JOIN tasks t ON t.id = x.task_id "
+            f"WHERE (t.id IS NOT NULL AND {where}) OR ({' AND '.join(cond)}) ORDER BY x.id",
+            params + extra,
+        )
+    return conn.execute(f"SELECT x.* FROM {table} x JOIN tasks t ON t.id = x.task_id WHERE {where} ORDER BY x.id",
+                        params)
+
+
+# ---------- search (/find) ----------
+
+SEARCH_WEIGHTS = (10.0, 4.0, 1.0)  # bm25: название, описание, комментарии
+SEARCH_MAX_TERMS = 8
+
+# Стеммера для русского в FTS5 нет. Вместо него у слова отрезается окончание и ищется префикс:
+# "поставщику" -> поставщик* (найдёт "поставщика", "поставщиков"). Основа не короче SEARCH_MIN_STEM.
+_RU_ENDINGS = sorted((
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими", "ой", "ей", "ий", "ый", "ая", "яя",
+    "ое", "ее", "ые", "ие", "ов", "ев", "ам", "ям", "ах", "ях", "ом", "ем", "ую", "юю",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+), key=len, reverse=True)
+SEARCH_MIN_STEM = 4
+_WORD = re.compile(r"\w+")
+
+
+def fold(text: str) -> str:
+    return text.replace("ё", "е").replace("Ё", "Е")
+
+
+def _stem(word: str) -> str:
+    for ending in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= SEARCH_MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def search_query(text: str) -> str:
+    """
+    Текст пользователя -> выражение FTS5 MATCH: все слова обязательны, каждое — префикс.
+    Операторы FTS5 из текста не проходят (слова берутся в кавычки). Пустая строка — искать нечего.
+    """
+    words = _WORD.findall(fold(text).lower())[:SEARCH_MAX_TERMS]
+    return " ".join(f'"{_stem(w)}"*' for w in words)
+
+
+def search_tasks(conn, text: str, owner_id=None, offset=0, limit=10):
+    """
+    Задачи по словам в названии, описании и комментариях, лучшие (bm25) сверху.
+    owner_id — только задачи этого сотрудника. В каждой строке ещё snippet — фрагмент с совпадением.
+    Порядок по релевантности считается по всем совпадениям сразу, поэтому страницы — через OFFSET.
+    Возвращает (rows, has_next).
+    """
+    match = search_query(text)
+    if not match:
+        return [], False
+    where, params = ["task_search MATCH ?"], [match]
+    if owner_id is not None:
+        where.append("t.owner_telegram_id = ?")
+        params.append(owner_id)
+    params.extend((limit + 1, offset))
+    cur = conn.cursor()
+    cur.execute(
+        f"SELECT t.*, snippet(task_search, -1, '«', '»', '…', 12) AS snippet "
+        f"FROM task_search s JOIN tasks t ON t.id = s.rowid "
+        f"WHERE {' AND '.join(where)} ORDER BY s.rank, t.id LIMIT ? OFFSET ?",
+        params,
+    )
+    rows = cur.fetchall()
+    return rows[:limit], len(rows) > limit
+
+
+# ---------- conversation state (state.py) ----------
+
+def fsm_load(conn, since: int):
+    cur = conn.cursor()
+    cur.execute("SELECT telegram_id, data, updated_at FROM fsm_state WHERE updated_at >= ?", (since,))
+    return cur.fetchall()
+
+
+def fsm_save(conn, tg_id: int, data: str, ts: int):
+    conn.execute(
+        "INSERT INTO fsm_state(telegram_id, data, updated_at) VALUES(?,?,?) "
+        "ON CONFLICT(telegram_id) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at",
+        (tg_id, data, ts),
+    )
+
+
+def fsm_delete(conn, tg_id: int):
+    conn.execute("DELETE FROM fsm_state WHERE telegram_id=?", (tg_id,))
+
+
+def fsm_delete_expired(conn, before: int) -> int:
+    return conn.execute("DELETE FROM fsm_state WHERE updated_at < ?", (before,)).rowcount
+
+
+# ---------- scheduled jobs (scheduler.py) ----------
+
+def reminder_times(deadline: int):
+    """
+    [(fire_at, hours_before)] напоминаний по сроку; hours_before=0 — "просрочено".
+    Напоминания, время которых уже прошло, пропускаются (кроме "просрочено").
+    """
+    now = time.time()
+    out = []
+    for hours in config.REMIND_BEFORE_HOURS + (0,):
+        fire_at = deadline - hours * 3600
+        if hours and fire_at <= now:
+            continue
+        out.append((fire_at, hours))
+    return out
+
+
+def schedule_jobs(conn, jobs):
+    """
+    jobs: iterable (key, kind, fire_at, payload, cron); существующие с тем же key перезаписываются.
+    """
+    conn.executemany(
+        "INSERT INTO jobs(key, kind, fire_at, cron, payload) VALUES(?,?,?,?,?) "
+        "ON CONFLICT(key) DO UPDATE SET kind=excluded.kind, fire_at=excluded.fire_at, "
+        "cron=excluded.cron, payload=excluded.payload",
+        ((key, kind, fire_at, cron, None if payload is None else json.dumps(payload))
+         for key, kind, fire_at, payload, cron in jobs),
+    )
+
+
+def schedule_job(conn, key: str, kind: str, fire_at: int, payload=None, cron=None):
+    schedule_jobs(conn, [(key, kind, fire_at, payload, cron)])
+
+
+def cancel_jobs(conn, key_prefix: str):
+    # диапазон по уникальному индексу вместо LIKE: ';' идёт сразу после ':'
+    conn.execute("DELETE FROM jobs WHERE key >= ? AND key < ?", (key_prefix, key_prefix[:-1] + ";"))
+
+
+def _task_reminder_jobs(task_id: int, deadline: int):
+    return [(f"remind:{task_id}:{hours}h", "task_reminder", fire_at, {"task_id": task_id, "hours": hours}, None)
+            for fire_at, hours in reminder_times(deadline)]
+
+
+def schedule_task_reminders(conn, task_id: int, deadline: int):
+    cancel_jobs(conn, f"remind:{task_id}:")
+    schedule_jobs(conn, _task_reminder_jobs(task_id, deadline))
+
+
+def ensure_cron_job(conn, key: str, kind: str, cron: str, fire_at: int) -> int:
+    """
+    Создать повторяющуюся задачу, если её нет, или обновить расписание, если cron изменился.
+    Возвращает время ближайшего запуска.
+    """
+    row = conn.execute("SELECT cron, fire_at FROM jobs WHERE key=?", (key,)).fetchone()
+    if row and row["cron"] == cron:
+        return row["fire_at"]
+    schedule_job(conn, key, kind, fire_at, cron=cron)
+    return fire_at
+
+
+def next_job_time(conn):
+    return conn.execute("SELECT MIN(fire_at) FROM jobs").fetchone()[0]
+
+
+def due_jobs(conn, now: int):
+    return conn.execute("SELECT * FROM jobs WHERE fire_at <= ? ORDER BY fire_at", (now,)).fetchall()
+
+
+def finish_job(conn, job_id: int, fire_at: int):
+    """
+    Удалить выполненную разовую задачу, если её не перепланировали, пока она выполнялась.
+    """
+    conn.execute("DELETE FROM jobs WHERE id=? AND fire_at=?", (job_id, fire_at))
+
+
+def reschedule_job(conn, job_id: int, fire_at: int):
+    conn.execute("UPDATE jobs SET fire_at=? WHERE id=?", (fire_at, job_id))
+
+
+# ---------- outbox (outbox.py) ----------
+# Уведомление пишется в той же транзакции, что и изменение задачи, поэтому не теряется, если бот упал
+# или Telegram не ответил. dedupe_key — повторная запись того же события (повтор апдейта) игнорируется.
+# Доставленное удаляется; next_at NULL — ждёт /start сотрудника (outbox_wake).
+
+def enqueue_outbox(conn, messages, batch: str = None):
+    """
+    messages: iterable (chat_id, kind, dedupe_key, payload) — к отправке сейчас.
+    batch — рассылка из outbox_batches, по которой ждут сводку (finish_outbox_batches).
+    """
+    now = now_ts()
+    conn.executemany(
+        "INSERT OR IGNORE INTO outbox(chat_id, kind, dedupe_key, payload, batch, next_at, created_at) "
+        "VALUES (?,?,?,?,?,?,?)",
+        ((chat_id, kind, key, None if payload is None else json.dumps(payload), batch, now, now)
+         for chat_id, kind, key, payload in messages),
+    )
+
+
+def next_outbox_time(conn):
+    return conn.execute("SELECT MIN(next_at) FROM outbox").fetchone()[0]
+
+
+def due_outbox(conn, now: int, limit: int):
+    return conn.execute(
+        "SELECT * FROM outbox WHERE next_at <= ? ORDER BY next_at, id LIMIT ?", (now, limit)
+    ).fetchall()
+
+
+def outbox_finish(conn, delivered, retries, batches=()):
+    """
+    delivered: id доставленных — удаляются; retries: iterable (id, next_at, ошибка),
+    next_at None — отложить до /start сотрудника. batches — рассылки этих строк: завершённые закрываются
+    в той же транзакции (см. finish_outbox_batches, её результат и возвращается).
+    """
+    conn.executemany("DELETE FROM outbox WHERE id=?", ((i,) for i in delivered))
+    conn.executemany(
+        "UPDATE outbox SET attempts=attempts+1, next_at=?, last_error=? WHERE id=?",
+        ((next_at, error, i) for i, next_at, error in retries),
+    )
+    return finish_outbox_batches(conn, batches)
+
+
+def finish_outbox_batches(conn, batches):
+    """
+    Рассылки из batches, где не осталось строк к отправке или повтору, закрываются.
+    Возвращает [(chat_id, total, parked)] по закрытым, parked — отложенные до /start строки outbox;
+    дальше они доставляются и сообщают об ошибках как обычные.
+    """
+    done = []
+    for batch in batches:
+        if conn.execute("SELECT 1 FROM outbox WHERE batch=? AND next_at IS NOT NULL LIMIT 1", (batch,)).fetchone():
+            continue
+        info = conn.execute("SELECT chat_id, total FROM outbox_batches WHERE batch=?", (batch,)).fetchone()
+        if info is None:
+            continue  # уже закрыта
+        conn.execute("DELETE FROM outbox_batches WHERE batch=?", (batch,))
+        parked = conn.execute("SELECT * FROM outbox WHERE batch=? ORDER BY id", (batch,)).fetchall()
+        conn.execute("UPDATE outbox SET batch=NULL WHERE batch=?", (batch,))
+        done.append((info["chat_id"], info["total"], parked))
+    return done
+
+
+def outbox_wake(conn, chat_id: int) -> int:
+    """
+    Сотрудник снова на связи: всё отложенное и ждущее повтора — к отправке сейчас, попытки заново.
+    """
+    now = now_ts()
+    return conn.execute(
+        "UPDATE outbox SET next_at=?, attempts=0 WHERE chat_id=? AND (next_at IS NULL OR next_at > ?)",
+        (now, chat_id, now),
+    ).rowcount
+
+
+# ---------- worker processes (cluster.py) ----------
+
+def acquire_lease(conn, name: str, holder: str, ttl: float):
+    """
+    Взять аренду name или продлить свою. Возвращает её cursor (см. enqueue_updates)
+    или None, если аренду держит другой и она ещё не истекла.
+    """
+    now = time.time()
+    conn.execute(
+        "INSERT INTO leases(name, holder, expires_at) VALUES (?,?,?) "
+        "ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_at=excluded.expires_at "
+        "WHERE leases.holder=excluded.holder OR leases.expires_at < ?",
+        (name, holder, now + ttl, now),
+    )
+    row = conn.execute("SELECT holder, cursor FROM leases WHERE name=?", (name,)).fetchone()
+    return row["cursor"] if row["holder"] == holder else None
+
+
+def release_lease(conn, name: str, holder: str):
+    conn.execute("UPDATE leases SET expires_at=0 WHERE name=? AND holder=?", (name, holder))
+
+
+def enqueue_updates(conn, rows, lease: str, holder: str, update_id: int) -> bool:
+    """
+    Записать апдейты [(shard, user_id, json)] и сдвинуть cursor аренды до update_id —
+    только если holder всё ещё её держит. False — аренда потеряна, ничего не записано.
+    """
+    if conn.execute(
+        "UPDATE leases SET cursor=MAX(cursor, ?) WHERE name=? AND holder=? AND expires_at >= ?",
+        (update_id, lease, holder, time.time()),
+    ).rowcount != 1:
+        return False
+    conn.executemany("INSERT INTO updates(shard, user_id, data) VALUES (?,?,?)", rows)
+    return True
+
+
+def next_updates(conn, shard: int, after_id: int, limit: int):
+    return conn.execute(
+        "SELECT id, data FROM updates WHERE shard=? AND id > ? ORDER BY id LIMIT ?", (shard, after_id, limit)
+    ).fetchall()
+
+
+def delete_updates(conn, shard: int, up_to_id: int):
+    conn.execute("DELETE FROM updates WHERE shard=? AND id <= ?", (shard, up_to_id))
+
+
+def reshard_updates(conn, workers: int) -> int:
+    """
+    Перераспределить необработанные апдейты, если число воркеров изменилось. Только когда воркеры остановлены.
+    """
+    return conn.execute("UPDATE updates SET shard = user_id % ? WHERE shard != user_id % ?",
+                        (workers, workers)).rowcount
+
+
+# ---------- archive (archive.py) ----------
+# Закрытая задача, не менявшаяся ARCHIVE_AFTER_DAYS, переезжает вместе с комментариями, файлами и журналом
+# в файл ARCHIVE_DIR/tasks-ГГГГ-ММ.db (месяц — по updated_at задачи), журнал без задачи — по своему created_at.
+# Таблицы архива — те же четыре с теми же id и колонками, без триггеров. В горячей базе остаётся archived_tasks.
+# Чтение: у соединения с файлом архива горячая база подключена как hot, поэтому те же функции выше
+# (get_task_detail, task_history_page, export_rows, ...) читают задачи и журнал из архива, а users — из горячей.
+
+ARCHIVE_DIR = config.ARCHIVE_DIR
+ARCHIVE_TABLES = ("tasks", "comments", "files", "audit")
+ARCHIVE_SCHEMA = "arch"  # имя подключённого файла архива у соединения архивации
+
+
+def archive_path(month: str) -> str:
+    return str(Path(ARCHIVE_DIR) / f"tasks-{month}.db")
+
+
+def archive_months():
+    """
+    Месяцы ("ГГГГ-ММ"), для которых есть файлы архива, по возрастанию.
+    """
+    return sorted(p.stem[len("tasks-"):] for p in Path(ARCHIVE_DIR).glob("tasks-????-??.db"))
+
+
+def archive_conn(month: str):
+    """
+    Read-only соединение с архивом месяца; горячая база подключена как hot (оттуда — users).
+    """
+    uri = Path(archive_path(month)).absolute().as_uri() + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=config.DB_BUSY_TIMEOUT_MS / 1000,
+                           factory=TimedConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout={config.DB_BUSY_TIMEOUT_MS}")
+    conn.execute("ATTACH DATABASE ? AS hot", (Path(DB_FILE).absolute().as_uri() + "?mode=ro",))
+    return conn
+
+
+def archived_month(conn, task_id: int):
+    row = conn.execute("SELECT month FROM archived_tasks WHERE task_id=?", (task_id,)).fetchone()
+    return row[0] if row else None
+
+
+def attach_archive(conn, month: str):
+    """
+    Подключить (и при необходимости создать) файл архива месяца как ARCHIVE_SCHEMA. Вне транзакции.
+    Колонки берутся из горячей базы: добавленные миграциями позже дописываются и в старые файлы.
+    """
+    Path(ARCHIVE_DIR).mkdir(parents=True, exist_ok=True)
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path(month),))
+    for table in ARCHIVE_TABLES:
+        cols = conn.execute(f"PRAGMA main.table_info({table})").fetchall()
+        have = {r["name"] for r in conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.table_info({table})")}
+        if not have:
+            defs = ", ".join(f"{c['name']} {c['type']}" + (" PRIMARY KEY" if c["pk"] else "") for c in cols)
+            conn.execute(f"CREATE TABLE {ARCHIVE_SCHEMA}.{table} ({defs})")
+            if table != "tasks":
+                conn.execute(f"CREATE INDEX {ARCHIVE_SCHEMA}.idx_{table}_task ON {table}(task_id, id)")
+        for c in cols:
+            if have and c["name"] not in have:
+                conn.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table} ADD COLUMN {c['name']} {c['type']}")
     conn.commit()
+
+
+def detach_archive(conn):
+    conn.execute(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+
+
+def archive_candidates(conn, before: int, limit: int):
+    """
+    Закрытые задачи, не менявшиеся с before (unix-время): [(id, updated_at)].
+    """
+    return conn.execute(
+        f"SELECT id, updated_at FROM tasks WHERE {status_in((STATUS_DONE, STATUS_CANCELED))} AND updated_at < ? "
+        f"LIMIT ?",
+        (before, limit),
+    ).fetchall()
+
+
+def archive_audit_candidates(conn, before: str, limit: int):
+    """
+    Журнал без задачи (действия с сотрудниками) старше before (ISO, как created_at): [(id, created_at)].
+    """
+    return conn.execute(
+        "SELECT id, created_at FROM audit WHERE task_id IS NULL AND created_at < ? ORDER BY id LIMIT ?",
+        (before, limit),
+    ).fetchall()
+
+
+def _ids(ids) -> str:
+    # id — целые из выборок выше, поэтому литералами: список пачки не упирается в лимит параметров
+    return ",".join(str(int(i)) for i in ids)
+
+
+def copy_to_archive(conn, task_ids, audit_ids, before: int):
+    """
+    Скопировать задачи (если всё ещё закрыты и не менялись с before) со всем, что к ним относится,
+    и записи журнала audit_ids в подключённый архив. INSERT OR REPLACE: повтор после обрыва безвреден.
+    """
+    a, tids = ARCHIVE_SCHEMA, _ids(task_ids)
+    cols = _archive_columns(conn)
+    conn.execute(
+        f"INSERT OR REPLACE INTO {a}.tasks({cols['tasks']}) SELECT {cols['tasks']} FROM main.tasks "
+        f"WHERE id IN ({tids}) AND {status_in((STATUS_DONE, STATUS_CANCELED))} AND updated_at < ?",
+        (before,),
+    )
+    _copy_task_rows(conn, cols, f"SELECT id FROM {a}.tasks WHERE id IN ({tids})")
+    conn.execute(f"INSERT OR REPLACE INTO {a}.audit({cols['audit']}) SELECT {cols['audit']} FROM main.audit "
+                 f"WHERE id IN ({_ids(audit_ids)}) AND task_id IS NULL")
+
+
+def _archive_columns(conn):
+    return {t: ", ".join(r["name"] for r in conn.execute(f"PRAGMA main.table_info({t})")) for t in ARCHIVE_TABLES}
+
+
+def _copy_task_rows(conn, cols, task_ids_sql: str):
+    # комментарии, файлы и журнал задач task_ids_sql (подзапрос или список id) — в подключённый архив
+    for table in ("comments", "files", "audit"):
+        conn.execute(f"INSERT OR REPLACE INTO {ARCHIVE_SCHEMA}.{table}({cols[table]}) "
+                     f"SELECT {cols[table]} FROM main.{table} WHERE task_id IN ({task_ids_sql})")
+
+
+def drop_archived(conn, month: str, task_ids, audit_ids) -> int:
+    """
+    Удалить из горячей базы то, что уже лежит в подключённом архиве (только скопированные строки и только
+    задачи, не изменившиеся после копирования), отметить задачи в archived_tasks. Счётчики задач не меняются.
+    Возвращает число задач.
+    """
+    a = ARCHIVE_SCHEMA
+    moved = _ids(r[0] for r in conn.execute(
+        f"SELECT x.id FROM {a}.tasks x JOIN main.tasks t ON t.id = x.id "
+        f"WHERE x.id IN ({_ids(task_ids)}) AND t.status = x.status AND t.updated_at = x.updated_at"
+    ))
+    conn.execute(
+        f"INSERT OR REPLACE INTO archived_tasks(task_id, month, owner_telegram_id, department, status) "
+        f"SELECT id, ?, owner_telegram_id, department, status FROM main.tasks WHERE id IN ({moved})",
+        (month,),
+    )
+    # триггер на удаление уменьшит счётчики — заранее возвращаем то же число обратно
+    conn.execute(
+        f"INSERT INTO task_counters(owner_telegram_id, department, status, n) "
+        f"SELECT owner_telegram_id, department, status, COUNT(*) FROM main.tasks WHERE id IN ({moved}) "
+        f"GROUP BY owner_telegram_id, department, status "
+        f"ON CONFLICT(owner_telegram_id, department, status) DO UPDATE SET n = n + excluded.n"
+    )
+    # комментарий или файл мог появиться после копирования (add_comment не меняет updated_at, а при WORKERS > 1
+    # пишут и другие процессы) — докопировать в этой же транзакции, чтобы не осталось строк без задачи
+    _copy_task_rows(conn, _archive_columns(conn), moved)
+    # сначала задачи: тогда триггер поиска на удаление комментария не пересобирает строку task_search
+    n = conn.execute(f"DELETE FROM main.tasks WHERE id IN ({moved})").rowcount
+    for table in ("comments", "files", "audit"):
+        conn.execute(f"DELETE FROM main.{table} WHERE task_id IN ({moved})")
+    conn.execute(f"DELETE FROM main.audit WHERE id IN "
+                 f"(SELECT id FROM {a}.audit WHERE id IN ({_ids(audit_ids)}) AND task_id IS NULL)")
+    return n
+
+
+def incremental_vacuum(conn, pages: int) -> int:
+    """
+    Вернуть файлу до pages свободных страниц (auto_vacuum=INCREMENTAL). Возвращает, сколько свободных осталось.
+    """
+    conn.execute(f"PRAGMA incremental_vacuum({int(pages)})").fetchall()
+    return conn.execute("PRAGMA freelist_count").fetchone()[0]
@@ -0,0 +1,87 @@
+# digest.py
+"""
+Сводки уведомлений админу вместо отдельного push на каждое событие.
+
+- событие с категорией (сдача на проверку, изменения сотрудников, недоставленные push, ...) копится
+  ADMIN_DIGEST_SECONDS с первого события категории, потом уходит одним сообщением: сколько событий,
+  по строке на каждое и кнопки задач (#id — открыть карточку);
+- одно событие за окно уходит как есть, без заголовка сводки;
+- срочные категории (ADMIN_DIGEST_URGENT) и события без категории отправляются сразу;
+- при остановке бота накопленное отправляется (flush_all).
+При WORKERS > 1 у каждого процесса свои окна: сводок может прийти по одной от каждого воркера.
+"""
+import asyncio
+import logging
+
+import render
+from config import ADMIN_DIGEST_SECONDS, ADMIN_DIGEST_URGENT
+
+log = logging.getLogger(__name__)
+
+MESSAGE_MAX_LEN = 4096
+TASK_BUTTONS = 24  # кнопок задач в одной сводке, по 4 в ряд
+TASK_BUTTONS_ROW = 4
+
+
+class Digest:
+    """
+    send(text, reply_markup) — отправить админу (ставит в очередь sender, не ждёт).
+    titles: категория -> заголовок сводки; extra: категория -> (текст, callback) кнопки "все" под сводкой.
+    """
+
+    def __init__(self, send, titles: dict, extra: dict = None, window: float = ADMIN_DIGEST_SECONDS,
+                 urgent=ADMIN_DIGEST_URGENT):
+        self.send = send
+        self.titles = titles
+        self.extra = extra or {}
+        self.window = window
+        self.urgent = frozenset(urgent)
+        self._events = {}  # категория -> [(текст, строка сводки, task_id)]
+        self._timers = {}  # категория -> asyncio.TimerHandle
+
+    def add(self, category, text: str, line: str = None, task_id: int = None):
+        """
+        Событие для админа. line — строка в сводке (по умолчанию первая строка text).
+        """
+        if category is None or category in self.urgent or self.window <= 0:
+            self.send(text, None)
+            return
+        self._events.setdefault(category, []).append((text, line or text.split("\n", 1)[0], task_id))
+        if category not in self._timers:
+            self._timers[category] = asyncio.get_running_loop().call_later(self.window, self.flush, category)
+
+    def flush(self, category):
+        timer = self._timers.pop(category, None)
+        if timer is not None:
+            timer.cancel()
+        events = self._events.pop(category, None)
+        if not events:
+            return
+        if len(events) == 1:
+            self.send(events[0][0], None)
+            return
+        self.send(*self.render(category, events))
+
+    def flush_all(self):
+        for category in list(self._events):
+            self.flush(category)
+
+    def render(self, category, events):
+        """
+        (текст, клавиатура) сводки: заголовок с числом событий, строки событий, кнопки задач.
+        """
+        head = f"{self.titles.get(category, category)}: {len(events)}"
+        lines, size = [], len(head)
+        for i, (_, line, _) in enumerate(events):
+            rest = f"… и ещё {len(events) - i}"
+            if size + len(line) + len(rest) + 2 > MESSAGE_MAX_LEN:
+                lines.append(rest)
+                break
+            lines.append(line)
+            size += len(line) + 1
+
+        task_ids = list(dict.fromkeys(t for _, _, t in events if t is not None))[:TASK_BUTTONS]
+        rows = render.grid(((f"#{t}", f"t:{t}:open") for t in task_ids), TASK_BUTTONS_ROW)
+        if category in self.extra:
+            rows.append([self.extra[category]])
+        return head + "\n" + "\n".join(lines), render.markup(rows) if rows else None
@@ -0,0 +1,182 @@
+# exporter.py
+"""
+Выгрузка задач, комментариев, файлов и журнала (/export): CSV — zip из четырёх файлов,
+XLSX — четыре листа (нужен пакет openpyxl).
+Строки идут из курсора БД прямо в файл на диске — память не растёт с объёмом выгрузки.
+Вся работа — в отдельном потоке на своём read-only соединении (пул reader() не занимается),
+все таблицы читаются одной транзакцией — согласованный снимок. Архив (archive.py) выгружается тоже.
+
+    /export [csv|xlsx] [from=2026-01-01] [to=2026-01-31] [dept=Финансы] [status=Готово,В_процессе] [owner=123]
+
+Даты — по созданию задачи, to включительно.
+"""
+import asyncio
+import csv
+import io
+import logging
+import os
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+
+from aiogram.types import FSInputFile
+
+import db
+import sender
+
+log = logging.getLogger(__name__)
+
+TELEGRAM_MAX_UPLOAD = 50 * 1024 * 1024
+XLSX_MAX_ROWS = 1_048_576  # предел строк на листе Excel, дальше — следующий лист
+
+_TASK_TIMES = ("deadline", "created_at", "updated_at")
+_STATUS_CODES = {title.lower(): code for code, title in db.STATUS_TITLES.items()}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_args(text: str):
+    """
+    "/export xlsx dept=Финансы ..." -> (fmt, filters для db.export_rows).
+    """
+    fmt, filters = "csv", {}
+    for arg in text.split()[1:]:
+        key, _, value = arg.partition("=")
+        key = key.lower()
+        if not value and key in ("csv", "xlsx"):
+            fmt = key
+            continue
+        try:
+            if key == "from":
+                filters["date_from"] = db.to_ts(datetime.strptime(value, "%Y-%m-%d"))
+            elif key == "to":
+                filters["date_to"] = db.to_ts(datetime.strptime(value, "%Y-%m-%d") + timedelta(days=1))
+            elif key == "owner":
+                filters["owner_id"] = int(value)
+            elif key == "dept":
+                if value not in db.DEPARTMENTS:
+                    raise ExportError("dept: " + " / ".join(db.DEPARTMENTS))
+                filters["department"] = value
+            elif key == "status":
+                names = [s.replace("_", " ").strip().lower() for s in value.split(",")]
+                if any(n not in _STATUS_CODES for n in names):
+                    raise ExportError("status: " + ", ".join(t.replace(" ", "_") for t in db.STATUS_TITLES.values()))
+                filters["statuses"] = tuple(_STATUS_CODES[n] for n in names)
+            else:
+                raise ExportError(f"неизвестный параметр: {arg}")
+        except ExportError:
+            raise
+        except ValueError:
+            raise ExportError(f"неверное значение: {arg}")
+    return fmt, filters
+
+
+def _table_rows(conns, table: str, filters: dict, counts: dict):
+    """
+    Заголовок, затем строки table в читаемом виде (статусы названиями, время задач — датой):
+    сначала из горячей базы, потом из файлов архива (колонки в них те же).
+    """
+    cur = db.export_rows(conns[0], table, **filters)
+    header = [d[0] for d in cur.description]
+    yield header
+    status_i = header.index("status") if table == "tasks" else None
+    time_i = [header.index(c) for c in _TASK_TIMES] if table == "tasks" else []
+    n = 0
+    for conn in conns:
+        if conn is not conns[0]:
+            cur = db.export_rows(conn, table, **filters)
+        for r in cur:
+            row = list(r)
+            if status_i is not None:
+                row[status_i] = db.status_title(row[status_i])
+                for i in time_i:
+                    row[i] = db.fmt_ts(row[i])
+            n += 1
+            yield row
+    counts[table] = n
+
+
+def _write_csv_zip(path, tables):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, rows in tables:
+            with zf.open(f"{name}.csv", "w", force_zip64=True) as raw:
+                with io.TextIOWrapper(raw, encoding="utf-8-sig", newline="") as f:
+                    csv.writer(f).writerows(rows)
+
+
+def _write_xlsx(path, tables):
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+
+    wb = Workbook(write_only=True)  # строки сразу уходят во временные файлы листов
+    for name, rows in tables:
+        header = next(rows)
+        part, ws, n = 1, None, XLSX_MAX_ROWS
+        for row in rows:
+            if n >= XLSX_MAX_ROWS:
+                ws = wb.create_sheet(name if part == 1 else f"{name}_{part}")
+                ws.append(header)
+                part, n = part + 1, 1
+            ws.append([ILLEGAL_CHARACTERS_RE.sub("", v) if isinstance(v, str) else v for v in row])
+            n += 1
+        if ws is None:
+            wb.create_sheet(name).append(header)
+    wb.save(path)
+
+
+def build(path: str, fmt: str, filters: dict) -> dict:
+    """
+    Записать выгрузку в path (блокирующе — вызывать не из event loop). Возвращает {таблица: строк}.
+    """
+    counts = {}
+    conns = [db.get_readonly_conn()]
+    try:
+        conns += [db.archive_conn(month) for month in db.archive_months()]
+        for conn in conns:
+            conn.execute("BEGIN")  # один снимок БД (и каждого файла архива) на все таблицы
+        tables = [(t, _table_rows(conns, t, filters, counts)) for t in db.EXPORT_TABLES]
+        if fmt == "xlsx":
+            _write_xlsx(path, tables)
+        else:
+            _write_csv_zip(path, tables)
+    finally:
+        for conn in conns:
+            conn.close()
+    return counts
+
+
+async def run(bot, message):
+    chat_id = message.chat.id
+    try:
+        fmt, filters = parse_args(message.text)
+    except ExportError as e:
+        sender.reply(message, f"Экспорт: {e}")
+        return
+    if fmt == "xlsx":
+        try:
+            import openpyxl  # noqa: F401
+        except ImportError:
+            sender.reply(message, "Для XLSX нужен пакет openpyxl (pip install openpyxl). Пока можно /export csv.")
+            return
+
+    sender.reply(message, "⏳ Готовлю выгрузку…")
+    ext = "xlsx" if fmt == "xlsx" else "zip"
+    fd, path = tempfile.mkstemp(suffix="." + ext)
+    os.close(fd)
+    try:
+        counts = await asyncio.to_thread(build, path, fmt, filters)
+        size = os.path.getsize(path)
+        if size > TELEGRAM_MAX_UPLOAD:
+            sender.reply(message, f"Выгрузка {size / 2**20:.0f} МБ — больше лимита Telegram (50 МБ). Сузь фильтры.")
+            return
+        caption = "Экспорт: " + ", ".join(f"{t} {n}" for t, n in counts.items())
+        filename = f"export_{db.now_local():%Y%m%d_%H%M}.{ext}"
+        await sender.submit(chat_id, lambda: bot.send_document(chat_id, FSInputFile(path, filename=filename),
+                                                               caption=caption))
+    except Exception:
+        log.exception("export failed")
+        sender.reply(message, "❌ Не удалось сделать или отправить выгрузку.")
+    finally:
+        os.remove(path)
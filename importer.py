@@ -0,0 +1,219 @@
+# importer.py
+"""
+Импорт сотрудников и задач из CSV/JSONL (/import).
+Файл скачивается во временный файл и читается построчно, целиком в память не загружается.
+Строки проверяются и пишутся пачками по IMPORT_BATCH_SIZE — каждая пачка своей транзакцией;
+ошибочные строки пропускаются и попадают в отчёт. Прогресс — одно сообщение, которое редактируется.
+
+Поля (CSV — заголовок, разделитель , или ;; JSONL — объект на строку):
+    type         user | task (если пусто: есть title — task, иначе user)
+    telegram_id  сотрудник / исполнитель задачи
+    full_name, department                      — для user
+    title, description, deadline, status       — для task; deadline: 2026-01-20 или 2026-01-20 18:00,
+                                                 status — название статуса (по умолчанию "Новая")
+"""
+import codecs
+import csv
+import io
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from aiogram.types import BufferedInputFile
+
+import db
+import repo
+import scheduler
+import sender
+from config import ADMIN_TELEGRAM_ID, IMPORT_BATCH_SIZE, IMPORT_MAX_MB
+
+log = logging.getLogger(__name__)
+
+PROGRESS_EVERY = 2.0  # секунд между правками сообщения о прогрессе
+MAX_REPORTED_ERRORS = 5000
+
+_STATUS_CODES = {title.lower(): code for code, title in db.STATUS_TITLES.items()}
+
+
+class RowError(ValueError):
+    pass
+
+
+def _detect_encoding(path) -> str:
+    # Excel сохраняет CSV в utf-8 с BOM или в cp1251
+    with open(path, "rb") as f:
+        head = f.read(64 * 1024)
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head)  # обрезанный в конце символ — не ошибка
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp1251"
+
+
+def iter_rows(f, fmt: str):
+    """
+    (номер строки, dict | RowError) — по одной, без чтения файла целиком.
+    """
+    if fmt == "csv":
+        header = f.readline()
+        f.seek(0)
+        delimiter = ";" if header.count(";") > header.count(",") else ","
+        reader = csv.DictReader(f, delimiter=delimiter)
+        reader.fieldnames = [(n or "").strip().lower() for n in reader.fieldnames or []]
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for n, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield n, RowError(f"JSON: {e.msg}")
+            continue
+        yield n, obj if isinstance(obj, dict) else RowError("ожидается JSON-объект")
+
+
+def _field(raw: dict, name: str) -> str:
+    v = raw.get(name)
+    return "" if v is None else str(v).strip()
+
+
+def _deadline(value: str) -> int:
+    try:
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        raise RowError("deadline: формат 2026-01-20 или 2026-01-20 18:00")
+    if len(value) == 10:
+        dt = dt.replace(hour=23, minute=59)
+    return db.to_ts(dt)
+
+
+def parse_row(raw: dict, known: dict):
+    """
+    ("user", (tg_id, ФИО, отдел)) или ("task", (title, desc, status, deadline, owner_id, отдел)).
+    known: tg_id -> отдел активных сотрудников (дополняется строками user этого же файла).
+    """
+    kind = _field(raw, "type").lower() or ("task" if _field(raw, "title") else "user")
+    try:
+        tg_id = int(_field(raw, "telegram_id"))
+    except ValueError:
+        raise RowError("telegram_id: нужно число")
+    if tg_id == ADMIN_TELEGRAM_ID:
+        raise RowError("telegram_id: это админ")
+
+    if kind == "user":
+        fio, dept = _field(raw, "full_name"), _field(raw, "department")
+        if not fio:
+            raise RowError("full_name: пусто")
+        if dept not in db.DEPARTMENTS:
+            raise RowError("department: " + " / ".join(db.DEPARTMENTS))
+        return "user", (tg_id, fio, dept)
+
+    if kind == "task":
+        title = _field(raw, "title")
+        if not title:
+            raise RowError("title: пусто")
+        if tg_id not in known:
+            raise RowError("telegram_id: нет такого активного сотрудника")
+        status_s = _field(raw, "status").lower()
+        if status_s and status_s not in _STATUS_CODES:
+            raise RowError("status: " + " / ".join(db.STATUS_TITLES.values()))
+        status = _STATUS_CODES[status_s] if status_s else db.STATUS_NEW
+        deadline = _deadline(_field(raw, "deadline"))
+        return "task", (title, _field(raw, "description"), status, deadline, tg_id, known[tg_id])
+
+    raise RowError("type: user или task")
+
+
+def _error_report(errors, total_errors: int) -> bytes:
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["line", "error"])
+    w.writerows(errors)
+    if total_errors > len(errors):
+        w.writerow(["", f"... и ещё {total_errors - len(errors)}"])
+    return buf.getvalue().encode("utf-8-sig")
+
+
+async def run(bot, message, document):
+    """
+    Импорт файла document из сообщения админа message. Итог и отчёт об ошибках — в тот же чат.
+    """
+    chat_id = message.chat.id
+    if document.file_size and document.file_size > IMPORT_MAX_MB * 1024 * 1024:
+        sender.reply(message, f"Файл больше {IMPORT_MAX_MB} МБ.")
+        return
+    name = (document.file_name or "").lower()
+    fmt = "jsonl" if name.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+    progress = await sender.reply(message, "📥 Импорт: загружаю файл…")
+
+    def show(text: str):
+        sender.submit(chat_id, lambda: bot.edit_message_text(text, chat_id=chat_id, message_id=progress.message_id))
+
+    users_n = tasks_n = rows_n = 0
+    errors, errors_n = [], 0
+    batch_users, batch_tasks = [], []
+
+    async def flush():
+        nonlocal users_n, tasks_n
+        if not batch_users and not batch_tasks:
+            return
+        created = await repo.import_batch(batch_users, batch_tasks, message.from_user.id)
+        if created:
+            scheduler.hint(min(fire_at for r in created for fire_at, _ in db.reminder_times(r["deadline"])))
+        users_n += len(batch_users)
+        tasks_n += len(created)
+        batch_users.clear()
+        batch_tasks.clear()
+
+    fd, path = tempfile.mkstemp(suffix="." + fmt)
+    os.close(fd)
+    try:
+        await bot.download(document, destination=path)
+        known = {u["telegram_id"]: u["department"] for u in await repo.list_active_employees()}
+        shown = time.monotonic()
+        with open(path, encoding=_detect_encoding(path), newline="") as f:
+            for line, raw in iter_rows(f, fmt):
+                rows_n += 1
+                try:
+                    if isinstance(raw, RowError):
+                        raise raw
+                    kind, row = parse_row(raw, known)
+                except RowError as e:
+                    errors_n += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append((line, str(e)))
+                    continue
+                if kind == "user":
+                    batch_users.append(row)
+                    known[row[0]] = row[2]
+                else:
+                    batch_tasks.append(row)
+                if len(batch_users) + len(batch_tasks) >= IMPORT_BATCH_SIZE:
+                    await flush()
+                    if time.monotonic() - shown >= PROGRESS_EVERY:
+                        shown = time.monotonic()
+                        show(f"📥 Импорт: строк {rows_n}, сотрудников {users_n}, задач {tasks_n}, ошибок {errors_n}…")
+            await flush()
+    except (UnicodeDecodeError, csv.Error) as e:
+        show(f"❌ Импорт прерван после строки {rows_n}: файл не читается ({e}).\n"
+             f"Записано до этого: сотрудников {users_n}, задач {tasks_n}.")
+        return
+    except Exception:
+        log.exception("import failed")
+        show(f"❌ Импорт прерван после строки {rows_n}: внутренняя ошибка, подробности в логе бота.\n"
+             f"Записано до этого: сотрудников {users_n}, задач {tasks_n}.")
+        return
+    finally:
+        os.remove(path)
+
+    show(f"✅ Импорт завершён: строк {rows_n}, сотрудников {users_n}, задач {tasks_n}, ошибок {errors_n}.")
+    if errors_n:
+        report = BufferedInputFile(_error_report(errors, errors_n), filename="import_errors.csv")
+        sender.submit(chat_id, lambda: bot.send_document(chat_id, report, caption=f"Ошибки импорта: {errors_n}"))
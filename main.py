@@ -1,32 +1,62 @@
 import asyncio
 import logging
+import os
 from datetime import datetime, timedelta, time as dtime
 
 from aiogram import Bot, Dispatcher, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.filters import Command
-from aiogram.types import CallbackQuery, Message
-from aiogram.utils.keyboard import InlineKeyboardBuilder
-
-from config import ADMIN_TELEGRAM_ID, BOT_TOKEN
+from aiogram.types import CallbackQuery, InputMediaDocument, InputMediaPhoto, Message
+
+from config import (ADMIN_TELEGRAM_ID, ARCHIVE_CRON, BOT_MODE, BOT_TOKEN, COUNTERS_CHECK_CRON, DAILY_REPORT_CRON,
+                    JOBS_POLL_SECONDS, METRICS_DUMP_FILE, METRICS_DUMP_SECONDS, METRICS_HOST, METRICS_PORT,
+                    OUTBOX_POLL_SECONDS, PAGE_SIZE, SEND_GLOBAL_RATE, TASK_DETAIL_ITEMS, TELEGRAM_API_URL,
+                    USER_CACHE_TTL_SECONDS, WORKERS)
+import archive
+import cluster
 import db
+import digest
+import exporter
+import importer
+import metrics
+import outbox
+import render
+import repo
+import scheduler
+import sender
+import state
+import webhook
 
 logging.basicConfig(level=logging.INFO)
 
-WAIT = {}  # tg_id -> state dict
+WAIT = state.create_store()  # tg_id -> state dict
+
+# экраны-списки задач: view -> параметры выборки и тексты
+LIST_VIEWS = {
+    "active": {"title": "📌 Все активные", "empty": "Активных задач нет.",
+               "statuses": db.ACTIVE_STATUSES, "by": "deadline", "admin": True},
+    "review": {"title": "🟨 На проверке", "empty": "Нет задач на проверке.",
+               "statuses": (db.STATUS_ON_REVIEW,), "by": "deadline", "admin": True},
+    "done": {"title": "✅ Завершенные", "empty": "Завершенных нет.",
+             "statuses": (db.STATUS_DONE,), "by": "updated", "admin": True},
+    "overdue": {"title": "🟥 Просроченные", "empty": "Просроченных нет.",
+                "statuses": db.ACTIVE_STATUSES, "by": "deadline", "admin": True, "overdue": True},
+    "my": {"title": "📌 Мои задачи", "empty": "Нет активных задач.",
+           "statuses": db.ACTIVE_STATUSES, "by": "deadline", "admin": False},
+    "myreview": {"title": "🟨 Мои на проверке", "empty": "Нет задач на проверке.",
+                 "statuses": (db.STATUS_ON_REVIEW,), "by": "deadline", "admin": False},
+    "mydone": {"title": "✅ Завершенные", "empty": "Завершенных задач нет.",
+               "statuses": (db.STATUS_DONE,), "by": "updated", "admin": False},
+}
 
 
 def is_admin(tg_id: int) -> bool:
     return tg_id == ADMIN_TELEGRAM_ID
 
 
-def get_user(conn, tg_id: int):
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE telegram_id=?", (tg_id,))
-    return cur.fetchone()
-
-
-def is_employee_active(conn, tg_id: int) -> bool:
-    u = get_user(conn, tg_id)
+async def is_employee_active(tg_id: int) -> bool:
+    u = await repo.get_user(tg_id)
     if not u:
         return False
     if u["role"] != "employee":
@@ -34,67 +64,194 @@ def is_employee_active(conn, tg_id: int) -> bool:
     return int(u["is_active"]) == 1
 
 
-async def notify_admin(bot: Bot, text: str):
-    try:
-        await bot.send_message(ADMIN_TELEGRAM_ID, text, disable_notification=False)
-    except Exception:
-        pass
+async def dialog_allowed(tg_id: int) -> bool:
+    """
+    Можно ли сотруднику продолжить начатый диалог (комментарий, файл). Строка users — мимо кэша: при WORKERS > 1
+    его отключает админ в другом процессе, и кэш пользователей здесь ещё до USER_CACHE_TTL_SECONDS считает
+    его активным, а диалог лежит в кэше WAIT этого воркера (см. ad_deactivate_btn).
+    """
+    repo.users.invalidate(tg_id)
+    return await is_employee_active(tg_id)
+
+
+ADMIN_DIGEST = digest.Digest(
+    lambda text, kb: sender.send_message(ADMIN_TELEGRAM_ID, text, priority=sender.PRIO_NOTIFY,
+                                         disable_notification=False, reply_markup=kb),
+    titles={"review": "🟨 Сдано на проверку", "users": "👥 Сотрудники", "push": "⚠️ PUSH не доставлен",
+            "overdue": "🟥 Просрочены"},
+    extra={"review": ("🟨 На проверке — все", "dash:r:0"), "overdue": ("🟥 Просроченные — все", "dash:o:0")},
+)
+
+
+def notify_admin(text: str, category: str = None, line: str = None, task_id: int = None):
+    """
+    Уведомление админу. С категорией — в сводку за окно ADMIN_DIGEST_SECONDS (digest.py), без — сразу.
+    """
+    ADMIN_DIGEST.add(category, text, line, task_id)
+
+
+def notify(chat_id: int, text: str):
+    """
+    Уведомление сотруднику. Ошибки доставки только логируются (заблокировал бота и т.п.).
+    """
+    return sender.send_message(chat_id, text, priority=sender.PRIO_NOTIFY, disable_notification=False)
+
+
+_background = set()  # импорт и экспорт, запущенные из хендлеров: event loop держит на задачи только слабые ссылки
+
+
+def run_background(coro):
+    """
+    Запустить долгую работу (импорт, экспорт), не задерживая хендлер. Ошибка, не обработанная внутри, — в лог.
+    """
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background_done)
+
+
+def _background_done(task: asyncio.Task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("background task failed", exc_info=task.exception())
 
 
 # ---------- Keyboards ----------
 
+@render.static
 def kb_admin_main():
-    b = InlineKeyboardBuilder()
-    b.button(text="➕ Создать задачу", callback_data="ad:newtask")
-    b.button(text="📌 Все активные", callback_data="ad:active")
-    b.button(text="🟨 На проверке", callback_data="ad:review")
-    b.button(text="✅ Завершенные", callback_data="ad:done")
-    b.button(text="🟥 Просроченные", callback_data="ad:overdue")
-    b.button(text="👥 Пользователи", callback_data="ad:users")
-    b.adjust(2)
-    return b.as_markup()
+    return render.markup([
+        [("➕ Создать задачу", "ad:newtask")],
+        [("📌 Все активные", "ad:active"), ("📊 Просрочка и проверка", "ad:dash")],
+        [("✅ Завершенные", "ad:done"), ("👥 Пользователи", "ad:users")],
+    ])
 
 
+@render.static
 def kb_employee_main():
-    b = InlineKeyboardBuilder()
-    b.button(text="📌 Мои задачи", callback_data="em:my")
-    b.button(text="🟨 Мои на проверке", callback_data="em:myreview")
-    b.button(text="✅ Завершенные", callback_data="em:done")
-    b.adjust(1)
-    return b.as_markup()
-
-
-def kb_employee_task(task_id: int, status: str):
-    b = InlineKeyboardBuilder()
-    if status == db.STATUS_NEW:
-        b.button(text="▶️ В процессе", callback_data=f"t:{task_id}:inprog")
-    if status == db.STATUS_IN_PROGRESS:
-        b.button(text="🟨 На проверке", callback_data=f"t:{task_id}:review")
-    b.button(text="💬 Комментарий", callback_data=f"t:{task_id}:comment")
-    b.button(text="📎 Файл", callback_data=f"t:{task_id}:file")
-    b.adjust(2)
-    return b.as_markup()
-
-
-def kb_admin_task(task_id: int, status: str):
-    b = InlineKeyboardBuilder()
-    if status == db.STATUS_ON_REVIEW:
-        b.button(text="✅ Принять (Готово)", callback_data=f"t:{task_id}:done")
-        b.button(text="↩️ Вернуть (В процессе)", callback_data=f"t:{task_id}:back")
-    b.button(text="🗓 Изменить срок", callback_data=f"t:{task_id}:chgdl")
-    b.button(text="🗑 Отменить задачу", callback_data=f"t:{task_id}:cancel")
-    b.adjust(2)
-    return b.as_markup()
-
-
-def kb_pick_employee(active_users):
-    b = InlineKeyboardBuilder()
-    for u in active_users:
-        title = f"{u['full_name']} ({u['department']})"
-        b.button(text=title, callback_data=f"ad:pick:{u['telegram_id']}")
-    b.button(text="❌ Отмена", callback_data="ad:pickcancel")
-    b.adjust(1)
-    return b.as_markup()
+    return render.markup(render.grid([
+        ("📌 Мои задачи", "em:my"),
+        ("🟨 Мои на проверке", "em:myreview"),
+        ("✅ Завершенные", "em:done"),
+    ]))
+
+
+# кнопки действий с задачей по статусу: (текст, действие в callback t:<id>:<действие>), по две в ряд
+EMPLOYEE_TASK_ACTIONS = render.TaskActions({
+    status: ([("▶️ В процессе", "inprog")] if status == db.STATUS_NEW else [])
+    + ([("🟨 На проверке", "review")] if status == db.STATUS_IN_PROGRESS else [])
+    + [("💬 Комментарий", "comment"), ("📎 Файл", "file")]
+    for status in db.ALL_STATUSES
+})
+ADMIN_TASK_ACTIONS = render.TaskActions({
+    status: ([("✅ Принять (Готово)", "done"), ("↩️ Вернуть (В процессе)", "back")]
+             if status == db.STATUS_ON_REVIEW else [])
+    + [("🗓 Изменить срок", "chgdl"), ("🗑 Отменить задачу", "cancel")]
+    for status in db.ALL_STATUSES
+})
+
+
+def kb_employee_task(task_id: int, status: int):
+    return EMPLOYEE_TASK_ACTIONS.get(task_id, status)
+
+
+def kb_admin_task(task_id: int, status: int):
+    return ADMIN_TASK_ACTIONS.get(task_id, status)
+
+
+def kb_task_detail(detail, admin: bool):
+    """
+    Кнопки действий (у открытой задачи) + переслать файлы / показать историю раньше.
+    """
+    t = detail["task"]
+    actions = None
+    if t["status"] not in (db.STATUS_DONE, db.STATUS_CANCELED):
+        actions = kb_admin_task(t["id"], t["status"]) if admin else kb_employee_task(t["id"], t["status"])
+    extra = []
+    if detail["files_n"]:
+        extra.append((f"📎 Файлы ({detail['files_n']})", f"t:{t['id']}:files"))
+    if detail["history_more"]:
+        extra.append(("🕘 Раньше", f"th:{t['id']}:{detail['history'][-1]['id']}"))
+    if not extra:
+        return actions
+    return render.join(actions, render.markup([extra]))
+
+
+@render.memo
+def task_button(task_id: int, title: str):
+    return render.button(f"#{task_id} {title}"[:40], f"t:{task_id}:open")
+
+
+def kb_task_page(view: str, rows, has_prev: bool, has_next: bool, owner_id=None):
+    """
+    Кнопка на каждую задачу страницы (открыть карточку) + навигация.
+    В callback листания — ключ крайней задачи: pg:<view>:<p|n>:<id>:<deadline|updated_at>[:<сотрудник>]
+    """
+    key = "updated_at" if LIST_VIEWS[view]["by"] == "updated" else "deadline"
+    owner = f":{owner_id}" if owner_id else ""
+    nav = []
+    if has_prev:
+        first = rows[0]
+        nav.append(("⬅️", f"pg:{view}:p:{first['id']}:{first[key]}{owner}"))
+    if has_next:
+        last = rows[-1]
+        nav.append(("➡️", f"pg:{view}:n:{last['id']}:{last[key]}{owner}"))
+    return render.markup([*([task_button(r["id"], r["title"])] for r in rows), nav])
+
+
+DASHBOARD_BUTTONS = 6  # кнопок "список сотрудника" на раздел сводки
+DASHBOARD_SECTIONS = {"o": "overdue", "r": "review"}  # callback dash:<раздел>:<сотрудник | 0 — все> -> LIST_VIEWS
+
+
+def kb_dashboard(d):
+    """
+    Самые загруженные сотрудники каждого раздела и "все" — открывают обычный постраничный список.
+    """
+    rows = []
+    for code, view in DASHBOARD_SECTIONS.items():
+        if not d[view]:
+            continue
+        icon, title = LIST_VIEWS[view]["title"].split(" ", 1)
+        top = sorted(d[view], key=lambda r: -r["n"])[:DASHBOARD_BUTTONS]
+        buttons = []
+        for r in top:
+            name = (r["full_name"] or str(r["owner_telegram_id"]))[:24]
+            buttons.append((f"{icon} {name} · {r['n']}", f"dash:{code}:{r['owner_telegram_id']}"))
+        rows += render.grid(buttons, 2)
+        rows.append([(f"{icon} {title} — все", f"dash:{code}:0")])
+    return render.markup(rows) if rows else None
+
+
+def kb_search_page(rows, offset: int, has_next: bool):
+    """
+    Результаты /find: кнопка на задачу + листание fd:<offset>. Сам запрос — в первой строке сообщения.
+    """
+    nav = []
+    if offset > 0:
+        nav.append(("⬅️", f"fd:{max(0, offset - PAGE_SIZE)}"))
+    if has_next:
+        nav.append(("➡️", f"fd:{offset + PAGE_SIZE}"))
+    return render.markup([*([task_button(r["id"], r["title"])] for r in rows), nav])
+
+
+def kb_pick_employee(active_users, depts):
+    """
+    depts: отделы активных сотрудников; в callback — индекс в этом списке (он же в WAIT).
+    """
+    return render.markup(render.grid([
+        *((f"{u['full_name']} ({u['department']})", f"ad:pick:{u['telegram_id']}") for u in active_users),
+        ("👥 Несколько сотрудников", "ad:multi"),
+        *((f"🏢 Весь отдел: {d}", f"ad:dept:{i}") for i, d in enumerate(depts)),
+        ("❌ Отмена", "ad:pickcancel"),
+    ]))
+
+
+def kb_pick_many(active_users, selected):
+    return render.markup(render.grid([
+        *((f"{'✅' if u['telegram_id'] in selected else '▫️'} {u['full_name']} ({u['department']})",
+           f"ad:ms:{u['telegram_id']}") for u in active_users),
+        (f"Готово ({len(selected)})", "ad:msdone"),
+        ("❌ Отмена", "ad:pickcancel"),
+    ]))
 
 
 def kb_users_list(employees):
@@ -102,140 +259,277 @@ def kb_users_list(employees):
     Список сотрудников кнопками.
     employees: list[sqlite3.Row] columns: telegram_id, full_name, department, is_active
     """
-    b = InlineKeyboardBuilder()
-    for u in employees:
-        icon = "🟢" if int(u["is_active"]) == 1 else "🔴"
-        text = f"{icon} {u['full_name']} — {u['department']}"
-        b.button(text=text, callback_data=f"ad:user:{u['telegram_id']}")
-    b.button(text="⬅️ Назад в меню", callback_data="ad:back_main")
-    b.adjust(1)
-    return b.as_markup()
+    return render.markup(render.grid([
+        *((f"{'🟢' if int(u['is_active']) == 1 else '🔴'} {u['full_name']} — {u['department']}",
+           f"ad:user:{u['telegram_id']}") for u in employees),
+        ("⬅️ Назад в меню", "ad:back_main"),
+    ]))
 
 
 def kb_user_actions(user_row):
     """
     Карточка сотрудника: активировать/удалить(отключить)
     """
-    b = InlineKeyboardBuilder()
     tg_id = user_row["telegram_id"]
     if int(user_row["is_active"]) == 1:
-        b.button(text="🗑 Удалить сотрудника (отключить)", callback_data=f"ad:deact:{tg_id}")
+        toggle = ("🗑 Удалить сотрудника (отключить)", f"ad:deact:{tg_id}")
     else:
-        b.button(text="✅ Активировать сотрудника", callback_data=f"ad:act:{tg_id}")
-    b.button(text="⬅️ К списку сотрудников", callback_data="ad:users")
-    b.adjust(1)
-    return b.as_markup()
+        toggle = ("✅ Активировать сотрудника", f"ad:act:{tg_id}")
+    return render.markup([[toggle], [("⬅️ К списку сотрудников", "ad:users")]])
 
 
 # ---------- Dates / formatting ----------
 
+def deadline_in_days(days: int) -> int:
+    d = db.now_local().date() + timedelta(days=days)
+    return db.to_ts(datetime.combine(d, dtime(23, 59)))
+
+
 def deadline_today():
-    d = datetime.now().date()
-    return datetime.combine(d, dtime(23, 59)).isoformat(timespec="seconds")
+    return deadline_in_days(0)
 
 
 def deadline_end_of_week():
-    d = datetime.now().date()
-    days_ahead = 6 - d.weekday()
-    target = d + timedelta(days=days_ahead)
-    return datetime.combine(target, dtime(23, 59)).isoformat(timespec="seconds")
+    return deadline_in_days(6 - db.now_local().weekday())
 
 
 def format_task(row) -> str:
+    return _format_task(row["id"], row["department"], row["status"], row["deadline"], row["title"],
+                        row["description"])
+
+
+@render.memo
+def _format_task(task_id: int, department: str, status: int, deadline: int, title: str, description: str) -> str:
     return (
-        f"Задача #{row['id']}\n"
-        f"Отдел: {row['department']}\n"
-        f"Статус: {row['status']}\n"
-        f"Срок: {row['deadline']}\n"
-        f"Название: {row['title']}\n"
-        f"Описание: {row['description']}"
+        f"Задача #{task_id}\n"
+        f"Отдел: {department}\n"
+        f"Статус: {db.status_title(status)}\n"
+        f"Срок: {db.fmt_ts(deadline)}\n"
+        f"Название: {title}\n"
+        f"Описание: {description}"
     )
 
 
-async def push_task_assigned(bot: Bot, target_id: int, task_row):
+AUDIT_TITLES = {
+    "CREATE_TASK": "создана",
+    "STATUS": "статус",
+    "CHANGE_DEADLINE": "срок",
+    "COMMENT": "комментарий",
+    "ADD_FILE": "файл",
+}
+MESSAGE_MAX_LEN = 4096
+MEDIA_GROUP_MAX = 10  # предел Telegram на одну медиагруппу
+FILES_RESEND_MAX = 30
+
+
+def fmt_iso(value: str) -> str:
+    # отметки времени комментариев, файлов и журнала: 2026-01-20T18:00:00 -> 2026-01-20 18:00
+    return value[:16].replace("T", " ")
+
+
+def format_history_line(row) -> str:
+    who = row["full_name"] or row["actor_telegram_id"]
+    action = AUDIT_TITLES.get(row["action"], row["action"])
+    return f"{fmt_iso(row['created_at'])} · {who}: {action} {row['details'] or ''}".rstrip()
+
+
+def format_task_detail(detail) -> str:
+    parts = [format_task(detail["task"])]
+    if detail["comments"]:
+        parts.append("💬 Комментарии:\n" + "\n".join(
+            f"{fmt_iso(c['created_at'])} · {c['full_name'] or c['author_telegram_id']}: {c['text'][:300]}"
+            for c in reversed(detail["comments"])
+        ))
+    if detail["files_n"]:
+        names = ", ".join(f["file_name"] or "файл" for f in reversed(detail["files"]))
+        rest = detail["files_n"] - len(detail["files"])
+        parts.append(f"📎 Файлы ({detail['files_n']}): {names}" + (f" и ещё {rest}" if rest else ""))
+    if detail["history"]:
+        parts.append("🕘 История:\n" + "\n".join(format_history_line(r) for r in detail["history"]))
+    return "\n\n".join(parts)[:MESSAGE_MAX_LEN]
+
+
+def format_task_line(row) -> str:
+    return _format_task_line(row["id"], row["status"], row["deadline"], row["department"], row["title"])
+
+
+@render.memo
+def _format_task_line(task_id: int, status: int, deadline: int, department: str, title: str) -> str:
+    return f"#{task_id} · {db.status_title(status)} · до {db.fmt_ts(deadline)} · {department}\n{title[:100]}"
+
+
+def format_task_page(title: str, rows) -> str:
+    return title + "\n\n" + "\n\n".join(format_task_line(r) for r in rows)
+
+
+def format_dashboard(d) -> str:
     """
-    Push = новое сообщение от бота (disable_notification=False).
+    Одно сообщение: по каждому разделу — всего, затем отделы и сотрудники (больше задач — раньше).
     """
-    await bot.send_message(
-        target_id,
-        f"🔔 НОВАЯ ЗАДАЧА #{task_row['id']}\n"
-        f"Срок: {task_row['deadline']}\n"
-        f"Название: {task_row['title']}",
-        disable_notification=False
-    )
-    await bot.send_message(
+    parts = [f"📊 Сводка на {db.fmt_ts(d['at'])}"]
+    for view in DASHBOARD_SECTIONS.values():
+        title, rows = LIST_VIEWS[view]["title"], d[view]
+        if not rows:
+            parts.append(f"{title}: нет")
+            continue
+        lines = [f"{title}: {sum(r['n'] for r in rows)}"]
+        depts = {}
+        for r in rows:
+            depts.setdefault(r["department"], []).append(r)
+        for dept, people in depts.items():
+            names = ", ".join(
+                f"{p['full_name'] or p['owner_telegram_id']} {p['n']}"
+                + (f" (с {db.from_ts(p['oldest']).strftime('%d.%m')})" if p["oldest"] is not None else "")
+                for p in people
+            )
+            lines.append(f"{dept} — {sum(p['n'] for p in people)}: {names}")
+        parts.append("\n".join(lines))
+    return "\n\n".join(parts)[:MESSAGE_MAX_LEN]
+
+
+SEARCH_HEADER = "🔎 Поиск: "
+SEARCH_MAX_QUERY = 200
+
+
+def format_search_line(row) -> str:
+    # фрагмент с совпадением — если оно не в названии (название и так в строке задачи)
+    snippet = " ".join(row["snippet"].split())
+    if snippet.replace("«", "").replace("»", "").strip("… ") in db.fold(row["title"]):
+        return format_task_line(row)
+    return f"{format_task_line(row)}\n{snippet}"
+
+
+def format_search_page(query: str, rows, offset: int) -> str:
+    lines = [format_search_line(r) for r in rows]
+    return f"{SEARCH_HEADER}{query}\nРезультаты {offset + 1}–{offset + len(rows)}\n\n" + "\n\n".join(lines)
+
+
+def push_task_assigned(target_id: int, task_row):
+    """
+    Push = новое сообщение от бота (disable_notification=False): заголовок, карточка и кнопки — одним
+    сообщением, чтобы outbox по его future знал, дошло ли уведомление целиком (и повтор не слал дубли).
+    Вызывается из outbox: в хендлерах задача только записывается вместе с уведомлением.
+    """
+    return sender.send_message(
         target_id,
-        format_task(task_row),
+        f"🔔 НОВАЯ ЗАДАЧА #{task_row['id']}\n\n{format_task(task_row)}",
+        priority=sender.PRIO_NOTIFY,
         reply_markup=kb_employee_task(task_row["id"], task_row["status"]),
         disable_notification=False
     )
 
 
-# ---------- Daily report to admin ----------
+STATUS_NOTICES = {
+    db.STATUS_DONE: "✅ Задача #{id} принята. Статус: Готово.",
+    db.STATUS_IN_PROGRESS: "↩️ Задача #{id} возвращена: В процессе.",
+    db.STATUS_CANCELED: "🗑 Задача #{id} отменена админом.",
+}
 
-async def daily_report_loop(bot: Bot):
-    last_date = None
-    while True:
-        now = datetime.now()
-        if now.hour == 9 and now.minute == 0:
-            if last_date != now.date():
-                conn = db.get_conn()
-                cur = conn.cursor()
 
-                cur.execute(
-                    "SELECT COUNT(*) c FROM tasks WHERE status IN (?,?,?) AND deadline < ?",
-                    (*db.ACTIVE_STATUSES, db.now_iso()),
-                )
-                overdue = cur.fetchone()["c"]
+async def deliver_task_assigned(chat_id: int, payload: dict):
+    t = await repo.get_task(payload["task_id"])
+    if not t or t["owner_telegram_id"] != chat_id or t["status"] not in (db.STATUS_NEW, db.STATUS_IN_PROGRESS):
+        return None  # задачу уже отменили, закрыли или передали — новость устарела
+    return push_task_assigned(chat_id, t)
 
-                cur.execute("SELECT COUNT(*) c FROM tasks WHERE status=?", (db.STATUS_ON_REVIEW,))
-                review = cur.fetchone()["c"]
 
-                cur.execute("SELECT COUNT(*) c FROM tasks WHERE status IN (?,?,?)", (*db.ACTIVE_STATUSES,))
-                active = cur.fetchone()["c"]
+async def deliver_task_status(chat_id: int, payload: dict):
+    return notify(chat_id, STATUS_NOTICES[payload["status"]].format(id=payload["task_id"]))
 
-                conn.close()
 
-                text = (
-                    "Ежедневный отчет 09:00\n"
-                    f"Просроченные: {overdue}\n"
-                    f"На проверке: {review}\n"
-                    f"Активные: {active}"
-                )
-                await bot.send_message(ADMIN_TELEGRAM_ID, text, disable_notification=False)
-                last_date = now.date()
-        await asyncio.sleep(20)
+async def deliver_task_deadline(chat_id: int, payload: dict):
+    change = f"{db.fmt_ts(payload['old'])} → {db.fmt_ts(payload['new'])}"
+    return notify(chat_id, f"🗓 Срок задачи #{payload['task_id']} изменён: {change}")
 
 
-# ================== MAIN ==================
+def report_push_failure(target_id: int, payload: dict):
+    task_id = payload.get("task_id")
+    notify_admin(
+        f"⚠️ PUSH НЕ ДОСТАВЛЕН сотруднику id={target_id} (он мог не нажать /start или заблокировал бота). "
+        "Уйдёт, когда сотрудник напишет /start.",
+        "push", line=f"id={target_id}" + (f" · задача #{task_id}" if task_id else ""), task_id=task_id,
+    )
 
-async def main():
-    if not BOT_TOKEN:
-        raise RuntimeError("BOT_TOKEN пустой. Проверь файл .env")
-    if ADMIN_TELEGRAM_ID == 0:
-        raise RuntimeError("ADMIN_TELEGRAM_ID пустой. Проверь файл .env")
 
-    db.init_db(ADMIN_TELEGRAM_ID)
+async def report_bulk_push(admin_id: int, total: int, parked):
+    """
+    Рассылка по массово созданным задачам закончилась: итог админу — сколько доставлено, кому нет.
+    """
+    text = f"📨 Рассылка по {total} задачам: доставлено {total - len(parked)}, не доставлено {len(parked)}."
+    if parked:
+        names = {u["telegram_id"]: u["full_name"] for u in await repo.list_active_employees()}
+        text += "\n" + "\n".join(
+            f"• {names.get(chat_id, chat_id)} (#{payload.get('task_id')})" for chat_id, payload in parked
+        )
+        text += "\n(не нажали /start или заблокировали бота)"
+    sender.send_message(admin_id, text, priority=sender.PRIO_NOTIFY)
 
-    bot = Bot(BOT_TOKEN)
-    dp = Dispatcher()
 
-    print("Бот запущен. PowerShell не закрывать.")
+# ---------- Scheduled jobs ----------
+
+async def daily_report(payload: dict):
+    c = await repo.report_counts()
+
+    text = (
+        f"Ежедневный отчет {db.now_local():%H:%M}\n"
+        f"Просроченные: {c['overdue']}\n"
+        f"На проверке: {c['review']}\n"
+        f"Активные: {c['active']}"
+    )
+    sender.send_message(ADMIN_TELEGRAM_ID, text, priority=sender.PRIO_BULK, disable_notification=False)
+
+
+async def counters_check(payload: dict):
+    diff = await repo.check_counters(fix=True)
+    if diff:
+        logging.warning("task_counters rebuilt, %d mismatches: %s", len(diff), diff[:10])
+
+
+async def archive_old(payload: dict):
+    await asyncio.to_thread(archive.run)
+
+
+async def task_reminder(payload: dict):
+    t = await repo.get_task(payload["task_id"])
+    if not t or t["status"] not in (db.STATUS_NEW, db.STATUS_IN_PROGRESS):
+        return
+    hours = payload["hours"]
+    deadline = db.fmt_ts(t["deadline"])
+    if hours == 0:
+        notify(t["owner_telegram_id"], f"🟥 Задача #{t['id']} просрочена: {t['title']}\nСрок: {deadline}")
+        notify_admin(f"🟥 Просрочена задача #{t['id']}: {t['title']}\nСрок: {deadline}", "overdue",
+                     line=f"#{t['id']} · {t['department']} · {t['title'][:60]}", task_id=t["id"])
+        return
+    if t["deadline"] <= db.now_ts():
+        return
+    notify(t["owner_telegram_id"], f"⏰ Задача #{t['id']}: до срока осталось меньше {hours} ч\n{t['title']}\nСрок: {deadline}")
+
+
+# ================== MAIN ==================
+
+def build_dispatcher(bot: Bot) -> Dispatcher:
+    """
+    Dispatcher со всеми хендлерами и middleware метрик. Ничего не запускает (БД, планировщик,
+    очередь отправки — в main), поэтому годится и для прогонов без Telegram (bench/scenarios.py).
+    """
+    dp = Dispatcher()
+    dp.message.middleware(metrics.handler_middleware)
+    dp.callback_query.middleware(metrics.handler_middleware)
+    bot.session.middleware(metrics.api_middleware)
 
     # ---------- /start ----------
 
     @dp.message(Command("start"))
     async def start(message: Message):
         if is_admin(message.from_user.id):
-            await message.answer("Админ-режим.", reply_markup=kb_admin_main())
+            sender.reply(message, "Админ-режим.\nПоиск задач: /find слова", reply_markup=kb_admin_main())
             return
 
-        conn = db.get_conn()
-        u = get_user(conn, message.from_user.id)
-        conn.close()
+        u = await repo.get_user(message.from_user.id)
 
         if not u:
-            await message.answer(
+            sender.reply(
+                message,
                 "Ты не добавлен в систему.\n"
                 "Отправь админу свой Telegram ID:\n"
                 f"{message.from_user.id}\n"
@@ -244,13 +538,15 @@ async def main():
             return
 
         if u["role"] == "employee" and int(u["is_active"]) == 0:
-            await message.answer("Твой доступ отключен админом.")
+            sender.reply(message, "Твой доступ отключен админом.")
             return
 
-        await message.answer(
-            f"Режим сотрудника: {u['full_name']} ({u['department']})",
+        sender.reply(
+            message,
+            f"Режим сотрудника: {u['full_name']} ({u['department']})\nПоиск по своим задачам: /find слова",
             reply_markup=kb_employee_main(),
         )
+        await outbox.wake(message.from_user.id)  # недоставленные уведомления о задачах — сейчас
 
     # ---------- Users management (commands) ----------
 
@@ -263,36 +559,80 @@ async def main():
             tg_id_s, fio, dept = [x.strip() for x in payload.split("|")]
             tg_id = int(tg_id_s)
         except Exception:
-            await message.answer("Формат: /add_user 111|ФИО|Отдел")
+            sender.reply(message, "Формат: /add_user 111|ФИО|Отдел")
             return
-        if dept not in ("Снабжение", "Финансы", "Бухгалтерия"):
-            await message.answer("Отдел: Снабжение / Финансы / Бухгалтерия")
+        if dept not in db.DEPARTMENTS:
+            sender.reply(message, "Отдел: " + " / ".join(db.DEPARTMENTS))
             return
 
-        conn = db.get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO users(telegram_id, full_name, department, role, is_active)
-            VALUES(?,?,?,?,1)
-            ON CONFLICT(telegram_id) DO UPDATE SET
-                full_name=excluded.full_name,
-                department=excluded.department,
-                role='employee',
-                is_active=1
-            """,
-            (tg_id, fio, dept, "employee"),
+        await repo.upsert_employee(tg_id, fio, dept, message.from_user.id)
+
+        sender.reply(message, f"Ок. Добавлен/обновлён: {fio} ({dept})")
+        notify_admin(f"✅ УСПЕШНО: сотрудник добавлен/обновлён — {fio} ({dept}) id={tg_id}", "users",
+                     line=f"добавлен/обновлён: {fio} ({dept}) id={tg_id}")
+        notify(tg_id, "Тебя добавили в систему. Напиши /start.")
+
+    @dp.message(Command("import"))
+    async def import_cmd(message: Message):
+        if not is_admin(message.from_user.id):
+            return
+        await WAIT.set(message.from_user.id, {"step": "import"})
+        sender.reply(
+            message,
+            "Пришли файл CSV (заголовок, разделитель , или ;) или JSONL (объект на строку).\n"
+            "Сотрудник: type=user, telegram_id, full_name, department\n"
+            "Задача: type=task, telegram_id, title, description, deadline (2026-01-20 или 2026-01-20 18:00), "
+            "status (необязательно)\n"
+            f"Отделы: {', '.join(db.DEPARTMENTS)}",
         )
-        conn.commit()
-        db.audit(conn, None, message.from_user.id, "ADD_USER", f"{tg_id}|{fio}|{dept}")
-        conn.close()
 
-        await message.answer(f"Ок. Добавлен/обновлён: {fio} ({dept})")
-        await notify_admin(bot, f"✅ УСПЕШНО: сотрудник добавлен/обновлён — {fio} ({dept}) id={tg_id}")
-        try:
-            await bot.send_message(tg_id, "Тебя добавили в систему. Напиши /start.", disable_notification=False)
-        except Exception:
-            pass
+    @dp.message(Command("export"))
+    async def export_cmd(message: Message):
+        if not is_admin(message.from_user.id):
+            return
+        run_background(exporter.run(message.bot, message))
+
+    # ---------- Search ----------
+
+    async def search_owner(tg_id: int):
+        """
+        Чьи задачи ищет пользователь: админ — все (None), активный сотрудник — свои, иначе — False.
+        """
+        if is_admin(tg_id):
+            return None
+        return tg_id if await is_employee_active(tg_id) else False
+
+    async def show_search(message: Message, user_id: int, query: str, offset: int = 0, edit: bool = False):
+        owner = await search_owner(user_id)
+        if owner is False:
+            return sender.reply(message, "Доступ отключен.")
+        rows, has_next = await repo.search_tasks(query, owner_id=owner, offset=offset, limit=PAGE_SIZE)
+        if not rows:
+            if edit:
+                return
+            return sender.reply(message, "Ничего не найдено." if offset == 0 else "Больше ничего не найдено.")
+        text = format_search_page(query, rows, offset)
+        kb = kb_search_page(rows, offset, has_next)
+        if edit:
+            await message.edit_text(text, reply_markup=kb)
+        else:
+            sender.reply(message, text, reply_markup=kb)
+
+    @dp.message(Command("find"))
+    async def find_cmd(message: Message):
+        query = " ".join(message.text.split()[1:])[:SEARCH_MAX_QUERY]
+        if not db.search_query(query):
+            return sender.reply(message, "Формат: /find слова из названия, описания или комментариев")
+        await show_search(message, message.from_user.id, query)
+
+    @dp.callback_query(F.data.startswith("fd:"))
+    async def find_page(call: CallbackQuery):
+        await call.answer()
+        first = (call.message.text or "").split("\n", 1)[0]
+        if not first.startswith(SEARCH_HEADER):
+            return
+        await show_search(call.message, call.from_user.id, first[len(SEARCH_HEADER):],
+                          offset=int(call.data.split(":")[1]), edit=True)
 
     # ---------- Admin menu navigation ----------
 
@@ -300,7 +640,7 @@ async def main():
     async def ad_back_main(call: CallbackQuery):
         if not is_admin(call.from_user.id):
             return await call.answer()
-        await call.message.answer("Админ-меню:", reply_markup=kb_admin_main())
+        sender.reply(call.message, "Админ-меню:", reply_markup=kb_admin_main())
         await call.answer()
 
     # ---------- Admin: Users (LIST as buttons) ----------
@@ -310,21 +650,13 @@ async def main():
         if not is_admin(call.from_user.id):
             return await call.answer()
 
-        conn = db.get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT telegram_id, full_name, department, is_active "
-            "FROM users WHERE role='employee' "
-            "ORDER BY is_active DESC, department, full_name"
-        )
-        employees = cur.fetchall()
-        conn.close()
+        employees = await repo.list_employees()
 
         if not employees:
-            await call.message.answer("Сотрудников нет. Добавь через /add_user.")
+            sender.reply(call.message, "Сотрудников нет. Добавь через /add_user.")
             return await call.answer()
 
-        await call.message.answer("Сотрудники (нажми на человека):", reply_markup=kb_users_list(employees))
+        sender.reply(call.message, "Сотрудники (нажми на человека):", reply_markup=kb_users_list(employees))
         await call.answer()
 
     # ---------- Admin: User card ----------
@@ -335,28 +667,14 @@ async def main():
             return await call.answer()
 
         tg_id = int(call.data.split(":")[2])
-        conn = db.get_conn()
-        u = get_user(conn, tg_id)
+        u = await repo.get_user(tg_id)
 
         if not u or u["role"] != "employee":
-            conn.close()
-            await call.message.answer("Сотрудник не найден.")
+            sender.reply(call.message, "Сотрудник не найден.")
             return await call.answer()
 
-        cur = conn.cursor()
         # статистика по задачам
-        cur.execute("SELECT COUNT(*) c FROM tasks WHERE owner_telegram_id=?", (tg_id,))
-        total = cur.fetchone()["c"]
-        cur.execute("SELECT COUNT(*) c FROM tasks WHERE owner_telegram_id=? AND status IN (?,?,?)",
-                    (tg_id, *db.ACTIVE_STATUSES))
-        active = cur.fetchone()["c"]
-        cur.execute("SELECT COUNT(*) c FROM tasks WHERE owner_telegram_id=? AND status=?",
-                    (tg_id, db.STATUS_ON_REVIEW))
-        review = cur.fetchone()["c"]
-        cur.execute("SELECT COUNT(*) c FROM tasks WHERE owner_telegram_id=? AND status=?",
-                    (tg_id, db.STATUS_DONE))
-        done = cur.fetchone()["c"]
-        conn.close()
+        c = await repo.user_task_counts(tg_id)
 
         status = "АКТИВЕН" if int(u["is_active"]) == 1 else "ОТКЛЮЧЕН"
         text = (
@@ -366,13 +684,13 @@ async def main():
             f"Telegram ID: {u['telegram_id']}\n"
             f"Статус: {status}\n\n"
             f"Задачи:\n"
-            f"Всего: {total}\n"
-            f"Активные: {active}\n"
-            f"На проверке: {review}\n"
-            f"Завершенные: {done}\n\n"
+            f"Всего: {c['total']}\n"
+            f"Активные: {c['active']}\n"
+            f"На проверке: {c['review']}\n"
+            f"Завершенные: {c['done']}\n\n"
             f"Удаление = отключение доступа. История сохраняется."
         )
-        await call.message.answer(text, reply_markup=kb_user_actions(u))
+        sender.reply(call.message, text, reply_markup=kb_user_actions(u))
         await call.answer()
 
     # ---------- Admin: Deactivate (delete) / Activate from buttons ----------
@@ -383,30 +701,22 @@ async def main():
             return await call.answer()
         tg_id = int(call.data.split(":")[2])
         if tg_id == ADMIN_TELEGRAM_ID:
-            await call.message.answer("Нельзя отключить админа.")
+            sender.reply(call.message, "Нельзя отключить админа.")
             return await call.answer()
 
-        conn = db.get_conn()
-        u = get_user(conn, tg_id)
-        if not u or u["role"] != "employee":
-            conn.close()
-            await call.message.answer("Сотрудник не найден.")
+        u = await repo.set_employee_active(tg_id, False, call.from_user.id)
+        if not u:
+            sender.reply(call.message, "Сотрудник не найден.")
             return await call.answer()
 
-        cur = conn.cursor()
-        cur.execute("UPDATE users SET is_active=0 WHERE telegram_id=?", (tg_id,))
-        conn.commit()
-        db.audit(conn, None, call.from_user.id, "DEACTIVATE_USER", f"{tg_id}|{u['full_name']}|{u['department']}")
-        conn.close()
-
-        WAIT.pop(tg_id, None)
+        # при WORKERS > 1 очищается только кэш этого процесса и хранилище; диалог в памяти воркера сотрудника
+        # (его shard) сбросит dialog_allowed на следующем шаге
+        await WAIT.pop(tg_id)
 
-        await call.message.answer(f"✅ УСПЕШНО: сотрудник отключен (удален из доступа).\n{u['full_name']} — {u['department']}")
-        await notify_admin(call.bot, f"✅ УСПЕШНО: сотрудник ОТКЛЮЧЕН — {u['full_name']} id={tg_id}")
-        try:
-            await call.bot.send_message(tg_id, "Твой доступ отключен админом.", disable_notification=False)
-        except Exception:
-            pass
+        sender.reply(call.message, f"✅ УСПЕШНО: сотрудник отключен (удален из доступа).\n{u['full_name']} — {u['department']}")
+        notify_admin(f"✅ УСПЕШНО: сотрудник ОТКЛЮЧЕН — {u['full_name']} id={tg_id}", "users",
+                     line=f"отключен: {u['full_name']} id={tg_id}")
+        notify(tg_id, "Твой доступ отключен админом.")
 
         await call.answer()
 
@@ -416,104 +726,111 @@ async def main():
             return await call.answer()
         tg_id = int(call.data.split(":")[2])
 
-        conn = db.get_conn()
-        u = get_user(conn, tg_id)
-        if not u or u["role"] != "employee":
-            conn.close()
-            await call.message.answer("Сотрудник не найден.")
+        u = await repo.set_employee_active(tg_id, True, call.from_user.id)
+        if not u:
+            sender.reply(call.message, "Сотрудник не найден.")
             return await call.answer()
 
-        cur = conn.cursor()
-        cur.execute("UPDATE users SET is_active=1 WHERE telegram_id=?", (tg_id,))
-        conn.commit()
-        db.audit(conn, None, call.from_user.id, "ACTIVATE_USER", f"{tg_id}|{u['full_name']}|{u['department']}")
-        conn.close()
-
-        await call.message.answer(f"✅ УСПЕШНО: сотрудник активирован.\n{u['full_name']} — {u['department']}")
-        await notify_admin(call.bot, f"✅ УСПЕШНО: сотрудник ВКЛЮЧЕН — {u['full_name']} id={tg_id}")
-        try:
-            await call.bot.send_message(tg_id, "Твой доступ включен. Напиши /start.", disable_notification=False)
-        except Exception:
-            pass
+        sender.reply(call.message, f"✅ УСПЕШНО: сотрудник активирован.\n{u['full_name']} — {u['department']}")
+        notify_admin(f"✅ УСПЕШНО: сотрудник ВКЛЮЧЕН — {u['full_name']} id={tg_id}", "users",
+                     line=f"включен: {u['full_name']} id={tg_id}")
+        notify(tg_id, "Твой доступ включен. Напиши /start.")
 
         await call.answer()
 
-    # ---------- Admin tasks sections ----------
-
-    @dp.callback_query(F.data == "ad:active")
-    async def ad_active(call: CallbackQuery):
-        if not is_admin(call.from_user.id):
-            return await call.answer()
-
-        conn = db.get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM tasks WHERE status IN (?,?,?) ORDER BY deadline ASC", (*db.ACTIVE_STATUSES,))
-        rows = cur.fetchall()
-        conn.close()
-
+    # ---------- Task lists (one paginated message) ----------
+
+    async def show_page(call: CallbackQuery, view: str, cursor=None, backward=False, owner_id=None):
+        """
+        Первая страница — новым сообщением, листание — редактированием этого же сообщения.
+        owner_id — список админа только по одному сотруднику (из сводки).
+        """
+        v = LIST_VIEWS[view]
+        rows, has_prev, has_next = await repo.list_tasks_page(
+            v["statuses"],
+            owner_id=owner_id if v["admin"] else call.from_user.id,
+            overdue=v.get("overdue", False),
+            by=v["by"],
+            cursor=cursor,
+            backward=backward,
+            limit=PAGE_SIZE,
+        )
         if not rows:
-            await call.message.answer("Активных задач нет.")
+            if cursor is None:
+                sender.reply(call.message, v["empty"])
+                return await call.answer()
+            return await call.answer("Больше задач нет.")
+
+        title = v["title"]
+        if v["admin"] and owner_id:
+            u = await repo.get_user(owner_id)
+            title += f" · {u['full_name'] if u else owner_id}"
+        text = format_task_page(title, rows)
+        kb = kb_task_page(view, rows, has_prev, has_next, owner_id if v["admin"] else None)
+        if cursor is None:
+            sender.reply(call.message, text, reply_markup=kb)
         else:
-            for r in rows[:30]:
-                await call.message.answer(format_task(r), reply_markup=kb_admin_task(r["id"], r["status"]))
+            await call.message.edit_text(text, reply_markup=kb)
         await call.answer()
 
-    @dp.callback_query(F.data == "ad:review")
-    async def ad_review(call: CallbackQuery):
-        if not is_admin(call.from_user.id):
+    @dp.callback_query(F.data.startswith("pg:"))
+    async def page_nav(call: CallbackQuery):
+        _, view, direction, id_s, key = call.data.split(":", 4)
+        v = LIST_VIEWS.get(view)
+        if not v:
+            return await call.answer()
+        if v["admin"]:
+            if not is_admin(call.from_user.id):
+                return await call.answer()
+        elif not await is_employee_active(call.from_user.id):
+            sender.reply(call.message, "Доступ отключен.")
             return await call.answer()
+        key, _, owner_s = key.partition(":")
+        if not key.isdigit():
+            # кнопка из списка, отправленного до перехода на unix-время, — открываем список заново
+            return await show_page(call, view)
+        await show_page(call, view, cursor=(int(key), int(id_s)), backward=(direction == "p"),
+                        owner_id=int(owner_s) if owner_s.isdigit() else None)
 
-        conn = db.get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM tasks WHERE status=? ORDER BY deadline ASC", (db.STATUS_ON_REVIEW,))
-        rows = cur.fetchall()
-        conn.close()
+    # ---------- Admin tasks sections ----------
 
-        if not rows:
-            await call.message.answer("Нет задач на проверке.")
-        else:
-            for r in rows[:30]:
-                await call.message.answer(format_task(r), reply_markup=kb_admin_task(r["id"], r["status"]))
-        await call.answer()
+    @dp.callback_query(F.data == "ad:active")
+    async def ad_active(call: CallbackQuery):
+        if not is_admin(call.from_user.id):
+            return await call.answer()
+        await show_page(call, "active")
 
     @dp.callback_query(F.data == "ad:done")
     async def ad_done(call: CallbackQuery):
         if not is_admin(call.from_user.id):
             return await call.answer()
+        await show_page(call, "done")
 
-        conn = db.get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM tasks WHERE status=? ORDER BY updated_at DESC", (db.STATUS_DONE,))
-        rows = cur.fetchall()
-        conn.close()
+    # ---------- Admin: dashboard (overdue + on review) ----------
 
-        if not rows:
-            await call.message.answer("Завершенных нет.")
+    # ad:review и ad:overdue — кнопки меню из сообщений, отправленных до сводки
+    @dp.callback_query(F.data.in_({"ad:dash", "ad:review", "ad:overdue"}))
+    async def ad_dashboard(call: CallbackQuery):
+        """
+        Просроченные и на проверке по отделам и сотрудникам — одним сообщением, из кэша (repo.dashboard).
+        """
+        if not is_admin(call.from_user.id):
+            return await call.answer()
+        d = await repo.dashboard.get()
+        if not d["overdue"] and not d["review"]:
+            sender.reply(call.message, "Просроченных и задач на проверке нет.")
         else:
-            for r in rows[:30]:
-                await call.message.answer(format_task(r))
+            sender.reply(call.message, format_dashboard(d), reply_markup=kb_dashboard(d))
         await call.answer()
 
-    @dp.callback_query(F.data == "ad:overdue")
-    async def ad_overdue(call: CallbackQuery):
+    @dp.callback_query(F.data.startswith("dash:"))
+    async def dashboard_drill(call: CallbackQuery):
         if not is_admin(call.from_user.id):
             return await call.answer()
-
-        conn = db.get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT * FROM tasks WHERE status IN (?,?,?) AND deadline < ? ORDER BY deadline ASC",
-            (*db.ACTIVE_STATUSES, db.now_iso()),
-        )
-        rows = cur.fetchall()
-        conn.close()
-
-        if not rows:
-            await call.message.answer("Просроченных нет.")
-        else:
-            for r in rows[:30]:
-                await call.message.answer(format_task(r), reply_markup=kb_admin_task(r["id"], r["status"]))
-        await call.answer()
+        _, code, owner_s = call.data.split(":")
+        if code not in DASHBOARD_SECTIONS:
+            return await call.answer()
+        await show_page(call, DASHBOARD_SECTIONS[code], owner_id=int(owner_s) or None)
 
     # ---------- Create task: pick employee list ----------
 
@@ -522,29 +839,24 @@ async def main():
         if not is_admin(call.from_user.id):
             return await call.answer()
 
-        conn = db.get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT telegram_id, full_name, department FROM users "
-            "WHERE role='employee' AND is_active=1 ORDER BY department, full_name"
-        )
-        users = cur.fetchall()
-        conn.close()
+        users = await repo.list_active_employees()
 
         if not users:
-            await call.message.answer("Нет активных сотрудников. Добавь через /add_user.")
+            sender.reply(call.message, "Нет активных сотрудников. Добавь через /add_user.")
             return await call.answer()
 
-        WAIT[call.from_user.id] = {"step": "pick_user"}
-        await call.message.answer("Выбери сотрудника:", reply_markup=kb_pick_employee(users))
+        depts = sorted({u["department"] for u in users})
+        await WAIT.set(call.from_user.id, {"step": "pick_user", "depts": depts})
+        sender.reply(call.message, "Выбери сотрудника, нескольких или весь отдел:",
+                     reply_markup=kb_pick_employee(users, depts))
         await call.answer()
 
     @dp.callback_query(F.data == "ad:pickcancel")
     async def ad_pickcancel(call: CallbackQuery):
         if not is_admin(call.from_user.id):
             return await call.answer()
-        WAIT.pop(call.from_user.id, None)
-        await call.message.answer("Отменено.")
+        await WAIT.pop(call.from_user.id)
+        sender.reply(call.message, "Отменено.")
         await call.answer()
 
     @dp.callback_query(F.data.startswith("ad:pick:"))
@@ -554,181 +866,233 @@ async def main():
 
         target_id = int(call.data.split(":")[2])
 
-        conn = db.get_conn()
-        u = get_user(conn, target_id)
-        conn.close()
+        u = await repo.get_user(target_id)
 
         if not u or u["role"] != "employee" or int(u["is_active"]) == 0:
-            WAIT.pop(call.from_user.id, None)
-            await call.message.answer("Сотрудник не найден/не активен.")
+            await WAIT.pop(call.from_user.id)
+            sender.reply(call.message, "Сотрудник не найден/не активен.")
             return await call.answer()
 
-        WAIT[call.from_user.id] = {"step": "title", "target_id": target_id, "dept": u["department"]}
-        await call.message.answer(f"Выбран: {u['full_name']} ({u['department']})\nНазвание задачи:")
+        await WAIT.set(call.from_user.id, {"step": "title", "target_id": target_id, "dept": u["department"]})
+        sender.reply(call.message, f"Выбран: {u['full_name']} ({u['department']})\nНазвание задачи:")
+        await call.answer()
+
+    async def start_bulk(call: CallbackQuery, users, label: str):
+        """
+        Массовое создание: дальше тот же мастер (название/описание/срок), задача — каждому из users.
+        """
+        targets = [[u["telegram_id"], u["department"]] for u in users]
+        await WAIT.set(call.from_user.id, {"step": "title", "targets": targets})
+        sender.reply(call.message, f"Выбраны: {label} — {len(targets)} чел.\nНазвание задачи:")
         await call.answer()
 
+    @dp.callback_query(F.data.startswith("ad:dept:"))
+    async def ad_dept(call: CallbackQuery):
+        if not is_admin(call.from_user.id):
+            return await call.answer()
+        st = WAIT.get(call.from_user.id)
+        i = int(call.data.split(":")[2])
+        if not st or st.get("step") != "pick_user" or i >= len(st["depts"]):
+            return await call.answer("Начни заново: ➕ Создать задачу")
+        dept = st["depts"][i]
+        users = [u for u in await repo.list_active_employees() if u["department"] == dept]
+        if not users:
+            await WAIT.pop(call.from_user.id)
+            sender.reply(call.message, f"В отделе {dept} нет активных сотрудников.")
+            return await call.answer()
+        await start_bulk(call, users, f"отдел {dept}")
+
+    @dp.callback_query(F.data == "ad:multi")
+    async def ad_multi(call: CallbackQuery):
+        if not is_admin(call.from_user.id):
+            return await call.answer()
+        users = await repo.list_active_employees()
+        await WAIT.set(call.from_user.id, {"step": "pick_many", "selected": []})
+        sender.reply(call.message, "Отметь сотрудников и нажми «Готово»:", reply_markup=kb_pick_many(users, set()))
+        await call.answer()
+
+    @dp.callback_query(F.data.startswith("ad:ms:"))
+    async def ad_ms_toggle(call: CallbackQuery):
+        if not is_admin(call.from_user.id):
+            return await call.answer()
+        st = WAIT.get(call.from_user.id)
+        if not st or st.get("step") != "pick_many":
+            return await call.answer("Начни заново: ➕ Создать задачу")
+        tg_id = int(call.data.split(":")[2])
+        selected = set(st["selected"])
+        selected ^= {tg_id}
+        st["selected"] = sorted(selected)
+        await WAIT.set(call.from_user.id, st)
+        users = await repo.list_active_employees()
+        await call.message.edit_reply_markup(reply_markup=kb_pick_many(users, selected))
+        await call.answer()
+
+    @dp.callback_query(F.data == "ad:msdone")
+    async def ad_ms_done(call: CallbackQuery):
+        if not is_admin(call.from_user.id):
+            return await call.answer()
+        st = WAIT.get(call.from_user.id)
+        if not st or st.get("step") != "pick_many":
+            return await call.answer("Начни заново: ➕ Создать задачу")
+        selected = set(st["selected"])
+        users = [u for u in await repo.list_active_employees() if u["telegram_id"] in selected]
+        if not users:
+            return await call.answer("Никто не выбран.")
+        await start_bulk(call, users, "несколько сотрудников")
+
     # ---------- Employee lists ----------
 
     @dp.callback_query(F.data == "em:my")
     async def em_my(call: CallbackQuery):
-        conn = db.get_conn()
-        if not is_employee_active(conn, call.from_user.id):
-            conn.close()
-            await call.message.answer("Доступ отключен.")
+        if not await is_employee_active(call.from_user.id):
+            sender.reply(call.message, "Доступ отключен.")
             return await call.answer()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT * FROM tasks WHERE owner_telegram_id=? AND status IN (?,?,?) ORDER BY deadline ASC",
-            (call.from_user.id, *db.ACTIVE_STATUSES),
-        )
-        rows = cur.fetchall()
-        conn.close()
-        if not rows:
-            await call.message.answer("Нет активных задач.")
-        else:
-            for r in rows[:30]:
-                await call.message.answer(format_task(r), reply_markup=kb_employee_task(r["id"], r["status"]))
-        await call.answer()
+        await show_page(call, "my")
 
     @dp.callback_query(F.data == "em:myreview")
     async def em_myreview(call: CallbackQuery):
-        conn = db.get_conn()
-        if not is_employee_active(conn, call.from_user.id):
-            conn.close()
-            await call.message.answer("Доступ отключен.")
+        if not await is_employee_active(call.from_user.id):
+            sender.reply(call.message, "Доступ отключен.")
             return await call.answer()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT * FROM tasks WHERE owner_telegram_id=? AND status=? ORDER BY deadline ASC",
-            (call.from_user.id, db.STATUS_ON_REVIEW),
-        )
-        rows = cur.fetchall()
-        conn.close()
-        if not rows:
-            await call.message.answer("Нет задач на проверке.")
-        else:
-            for r in rows[:30]:
-                await call.message.answer(format_task(r), reply_markup=kb_employee_task(r["id"], r["status"]))
-        await call.answer()
+        await show_page(call, "myreview")
 
     @dp.callback_query(F.data == "em:done")
     async def em_done(call: CallbackQuery):
-        conn = db.get_conn()
-        if not is_employee_active(conn, call.from_user.id):
-            conn.close()
-            await call.message.answer("Доступ отключен.")
+        if not await is_employee_active(call.from_user.id):
+            sender.reply(call.message, "Доступ отключен.")
             return await call.answer()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT * FROM tasks WHERE owner_telegram_id=? AND status=? ORDER BY updated_at DESC",
-            (call.from_user.id, db.STATUS_DONE),
-        )
-        rows = cur.fetchall()
-        conn.close()
-        if not rows:
-            await call.message.answer("Завершенных задач нет.")
-        else:
-            for r in rows[:30]:
-                await call.message.answer(format_task(r))
-        await call.answer()
+        await show_page(call, "mydone")
 
     # ---------- Task buttons ----------
 
+    async def task_access(call: CallbackQuery, task_id: int):
+        """
+        (задача, админ ли) — или None, если задачи нет или она чужая (пользователю уже ответили).
+        """
+        t = await repo.get_task(task_id)
+        if not t:
+            sender.reply(call.message, "Задача не найдена.")
+            return None
+        admin = is_admin(call.from_user.id)
+        if not admin:
+            if not await is_employee_active(call.from_user.id):
+                sender.reply(call.message, "Доступ отключен.")
+                return None
+            if t["owner_telegram_id"] != call.from_user.id:
+                sender.reply(call.message, "Это не твоя задача.")
+                return None
+        return t, admin
+
+    async def show_task(message: Message, task_id: int, admin: bool, edit: bool = False):
+        """
+        Карточка с последними комментариями, файлами и историей — одним чтением из БД.
+        """
+        d = await repo.get_task_detail(task_id, limit=TASK_DETAIL_ITEMS)
+        if not d:
+            return sender.reply(message, "Задача не найдена.")
+        text, kb = format_task_detail(d), kb_task_detail(d, admin)
+        if edit:
+            await message.edit_text(text, reply_markup=kb)
+        else:
+            sender.reply(message, text, reply_markup=kb)
+
+    async def send_task_files(chat_id: int, task_id: int):
+        """
+        Файлы задачи заново по telegram_file_id: медиагруппами до 10 штук (фото и документы — отдельно).
+        """
+        files = list(reversed(await repo.list_task_files(task_id, limit=FILES_RESEND_MAX)))
+        if not files:
+            return sender.send_message(chat_id, "Файлов нет.")
+        for kind, media_cls, send_one in (("photo", InputMediaPhoto, bot.send_photo),
+                                          ("document", InputMediaDocument, bot.send_document)):
+            ids = [f["telegram_file_id"] for f in files if f["kind"] == kind]
+            for i in range(0, len(ids), MEDIA_GROUP_MAX):
+                chunk = ids[i:i + MEDIA_GROUP_MAX]
+                if len(chunk) == 1:
+                    sender.submit(chat_id, lambda fid=chunk[0], send=send_one: send(chat_id, fid))
+                else:
+                    media = [media_cls(media=fid) for fid in chunk]
+                    sender.submit(chat_id, lambda media=media: bot.send_media_group(chat_id, media))
+        if len(files) == FILES_RESEND_MAX:
+            sender.send_message(chat_id, f"Показаны последние {FILES_RESEND_MAX} файлов задачи #{task_id}.")
+
+    @dp.callback_query(F.data.startswith("th:"))
+    async def task_history(call: CallbackQuery):
+        await call.answer()
+        _, task_id_s, before_s = call.data.split(":")
+        task_id = int(task_id_s)
+        if not await task_access(call, task_id):
+            return
+        rows, more = await repo.task_history_page(task_id, before_id=int(before_s), limit=PAGE_SIZE)
+        if not rows:
+            return sender.reply(call.message, "Больше записей нет.")
+        kb = render.markup([[("🕘 Раньше", f"th:{task_id}:{rows[-1]['id']}")]]) if more else None
+        text = f"🕘 История задачи #{task_id}:\n" + "\n".join(format_history_line(r) for r in rows)
+        sender.reply(call.message, text[:MESSAGE_MAX_LEN], reply_markup=kb)
+
     @dp.callback_query(F.data.startswith("t:"))
     async def task_action(call: CallbackQuery):
         await call.answer()
         _, task_id_s, action = call.data.split(":")
         task_id = int(task_id_s)
 
-        conn = db.get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM tasks WHERE id=?", (task_id,))
-        t = cur.fetchone()
-        if not t:
-            conn.close()
-            return await call.message.answer("Задача не найдена.")
+        access = await task_access(call, task_id)
+        if not access:
+            return
+        t, admin = access
 
-        admin = is_admin(call.from_user.id)
-        owner = (t["owner_telegram_id"] == call.from_user.id)
+        if action == "open":
+            return await show_task(call.message, task_id, admin)
 
-        if not admin:
-            if not is_employee_active(conn, call.from_user.id):
-                conn.close()
-                return await call.message.answer("Доступ отключен.")
-            if not owner:
-                conn.close()
-                return await call.message.answer("Это не твоя задача.")
+        if action == "files":
+            return await send_task_files(call.message.chat.id, task_id)
 
         if not admin:
             if action == "inprog" and t["status"] == db.STATUS_NEW:
-                cur.execute("UPDATE tasks SET status=?, updated_at=? WHERE id=?",
-                            (db.STATUS_IN_PROGRESS, db.now_iso(), task_id))
-                conn.commit()
-                db.audit(conn, task_id, call.from_user.id, "STATUS", "Новая→В процессе")
+                await repo.set_task_status(task_id, db.STATUS_IN_PROGRESS, call.from_user.id,
+                                           "Новая→В процессе", from_status=db.STATUS_NEW)
 
             elif action == "review" and t["status"] == db.STATUS_IN_PROGRESS:
-                cur.execute("UPDATE tasks SET status=?, updated_at=? WHERE id=?",
-                            (db.STATUS_ON_REVIEW, db.now_iso(), task_id))
-                conn.commit()
-                db.audit(conn, task_id, call.from_user.id, "STATUS", "В процессе→На проверке")
-                await notify_admin(call.bot, f"🟨 На проверке: задача #{task_id}")
+                t2 = await repo.set_task_status(task_id, db.STATUS_ON_REVIEW, call.from_user.id,
+                                                "В процессе→На проверке", from_status=db.STATUS_IN_PROGRESS)
+                if t2:
+                    u = await repo.get_user(call.from_user.id)
+                    who = u["full_name"] if u else call.from_user.id
+                    notify_admin(f"🟨 На проверке: задача #{task_id}", "review",
+                                 line=f"#{task_id} · {who} · {t2['title'][:60]}", task_id=task_id)
 
             elif action == "comment":
-                conn.close()
-                WAIT[call.from_user.id] = {"step": "comment", "task_id": task_id}
-                return await call.message.answer(f"Напиши комментарий для задачи #{task_id}:")
+                await WAIT.set(call.from_user.id, {"step": "comment", "task_id": task_id})
+                return sender.reply(call.message, f"Напиши комментарий для задачи #{task_id}:")
 
             elif action == "file":
-                conn.close()
-                WAIT[call.from_user.id] = {"step": "file", "task_id": task_id}
-                return await call.message.answer(f"Отправь файл для задачи #{task_id}:")
+                await WAIT.set(call.from_user.id, {"step": "file", "task_id": task_id})
+                return sender.reply(call.message, f"Отправь файл для задачи #{task_id}:")
 
-            cur.execute("SELECT * FROM tasks WHERE id=?", (task_id,))
-            t2 = cur.fetchone()
-            conn.close()
-            return await call.message.edit_text(format_task(t2), reply_markup=kb_employee_task(task_id, t2["status"]))
+            return await show_task(call.message, task_id, admin, edit=True)
 
         # admin actions
         if admin:
             if action == "done" and t["status"] == db.STATUS_ON_REVIEW:
-                cur.execute("UPDATE tasks SET status=?, updated_at=? WHERE id=?",
-                            (db.STATUS_DONE, db.now_iso(), task_id))
-                conn.commit()
-                db.audit(conn, task_id, call.from_user.id, "STATUS", "На проверке→Готово")
-                try:
-                    await call.bot.send_message(t["owner_telegram_id"], f"✅ Задача #{task_id} принята. Статус: Готово.", disable_notification=False)
-                except Exception:
-                    pass
+                if await repo.set_task_status(task_id, db.STATUS_DONE, call.from_user.id, "На проверке→Готово",
+                                              from_status=db.STATUS_ON_REVIEW, notify=True):
+                    outbox.hint()
 
             elif action == "back" and t["status"] == db.STATUS_ON_REVIEW:
-                cur.execute("UPDATE tasks SET status=?, updated_at=? WHERE id=?",
-                            (db.STATUS_IN_PROGRESS, db.now_iso(), task_id))
-                conn.commit()
-                db.audit(conn, task_id, call.from_user.id, "STATUS", "На проверке→В процессе")
-                try:
-                    await call.bot.send_message(t["owner_telegram_id"], f"↩️ Задача #{task_id} возвращена: В процессе.", disable_notification=False)
-                except Exception:
-                    pass
+                if await repo.set_task_status(task_id, db.STATUS_IN_PROGRESS, call.from_user.id,
+                                              "На проверке→В процессе", from_status=db.STATUS_ON_REVIEW, notify=True):
+                    scheduler.hint_task(t["deadline"])  # напоминания поставлены заново
+                    outbox.hint()
 
             elif action == "chgdl":
-                conn.close()
-                WAIT[call.from_user.id] = {"step": "chgdl", "task_id": task_id}
-                return await call.message.answer("Новый срок: YYYY-MM-DD или YYYY-MM-DD HH:MM")
+                await WAIT.set(call.from_user.id, {"step": "chgdl", "task_id": task_id})
+                return sender.reply(call.message, "Новый срок: YYYY-MM-DD или YYYY-MM-DD HH:MM")
 
             elif action == "cancel":
-                cur.execute("UPDATE tasks SET status=?, updated_at=? WHERE id=?",
-                            (db.STATUS_CANCELED, db.now_iso(), task_id))
-                conn.commit()
-                db.audit(conn, task_id, call.from_user.id, "STATUS", "→Отменено")
-                try:
-                    await call.bot.send_message(t["owner_telegram_id"], f"🗑 Задача #{task_id} отменена админом.", disable_notification=False)
-                except Exception:
-                    pass
+                await repo.set_task_status(task_id, db.STATUS_CANCELED, call.from_user.id, "→Отменено", notify=True)
+                outbox.hint()
 
-            cur.execute("SELECT * FROM tasks WHERE id=?", (task_id,))
-            t2 = cur.fetchone()
-            conn.close()
-            return await call.message.edit_text(format_task(t2), reply_markup=kb_admin_task(task_id, t2["status"]))
+            return await show_task(call.message, task_id, admin, edit=True)
 
     # ---------- Text flow (create task / comment / change deadline) ----------
 
@@ -739,24 +1103,23 @@ async def main():
             return
 
         if not is_admin(message.from_user.id):
-            conn = db.get_conn()
-            ok = is_employee_active(conn, message.from_user.id)
-            conn.close()
-            if not ok:
-                WAIT.pop(message.from_user.id, None)
-                await message.answer("Доступ отключен.")
+            if not await dialog_allowed(message.from_user.id):
+                await WAIT.pop(message.from_user.id)
+                sender.reply(message, "Доступ отключен.")
                 return
 
         # create task steps (admin)
         if st.get("step") == "title":
             st["title"] = message.text.strip()
             st["step"] = "desc"
-            return await message.answer("Описание задачи:")
+            await WAIT.set(message.from_user.id, st)
+            return sender.reply(message, "Описание задачи:")
 
         if st.get("step") == "desc":
             st["desc"] = message.text.strip()
             st["step"] = "deadline"
-            return await message.answer("Срок: today / week / days N (пример: days 5)")
+            await WAIT.set(message.from_user.id, st)
+            return sender.reply(message, "Срок: today / week / days N (пример: days 5)")
 
         if st.get("step") == "deadline":
             txt = message.text.strip().lower()
@@ -769,95 +1132,64 @@ async def main():
                     n = int(txt.split()[1])
                     if n < 1 or n > 60:
                         raise ValueError
-                    deadline = (datetime.now() + timedelta(days=n)).replace(hour=23, minute=59, second=0).isoformat(timespec="seconds")
+                    deadline = deadline_in_days(n)
                 except Exception:
-                    return await message.answer("Неверно. Пример: days 5 (1..60)")
+                    return sender.reply(message, "Неверно. Пример: days 5 (1..60)")
             else:
-                return await message.answer("Напиши: today / week / days N")
-
-            conn = db.get_conn()
-            cur = conn.cursor()
-            created = db.now_iso()
-            cur.execute(
-                """
-                INSERT INTO tasks(title, description, status, deadline, owner_telegram_id, department, created_at, updated_at)
-                VALUES(?,?,?,?,?,?,?,?)
-                """,
-                (st["title"], st["desc"], db.STATUS_NEW, deadline, st["target_id"], st["dept"], created, created),
-            )
-            task_id = cur.lastrowid
-            conn.commit()
-            db.audit(conn, task_id, message.from_user.id, "CREATE_TASK", f"to={st['target_id']} deadline={deadline}")
-            cur.execute("SELECT * FROM tasks WHERE id=?", (task_id,))
-            task_row = cur.fetchone()
-            conn.close()
+                return sender.reply(message, "Напиши: today / week / days N")
+
+            if st.get("targets"):
+                rows = await repo.create_tasks_bulk(st["title"], st["desc"], deadline,
+                                                    [tuple(t) for t in st["targets"]], message.from_user.id)
+                scheduler.hint_task(deadline)
+                outbox.hint()
+                await WAIT.pop(message.from_user.id)
+                sender.reply(message, f"✅ Создано задач: {len(rows)} (#{rows[0]['id']}–#{rows[-1]['id']}).")
+                return
 
-            target_id = st["target_id"]
-            WAIT.pop(message.from_user.id, None)
+            task_row = await repo.create_task(st["title"], st["desc"], deadline, st["target_id"], st["dept"],
+                                              message.from_user.id)
+            task_id = task_row["id"]
+            scheduler.hint_task(deadline)
+            outbox.hint()  # PUSH сотруднику — уже в outbox
 
-            await message.answer(f"✅ Создана задача #{task_id}.")
+            await WAIT.pop(message.from_user.id)
 
-            # PUSH сотруднику
-            try:
-                await push_task_assigned(message.bot, target_id, task_row)
-            except Exception:
-                await notify_admin(
-                    message.bot,
-                    f"⚠️ PUSH НЕ ДОСТАВЛЕН сотруднику id={target_id} (он мог не нажать /start или заблокировал бота)."
-                )
+            sender.reply(message, f"✅ Создана задача #{task_id}.")
             return
 
         # comment (employee)
         if st.get("step") == "comment":
             task_id = st["task_id"]
-            conn = db.get_conn()
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO comments(task_id, author_telegram_id, text, created_at) VALUES(?,?,?,?)",
-                (task_id, message.from_user.id, message.text.strip(), db.now_iso()),
-            )
-            conn.commit()
-            db.audit(conn, task_id, message.from_user.id, "COMMENT", message.text.strip()[:200])
-            conn.close()
-            WAIT.pop(message.from_user.id, None)
-            return await message.answer("Комментарий добавлен.")
+            await repo.add_comment(task_id, message.from_user.id, message.text.strip())
+            await WAIT.pop(message.from_user.id)
+            return sender.reply(message, "Комментарий добавлен.")
 
         # change deadline (admin)
         if st.get("step") == "chgdl":
             if not is_admin(message.from_user.id):
-                WAIT.pop(message.from_user.id, None)
+                await WAIT.pop(message.from_user.id)
                 return
             task_id = st["task_id"]
             raw = message.text.strip()
             try:
                 if len(raw) == 10:
-                    new_deadline = datetime.strptime(raw, "%Y-%m-%d").replace(hour=23, minute=59, second=0).isoformat(timespec="seconds")
+                    new_deadline = db.to_ts(datetime.strptime(raw, "%Y-%m-%d").replace(hour=23, minute=59))
                 else:
-                    new_deadline = datetime.strptime(raw, "%Y-%m-%d %H:%M").isoformat(timespec="seconds")
-            except Exception:
-                return await message.answer("Формат: 2026-01-20 или 2026-01-20 18:00")
-
-            conn = db.get_conn()
-            cur = conn.cursor()
-            cur.execute("SELECT deadline, owner_telegram_id FROM tasks WHERE id=?", (task_id,))
-            row = cur.fetchone()
-            if not row:
-                conn.close()
-                WAIT.pop(message.from_user.id, None)
-                return await message.answer("Задача не найдена.")
-            old = row["deadline"]
-            owner_id = row["owner_telegram_id"]
-            cur.execute("UPDATE tasks SET deadline=?, updated_at=? WHERE id=?", (new_deadline, db.now_iso(), task_id))
-            conn.commit()
-            db.audit(conn, task_id, message.from_user.id, "CHANGE_DEADLINE", f"{old}→{new_deadline}")
-            conn.close()
-
-            WAIT.pop(message.from_user.id, None)
-            await message.answer(f"Ок. Срок обновлен: {old} → {new_deadline}")
-            try:
-                await message.bot.send_message(owner_id, f"🗓 Срок задачи #{task_id} изменён: {old} → {new_deadline}", disable_notification=False)
+                    new_deadline = db.to_ts(datetime.strptime(raw, "%Y-%m-%d %H:%M"))
             except Exception:
-                pass
+                return sender.reply(message, "Формат: 2026-01-20 или 2026-01-20 18:00")
+
+            res = await repo.change_deadline(task_id, new_deadline, message.from_user.id)
+            if not res:
+                await WAIT.pop(message.from_user.id)
+                return sender.reply(message, "Задача не найдена.")
+            old, _ = res
+            scheduler.hint_task(new_deadline)
+            outbox.hint()
+
+            await WAIT.pop(message.from_user.id)
+            sender.reply(message, f"Ок. Срок обновлен: {db.fmt_ts(old)} → {db.fmt_ts(new_deadline)}")
             return
 
     # ---------- File flow ----------
@@ -865,16 +1197,20 @@ async def main():
     @dp.message(F.document | F.photo)
     async def file_flow(message: Message):
         st = WAIT.get(message.from_user.id)
+        if st and st.get("step") == "import" and is_admin(message.from_user.id):
+            if not message.document:
+                return sender.reply(message, "Нужен файл .csv или .jsonl документом.")
+            await WAIT.pop(message.from_user.id)
+            run_background(importer.run(message.bot, message, message.document))
+            return
+
         if not st or st.get("step") != "file":
             return
 
         if not is_admin(message.from_user.id):
-            conn = db.get_conn()
-            ok = is_employee_active(conn, message.from_user.id)
-            conn.close()
-            if not ok:
-                WAIT.pop(message.from_user.id, None)
-                await message.answer("Доступ отключен.")
+            if not await dialog_allowed(message.from_user.id):
+                await WAIT.pop(message.from_user.id)
+                sender.reply(message, "Доступ отключен.")
                 return
 
         task_id = st["task_id"]
@@ -885,23 +1221,112 @@ async def main():
         else:
             file_id = message.photo[-1].file_id
             file_name = "photo.jpg"
+        kind = "document" if message.document else "photo"
 
-        conn = db.get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            "INSERT INTO files(task_id, uploader_telegram_id, telegram_file_id, file_name, created_at) VALUES(?,?,?,?,?)",
-            (task_id, message.from_user.id, file_id, file_name, db.now_iso()),
-        )
-        conn.commit()
-        db.audit(conn, task_id, message.from_user.id, "ADD_FILE", file_name)
-        conn.close()
+        await repo.add_file(task_id, message.from_user.id, file_id, file_name, kind=kind)
+
+        await WAIT.pop(message.from_user.id)
+        sender.reply(message, "Файл прикреплён.")
 
-        WAIT.pop(message.from_user.id, None)
-        await message.answer("Файл прикреплён.")
+    return dp
+
+
+def register_jobs():
+    """
+    Обработчики задач планировщика и уведомлений outbox (bench/scenarios.py регистрирует их так же).
+    """
+    scheduler.register("daily_report", daily_report)
+    scheduler.register("task_reminder", task_reminder)
+    scheduler.register("counters_check", counters_check)
+    scheduler.register("archive", archive_old)
+    outbox.register("task_assigned", deliver_task_assigned)
+    outbox.register("task_status", deliver_task_status)
+    outbox.register("task_deadline", deliver_task_deadline)
+
+
+async def start_jobs(shared: bool = False):
+    """
+    Единичные фоновые задачи: планировщик (отчёт, напоминания, сверка счётчиков, архивация), доставка outbox
+    и уборка брошенных диалогов.
+    shared — WORKERS > 1: их запускает лидер, а jobs и outbox пополняют и другие процессы. Возвращает функцию остановки.
+    """
+    await scheduler.start(poll=JOBS_POLL_SECONDS if shared else None)
+    await outbox.start(on_parked=report_push_failure, on_batch_done=report_bulk_push,
+                       poll=OUTBOX_POLL_SECONDS if shared else None)
+    await scheduler.ensure_cron("daily_report", "daily_report", DAILY_REPORT_CRON)
+    await scheduler.ensure_cron("counters_check", "counters_check", COUNTERS_CHECK_CRON)
+    await scheduler.ensure_cron("archive", "archive", ARCHIVE_CRON)
+    sweep = asyncio.create_task(WAIT.sweep_loop())
 
-    asyncio.create_task(daily_report_loop(bot))
-    await dp.start_polling(bot)
+    async def stop():
+        sweep.cancel()
+        await asyncio.gather(sweep, return_exceptions=True)
+        await outbox.stop()
+        await scheduler.stop()
+
+    return stop
+
+
+async def main(worker: int = None):
+    """
+    worker — номер процесса при WORKERS > 1 (его запускает cluster.supervise), None — бот одним процессом.
+    """
+    if not BOT_TOKEN:
+        raise RuntimeError("BOT_TOKEN пустой. Проверь файл .env")
+    if ADMIN_TELEGRAM_ID == 0:
+        raise RuntimeError("ADMIN_TELEGRAM_ID пустой. Проверь файл .env")
+    if BOT_MODE not in ("polling", "webhook"):
+        raise RuntimeError("BOT_MODE: polling или webhook. Проверь файл .env")
+
+    db.init_db(ADMIN_TELEGRAM_ID)
+    await WAIT.load()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(BOT_TOKEN, session=session)
+    dp = build_dispatcher(bot)
+    sender.start(bot, SEND_GLOBAL_RATE if worker is None else SEND_GLOBAL_RATE / WORKERS)
+
+    register_jobs()
+
+    # у каждого воркера свои метрики: порт METRICS_PORT + номер, файл metrics.w<номер>.prom
+    metrics_port, metrics_file = METRICS_PORT, METRICS_DUMP_FILE
+    if worker is not None:
+        repo.users.ttl = USER_CACHE_TTL_SECONDS
+        metrics_port = metrics_port and metrics_port + worker
+        if metrics_file:
+            root, ext = os.path.splitext(metrics_file)
+            metrics_file = f"{root}.w{worker}{ext}"
+    metrics_runner = await metrics.serve(METRICS_HOST, metrics_port) if metrics_port else None
+    dumper = asyncio.create_task(metrics.dump_loop(metrics_file, METRICS_DUMP_SECONDS)) if metrics_file else None
+
+    stop_jobs = None
+    try:
+        if worker is not None:
+            await cluster.run(dp, bot, worker, WORKERS, lambda: start_jobs(shared=True))
+            return
+        stop_jobs = await start_jobs()
+        print("Бот запущен. PowerShell не закрывать.")
+        if BOT_MODE == "webhook":
+            await webhook.run(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        if stop_jobs:
+            await stop_jobs()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if dumper:
+            dumper.cancel()
+            await asyncio.gather(dumper, return_exceptions=True)
+            metrics.dump(metrics_file)
+        ADMIN_DIGEST.flush_all()  # накопленное за окно — до остановки очереди отправки
+        await sender.stop()
+        await bot.session.close()
+        repo.shutdown()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if WORKERS > 1:
+        cluster.supervise(WORKERS)
+    else:
+        asyncio.run(main())
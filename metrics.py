@@ -0,0 +1,230 @@
+# metrics.py
+"""
+Метрики в памяти процесса и их выдача в текстовом формате Prometheus.
+- время хендлеров: callback — по префиксу данных (ad:, em:, t:, ...), сообщения — по имени хендлера;
+- время запросов SQLite (db.py, соединения создаются с TimedConnection) и медленные запросы в лог;
+- время обращений к БД через repo.py: ожидание DB-потока и выполнение функции db.*;
+- время вызовов Bot API по методам (SendMessage, EditMessageText, ...) и их ошибки.
+Отдаётся на http://METRICS_HOST:METRICS_PORT/metrics и/или пишется в METRICS_DUMP_FILE
+(например, для textfile-коллектора node_exporter). Внешних зависимостей нет.
+"""
+import asyncio
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+
+from config import DB_SLOW_QUERY_MS
+
+log = logging.getLogger(__name__)
+
+REGISTRY = []
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DB_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def _labels(names, values, extra=None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _num(value) -> str:
+    if isinstance(value, int):
+        return str(value)
+    return "+Inf" if value == math.inf else repr(float(value))
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labelnames=()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, n: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + n
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, v in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_num(v)}"
+
+
+class Histogram:
+    """
+    Счётчики по корзинам + сумма; значения — секунды.
+    """
+
+    def __init__(self, name: str, doc: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series = {}  # labels -> [число в каждой корзине..., сумма]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0] * (len(self.buckets) + 1)
+            s[i] += 1
+            s[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            items = sorted((labels, list(s)) for labels, s in self._series.items())
+        for labels, s in items:
+            total = 0
+            for le, n in zip(self.buckets, s):
+                total += n
+                le_label = f'le="{_num(le)}"'
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le_label)} {total}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_num(s[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {total}"
+
+
+class Gauge:
+    """
+    Значение читается в момент выдачи: fn() -> число.
+    kind="counter" — для уже существующих счётчиков (например, попаданий в кэш).
+    """
+
+    def __init__(self, name: str, doc: str, fn, kind: str = "gauge"):
+        self.name, self.doc, self.fn, self.kind = name, doc, fn, kind
+        REGISTRY.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield f"{self.name} {_num(self.fn())}"
+
+
+def render() -> str:
+    return "\n".join(line for m in REGISTRY for line in m.render()) + "\n"
+
+
+HANDLER_SECONDS = Histogram("bot_handler_seconds", "Время обработки апдейта хендлером", ("route",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в хендлерах", ("route",))
+API_SECONDS = Histogram("bot_api_seconds", "Время вызова Bot API", ("method",))
+API_ERRORS = Counter("bot_api_errors_total", "Ошибки вызовов Bot API", ("method", "error"))
+DB_QUERY_SECONDS = Histogram("bot_db_query_seconds", "Время выполнения SQL (для SELECT — до первой строки)",
+                             ("op",), DB_BUCKETS)
+DB_SLOW_QUERIES = Counter("bot_db_slow_queries_total", f"SQL дольше {DB_SLOW_QUERY_MS:g} мс", ("op",))
+DB_CALL_SECONDS = Histogram("bot_db_call_seconds", "Время функции db.* в DB-потоке", ("fn", "mode"), DB_BUCKETS)
+DB_WAIT_SECONDS = Histogram("bot_db_wait_seconds", "Ожидание свободного DB-потока", ("mode",), DB_BUCKETS)
+
+_DB_OPS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE", "PRAGMA", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT",
+                     "RELEASE"))
+
+
+# ---------- hooks ----------
+
+def _db_op(sql: str) -> str:
+    words = sql.lstrip()[:32].split()
+    op = words[0].upper() if words else ""
+    if op == "BEGIN":
+        # IMMEDIATE/EXCLUSIVE сразу ждут блокировку записи — отдельной меткой, чтобы было видно конкуренцию писателей
+        mode = words[1].upper() if len(words) > 1 else ""
+        return f"BEGIN {mode}" if mode in ("IMMEDIATE", "EXCLUSIVE") else op
+    if op == "END":
+        return "COMMIT"
+    return op if op in _DB_OPS else "OTHER"
+
+
+def observe_query(sql: str, seconds: float):
+    op = _db_op(sql)
+    DB_QUERY_SECONDS.observe(seconds, op)
+    if seconds * 1000 >= DB_SLOW_QUERY_MS:
+        DB_SLOW_QUERIES.inc(op)
+        log.warning("slow query %.0f ms: %s", seconds * 1000, " ".join(sql.split())[:300])
+
+
+def _route(event, data) -> str:
+    # callback: первый сегмент данных кнопки; хендлер уже найден, значит префикс — один из наших
+    cb = getattr(event, "data", None)
+    if isinstance(cb, str):
+        return cb.split(":", 1)[0] + ":"
+    handler = data.get("handler")
+    return getattr(getattr(handler, "callback", None), "__name__", type(event).__name__)
+
+
+async def handler_middleware(handler, event, data):
+    """
+    Inner-middleware aiogram (dp.message / dp.callback_query): вызывается, только если хендлер нашёлся.
+    """
+    route = _route(event, data)
+    t0 = time.perf_counter()
+    try:
+        return await handler(event, data)
+    except Exception:
+        HANDLER_ERRORS.inc(route)
+        raise
+    finally:
+        HANDLER_SECONDS.observe(time.perf_counter() - t0, route)
+
+
+async def api_middleware(make_request, bot, method):
+    """
+    Middleware сессии бота (bot.session.middleware): каждый вызов Bot API.
+    """
+    name = type(method).__name__
+    t0 = time.perf_counter()
+    try:
+        return await make_request(bot, method)
+    except Exception as e:
+        API_ERRORS.inc(name, type(e).__name__)
+        raise
+    finally:
+        API_SECONDS.observe(time.perf_counter() - t0, name)
+
+
+# ---------- export ----------
+
+def dump(path: str):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render())
+    os.replace(tmp, path)  # читатель файла не увидит его наполовину записанным
+
+
+async def dump_loop(path: str, every: float):
+    while True:
+        await asyncio.sleep(every)
+        try:
+            await asyncio.to_thread(dump, path)
+        except OSError:
+            log.exception("metrics dump to %s failed", path)
+
+
+async def serve(host: str, port: int):
+    """
+    GET /metrics. Возвращает runner (await runner.cleanup() при остановке).
+    """
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("metrics on http://%s:%d/metrics", host, port)
+    return runner
@@ -0,0 +1,159 @@
+# outbox.py
+"""
+Доставка уведомлений сотрудникам из таблицы outbox: новая задача, принята/возвращена/отменена, новый срок.
+Строку пишет та же транзакция, что меняет задачу (db.enqueue_outbox), поэтому push не теряется,
+если Telegram не ответил или бот перезапустился между записью и отправкой.
+
+- обработчик по kind (register) отправляет сообщение через sender и возвращает его future
+  (None — отправлять уже нечего, например задачу отменили раньше, чем дошло уведомление);
+- доставленное удаляется; ошибка — повтор через OUTBOX_RETRY_BASE_SECONDS * 2^попытка
+  (не дольше OUTBOX_RETRY_MAX_SECONDS);
+- сотрудник не нажимал /start или заблокировал бота, либо попытки кончились (OUTBOX_MAX_ATTEMPTS) —
+  строка откладывается до его /start (wake), админу уходит событие "push не доставлен";
+- строки рассылки (batch, массовое создание задач) о себе по одной не сообщают: когда в рассылке не осталось
+  строк к отправке или повтору, создавшему уходит одна сводка (on_batch_done);
+- строки берёт только этот цикл, следующую пачку — после того как отметил предыдущую, так что дубли
+  возможны только при обрыве между отправкой и отметкой.
+При WORKERS > 1 цикл работает у лидера, а пишут в outbox все процессы — лидер смотрит в таблицу раз в poll секунд.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+import db
+import metrics
+import repo
+import sender
+from config import OUTBOX_BATCH, OUTBOX_MAX_ATTEMPTS, OUTBOX_RETRY_BASE_SECONDS, OUTBOX_RETRY_MAX_SECONDS
+
+log = logging.getLogger(__name__)
+
+ERROR_DELAY = 5  # секунд до следующей попытки цикла, если не удалось прочитать/записать outbox
+
+_handlers = {}  # kind -> async fn(chat_id, payload) -> future | None
+_on_parked = None
+_on_batch_done = None
+_wake = None
+_task = None
+_poll = None
+
+_messages = metrics.Counter("bot_outbox_messages_total", "Уведомления из outbox: sent, retry, parked", ("result",))
+
+
+def register(kind: str, fn):
+    _handlers[kind] = fn
+
+
+def hint():
+    """
+    В outbox появились строки к отправке сейчас — разбудить цикл (если он в этом процессе).
+    """
+    if _wake is not None:
+        _wake.set()
+
+
+async def wake(chat_id: int):
+    """
+    Сотрудник написал /start: отложенное и ждущее повтора — к отправке сейчас.
+    """
+    if await repo.write(db.outbox_wake, chat_id):
+        hint()
+
+
+def backoff(attempts: int) -> float:
+    return min(OUTBOX_RETRY_MAX_SECONDS, OUTBOX_RETRY_BASE_SECONDS * 2 ** attempts)
+
+
+def _permanent(e: Exception) -> bool:
+    # повтор не поможет, пока сотрудник сам не напишет боту
+    return isinstance(e, TelegramForbiddenError) or (
+        isinstance(e, TelegramBadRequest) and "chat not found" in str(e).lower())
+
+
+def _payload(row) -> dict:
+    return json.loads(row["payload"]) if row["payload"] else {}
+
+
+async def _send(row):
+    fn = _handlers.get(row["kind"])
+    if fn is None:
+        raise LookupError(f"outbox: no handler for {row['kind']}")
+    fut = await fn(row["chat_id"], _payload(row))
+    if fut is not None:
+        await fut
+
+
+async def _run_due(now: int) -> int:
+    rows = await repo.read(db.due_outbox, now, OUTBOX_BATCH)
+    if not rows:
+        return 0
+    _, failed = await sender.fan_out(rows, _send)
+    retries, parked = [], []
+    for row, e in failed:
+        if _permanent(e) or row["attempts"] + 1 >= OUTBOX_MAX_ATTEMPTS:
+            next_at = None
+            parked.append((row, e))
+        else:
+            next_at = int(time.time() + backoff(row["attempts"]))
+        retries.append((row["id"], next_at, f"{type(e).__name__}: {e}"[:500]))
+    failed_ids = {row["id"] for row, _ in failed}
+    batches = {r["batch"] for r in rows if r["batch"]}
+    done = await repo.write(db.outbox_finish, [r["id"] for r in rows if r["id"] not in failed_ids], retries, batches)
+
+    _messages.inc("sent", n=len(rows) - len(failed))
+    _messages.inc("retry", n=len(retries) - len(parked))
+    _messages.inc("parked", n=len(parked))
+    for row, e in parked:
+        log.info("outbox: %s for %s parked until /start: %r", row["kind"], row["chat_id"], e)
+        if _on_parked is not None and not row["batch"]:
+            _on_parked(row["chat_id"], _payload(row))
+    for chat_id, total, batch_parked in done:
+        if _on_batch_done is not None:
+            await _on_batch_done(chat_id, total, [(r["chat_id"], _payload(r)) for r in batch_parked])
+    return len(rows)
+
+
+async def _loop():
+    while True:
+        _wake.clear()
+        try:
+            if await _run_due(db.now_ts()):
+                continue  # могли остаться ещё строки к отправке
+            next_at = await repo.read(db.next_outbox_time)
+            timeout = None if next_at is None else max(0.0, next_at - time.time())
+        except Exception:
+            log.exception("outbox: run failed")
+            timeout = ERROR_DELAY
+        if _poll:
+            timeout = _poll if timeout is None else min(timeout, _poll)
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def start(on_parked=None, on_batch_done=None, poll: float = None):
+    """
+    on_parked(chat_id, payload) — уведомление отложено до /start сотрудника.
+    on_batch_done(chat_id, total, parked) — корутина: рассылка закончилась, parked — [(chat_id, payload)]
+    отложенных до /start; chat_id — кто её создал.
+    poll — секунд между проверками outbox на строки от других процессов (None — не нужно).
+    """
+    global _on_parked, _on_batch_done, _wake, _task, _poll
+    _on_parked = on_parked
+    _on_batch_done = on_batch_done
+    _wake = asyncio.Event()
+    _poll = poll
+    _task = asyncio.create_task(_loop())
+
+
+async def stop():
+    global _task, _wake
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+    _wake = None
@@ -0,0 +1,94 @@
+# render.py
+"""
+Клавиатуры и тексты задач без лишней работы на каждый экран.
+
+- разметка собирается сразу из рядов кнопок (markup, grid), без InlineKeyboardBuilder: его as_markup
+  копирует все кнопки, и на странице списка это было дороже самого запроса в БД;
+- объекты aiogram неизменяемые (frozen), поэтому готовую разметку можно отдавать многократно:
+  постоянные меню строятся один раз (static), кнопки действий с задачей зависят только от
+  (task_id, статус, роль) — шаблон (TaskActions) на статус собирается один раз, разметки задач — в LRU;
+- тексты карточки и строки списка считаются из компактного кортежа полей задачи (memo):
+  задача, уже показанная на странице или в карточке, при листании назад не форматируется заново.
+Кэши — по RENDER_CACHE_SIZE записей на функцию; устаревать нечему: ключ — все поля, из которых строится результат.
+"""
+import functools
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+import metrics
+from config import RENDER_CACHE_SIZE
+
+_memos = []
+
+
+def memo(fn):
+    """
+    LRU на RENDER_CACHE_SIZE вызовов; аргументы — только неизменяемые (id, статус, строки, ...).
+    """
+    cached = functools.lru_cache(maxsize=RENDER_CACHE_SIZE)(fn)
+    _memos.append(cached)
+    return cached
+
+
+def static(fn):
+    """
+    Разметка без аргументов (меню) — один объект на процесс.
+    """
+    cached = functools.cache(fn)
+    _memos.append(cached)
+    return cached
+
+
+def cache_clear():
+    for fn in _memos:
+        fn.cache_clear()
+
+
+def _stat(field: str) -> int:
+    return sum(getattr(fn.cache_info(), field) for fn in _memos)
+
+
+metrics.Gauge("bot_render_cache_hits_total", "Клавиатуры и тексты задач из кэша", lambda: _stat("hits"), kind="counter")
+metrics.Gauge("bot_render_cache_misses_total", "Клавиатуры и тексты задач построены заново", lambda: _stat("misses"),
+              kind="counter")
+
+
+def button(text: str, data: str) -> InlineKeyboardButton:
+    return InlineKeyboardButton(text=text, callback_data=data)
+
+
+def markup(rows) -> InlineKeyboardMarkup:
+    """
+    rows: ряды кнопок — InlineKeyboardButton или (текст, callback_data). Пустые ряды пропускаются.
+    """
+    keyboard = [[b if isinstance(b, InlineKeyboardButton) else button(*b) for b in row] for row in rows]
+    return InlineKeyboardMarkup(inline_keyboard=[row for row in keyboard if row])
+
+
+def grid(buttons, width: int = 1):
+    """
+    Ряды по width кнопок (как InlineKeyboardBuilder.adjust(width)).
+    """
+    buttons = list(buttons)
+    return [buttons[i:i + width] for i in range(0, len(buttons), width)]
+
+
+def join(*markups) -> InlineKeyboardMarkup:
+    """
+    Одна разметка из нескольких (None пропускаются) — кнопки не копируются.
+    """
+    return InlineKeyboardMarkup(inline_keyboard=[row for m in markups if m is not None for row in m.inline_keyboard])
+
+
+class TaskActions:
+    """
+    Кнопки действий с задачей: templates — статус -> [(текст, действие)] (в порядке кнопок),
+    callback — t:<task_id>:<действие>, по width в ряд. Разметка на (task_id, статус) — из LRU.
+    """
+
+    def __init__(self, templates: dict, width: int = 2):
+        self.templates = {status: grid(actions, width) for status, actions in templates.items()}
+        self.get = memo(self._build)
+
+    def _build(self, task_id: int, status: int) -> InlineKeyboardMarkup:
+        return markup([(text, f"t:{task_id}:{action}") for text, action in row] for row in self.templates[status])
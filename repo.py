@@ -0,0 +1,319 @@
+# repo.py
+"""
+Асинхронный слой доступа к БД.
+sqlite3 блокирующий, поэтому все запросы выполняются в отдельных DB-потоках,
+а хендлеры только ждут результат и не останавливают event loop.
+Запись — один поток и одно соединение (db.writer), чтение — пул потоков и read-only соединений (db.reader).
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import db
+import metrics
+from config import DASHBOARD_TTL_SECONDS, DB_QUEUE_SIZE, DB_READ_POOL_SIZE, USER_CACHE_SIZE
+
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+_read_executor = ThreadPoolExecutor(max_workers=max(1, DB_READ_POOL_SIZE), thread_name_prefix="db-read")
+_slots = None  # asyncio.Semaphore, создаётся внутри работающего loop
+
+
+def _call_write(fn, *args, **kwargs):
+    with db.transaction() as conn:
+        return fn(conn, *args, **kwargs)
+
+
+def _call_read(fn, *args, **kwargs):
+    with db.reader() as conn:
+        return fn(conn, *args, **kwargs)
+
+
+def _call_archived(fn, month, *args, **kwargs):
+    conn = db.archive_conn(month)
+    try:
+        return fn(conn, *args, **kwargs)
+    finally:
+        conn.close()
+
+
+def _timed(call, mode: str, queued: float, fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    metrics.DB_WAIT_SECONDS.observe(t0 - queued, mode)
+    try:
+        return call(fn, *args, **kwargs)
+    finally:
+        metrics.DB_CALL_SECONDS.observe(time.perf_counter() - t0, getattr(fn, "__name__", "?"), mode)
+
+
+async def _submit(executor, call, fn, *args, **kwargs):
+    """
+    Очередь ограничена DB_QUEUE_SIZE: при переполнении хендлер ждёт здесь, а не копит задачи в executor.
+    """
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(DB_QUEUE_SIZE)
+    queued = time.perf_counter()
+    async with _slots:
+        loop = asyncio.get_running_loop()
+        mode = "write" if call is _call_write else "read"
+        return await loop.run_in_executor(executor, partial(_timed, call, mode, queued, fn, *args, **kwargs))
+
+
+async def read(fn, *args, **kwargs):
+    """
+    Выполнить fn(conn, *args) на read-only соединении.
+    """
+    return await _submit(_read_executor, _call_read, fn, *args, **kwargs)
+
+
+async def write(fn, *args, **kwargs):
+    """
+    Выполнить fn(conn, *args) на соединении записи одной транзакцией (db.transaction).
+    """
+    return await _submit(_write_executor, _call_write, fn, *args, **kwargs)
+
+
+async def read_archived(fn, task_id: int, *args, **kwargs):
+    """
+    Выполнить fn(conn, task_id, *args) по файлу архива, где лежит задача (см. archive.py).
+    None — задачи нет и в архиве.
+    """
+    month = await read(db.archived_month, task_id)
+    if month is None:
+        return None
+    return await _submit(_read_executor, _call_archived, fn, month, task_id, *args, **kwargs)
+
+
+def shutdown():
+    _read_executor.shutdown(wait=True)
+    _write_executor.shutdown(wait=True)
+    db.close_all()
+
+
+# ---------- users ----------
+
+class UserCache:
+    """
+    LRU-кэш строк users (включая "нет такого пользователя").
+    Таблица маленькая и меняется только через upsert_employee / import_batch / set_employee_active,
+    которые вызывают invalidate(). Изменения из других процессов (WORKERS > 1) так не увидеть —
+    для них ttl: запись старше ttl секунд считается промахом.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0  # растёт при каждой инвалидации
+        self._data = OrderedDict()
+
+    def get(self, tg_id: int):
+        """
+        (True, row) — из кэша, (False, None) — промах.
+        """
+        item = self._data.get(tg_id)
+        if item is not None and (self.ttl is None or item[1] > time.monotonic() - self.ttl):
+            self._data.move_to_end(tg_id)
+            self.hits += 1
+            return True, item[0]
+        self.misses += 1
+        return False, None
+
+    def put(self, tg_id: int, row, version: int):
+        if version != self.version:
+            return  # пока читали из БД, кого-то изменили — не кэшируем возможно устаревшее
+        self._data[tg_id] = (row, time.monotonic())
+        self._data.move_to_end(tg_id)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, tg_id=None):
+        self.version += 1
+        if tg_id is None:
+            self._data.clear()
+        else:
+            self._data.pop(tg_id, None)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+
+users = UserCache(USER_CACHE_SIZE)
+metrics.Gauge("bot_user_cache_size", "Записей в кэше пользователей", lambda: len(users._data))
+metrics.Gauge("bot_user_cache_hits_total", "Попадания в кэш пользователей", lambda: users.hits, kind="counter")
+metrics.Gauge("bot_user_cache_misses_total", "Промахи кэша пользователей", lambda: users.misses, kind="counter")
+
+
+async def get_user(tg_id: int):
+    found, row = users.get(tg_id)
+    if found:
+        return row
+    version = users.version
+    row = await read(db.get_user, tg_id)
+    users.put(tg_id, row, version)
+    return row
+
+
+class ReadCache:
+    """
+    Результат одного чтения fn(conn) на ttl секунд — для экранов, которые открывают чаще, чем меняются данные.
+    Записи, от которых он зависит, вызывают invalidate(); ttl — для изменений без записи в этом процессе
+    (наступивший срок, другие воркеры при WORKERS > 1).
+    """
+
+    def __init__(self, fn, ttl: float):
+        self.fn = fn
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        self._value = None
+        self._at = 0.0
+
+    async def get(self):
+        if self._value is not None and time.monotonic() - self._at < self.ttl:
+            self.hits += 1
+            return self._value
+        self.misses += 1
+        version = self.version
+        value = await read(self.fn)
+        if version == self.version:  # как в UserCache.put: пока читали, данные могли измениться
+            self._value, self._at = value, time.monotonic()
+        return value
+
+    def invalidate(self):
+        self.version += 1
+        self._value = None
+
+
+dashboard = ReadCache(db.dashboard, DASHBOARD_TTL_SECONDS)
+metrics.Gauge("bot_dashboard_cache_hits_total", "Сводка админа из кэша", lambda: dashboard.hits, kind="counter")
+metrics.Gauge("bot_dashboard_cache_misses_total", "Сводка админа из БД", lambda: dashboard.misses, kind="counter")
+
+
+async def list_employees():
+    return await read(db.list_employees)
+
+
+async def list_active_employees():
+    return await read(db.list_active_employees)
+
+
+async def upsert_employee(tg_id: int, fio: str, dept: str, actor_id: int):
+    try:
+        return await write(db.upsert_employee, tg_id, fio, dept, actor_id)
+    finally:
+        users.invalidate(tg_id)
+        dashboard.invalidate()  # в сводке — ФИО
+
+
+async def import_batch(users_rows, tasks, actor_id: int):
+    try:
+        return await write(db.import_batch, users_rows, tasks, actor_id)
+    finally:
+        for tg_id, _, _ in users_rows:
+            users.invalidate(tg_id)
+        dashboard.invalidate()
+
+
+async def set_employee_active(tg_id: int, active: bool, actor_id: int):
+    try:
+        return await write(db.set_employee_active, tg_id, active, actor_id)
+    finally:
+        users.invalidate(tg_id)
+
+
+# ---------- tasks ----------
+
+# карточка, история и файлы задачи: если в горячей базе задачи нет — она может быть в архиве
+
+async def get_task(task_id: int):
+    return await read(db.get_task, task_id) or await read_archived(db.get_task, task_id)
+
+
+async def list_tasks_page(statuses, owner_id=None, overdue=False, by="deadline", cursor=None, backward=False,
+                          limit=10):
+    return await read(db.list_tasks_page, statuses, owner_id=owner_id, overdue=overdue, by=by,
+                      cursor=cursor, backward=backward, limit=limit)
+
+
+async def user_task_counts(tg_id: int):
+    return await read(db.user_task_counts, tg_id)
+
+
+async def report_counts():
+    return await read(db.report_counts)
+
+
+async def check_counters(fix: bool = False):
+    """
+    Сверка — на читающем соединении: полный пересчёт по tasks и archived_tasks не держит писателя.
+    Нашлись расхождения и fix — перепроверка и пересборка одной транзакцией записи (расхождение
+    могло быть и от записи между запросами сверки).
+    """
+    diff = await read(db.check_counters)
+    if diff and fix:
+        diff = await write(db.check_counters, fix=True)
+    return diff
+
+
+async def search_tasks(text: str, owner_id=None, offset=0, limit=10):
+    return await read(db.search_tasks, text, owner_id=owner_id, offset=offset, limit=limit)
+
+
+async def set_task_status(task_id: int, status: int, actor_id: int, details: str, from_status=None,
+                          notify: bool = False):
+    try:
+        return await write(db.set_task_status, task_id, status, actor_id, details, from_status=from_status,
+                           notify=notify)
+    finally:
+        dashboard.invalidate()
+
+
+async def create_task(title: str, desc: str, deadline: int, owner_id: int, dept: str, actor_id: int):
+    try:
+        return await write(db.create_task, title, desc, deadline, owner_id, dept, actor_id)
+    finally:
+        dashboard.invalidate()
+
+
+async def create_tasks_bulk(title: str, desc: str, deadline: int, targets, actor_id: int):
+    try:
+        return await write(db.create_tasks_bulk, title, desc, deadline, targets, actor_id)
+    finally:
+        dashboard.invalidate()
+
+
+async def change_deadline(task_id: int, new_deadline: int, actor_id: int):
+    try:
+        return await write(db.change_deadline, task_id, new_deadline, actor_id)
+    finally:
+        dashboard.invalidate()
+
+
+async def add_comment(task_id: int, author_id: int, text: str):
+    return await write(db.add_comment, task_id, author_id, text)
+
+
+async def add_file(task_id: int, uploader_id: int, file_id: str, file_name, kind: str = "document"):
+    return await write(db.add_file, task_id, uploader_id, file_id, file_name, kind=kind)
+
+
+async def get_task_detail(task_id: int, limit=5):
+    return (await read(db.get_task_detail, task_id, limit=limit)
+            or await read_archived(db.get_task_detail, task_id, limit=limit))
+
+
+async def task_history_page(task_id: int, before_id=None, limit=10):
+    rows, more = await read(db.task_history_page, task_id, before_id=before_id, limit=limit)
+    if not rows:
+        return await read_archived(db.task_history_page, task_id, before_id=before_id, limit=limit) or (rows, more)
+    return rows, more
+
+
+async def list_task_files(task_id: int, limit=None):
+    return (await read(db.list_task_files, task_id, limit=limit)
+            or await read_archived(db.list_task_files, task_id, limit=limit) or [])
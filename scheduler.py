@@ -0,0 +1,217 @@
+# scheduler.py
+"""
+Планировщик: повторяющиеся задачи по cron (ежедневный отчёт) и разовые (напоминания о сроках).
+Задачи хранятся в таблице jobs и переживают перезапуск; в памяти — только куча ближайших
+времён запуска, цикл спит до первого из них и просыпается раньше, только если появилась задача раньше.
+Пропущенные (бот был выключен) выполняются сразу после запуска.
+Обработчики запускаются отдельными задачами: долгий (архивация, сверка счётчиков) не задерживает
+напоминания, подошедшие после него; задача в jobs переносится/снимается сразу при запуске.
+При WORKERS > 1 планировщик работает только у лидера (cluster.py), а задачи в jobs добавляют и другие
+процессы — тогда цикл раз в poll секунд сам смотрит в таблицу, ближайший запуск не опаздывает больше чем на poll.
+"""
+import asyncio
+import heapq
+import json
+import logging
+import time
+from datetime import datetime, time as dtime, timedelta
+
+import db
+import repo
+
+log = logging.getLogger(__name__)
+
+ERROR_DELAY = 5  # секунд до повтора, если не удалось прочитать/записать jobs
+
+
+def _cron_field(expr: str, lo: int, hi: int):
+    values = set()
+    for part in expr.split(","):
+        step = 1
+        if "/" in part:
+            part, step_s = part.split("/")
+            step = int(step_s)
+        if part == "*":
+            start, end = lo, hi
+        elif "-" in part:
+            a, b = part.split("-")
+            start, end = int(a), int(b)
+        else:
+            start = int(part)
+            end = hi if step != 1 else start
+        if start < lo or end > hi or start > end or step < 1:
+            raise ValueError(f"cron: недопустимое значение {expr!r}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class Cron:
+    """
+    Классический cron из 5 полей: минута час день месяц день_недели (0 и 7 — воскресенье).
+    Поддерживаются *, списки, диапазоны и шаги. Время — в часовом поясе db.TZ.
+    """
+
+    def __init__(self, spec: str):
+        f = spec.split()
+        if len(f) != 5:
+            raise ValueError(f"cron: нужно 5 полей, получено {spec!r}")
+        self.minutes = sorted(_cron_field(f[0], 0, 59))
+        self.hours = sorted(_cron_field(f[1], 0, 23))
+        self.days = _cron_field(f[2], 1, 31)
+        self.months = _cron_field(f[3], 1, 12)
+        self.weekdays = {d % 7 for d in _cron_field(f[4], 0, 7)}
+        self.any_day = f[2] == "*"
+        self.any_weekday = f[4] == "*"
+
+    def _day_matches(self, d) -> bool:
+        if d.month not in self.months:
+            return False
+        dom = d.day in self.days
+        dow = d.isoweekday() % 7 in self.weekdays
+        if self.any_day and self.any_weekday:
+            return True
+        if self.any_day:
+            return dow
+        if self.any_weekday:
+            return dom
+        return dom or dow
+
+    def next_after(self, ts: float) -> int:
+        start = db.from_ts(ts).replace(tzinfo=None, second=0, microsecond=0) + timedelta(minutes=1)
+        d = start.date()
+        for _ in range(366 * 5):
+            if self._day_matches(d):
+                for h in self.hours:
+                    for m in self.minutes:
+                        dt = datetime.combine(d, dtime(h, m))
+                        if dt >= start:
+                            return db.to_ts(dt)
+            d += timedelta(days=1)
+        raise ValueError("cron: расписание никогда не срабатывает")
+
+
+_handlers = {}  # kind -> async fn(payload)
+_running = {}   # key задачи -> asyncio.Task её обработчика, пока он не закончился
+_heap = []      # ближайшие времена запуска (подсказки; источник истины — таблица jobs, см. _resync)
+_wake = None
+_task = None
+_poll = None
+
+
+def register(kind: str, fn):
+    _handlers[kind] = fn
+
+
+def hint(fire_at: int):
+    """
+    Сообщить о новой/перенесённой задаче в БД, чтобы цикл проснулся вовремя.
+    """
+    if _task is None:
+        return  # планировщик не запущен (или он у другого процесса) — start() прочитает jobs сам
+    if _heap and _heap[0] <= fire_at:
+        return  # цикл проснётся раньше, а после запуска возьмёт следующее время из jobs
+    heapq.heappush(_heap, fire_at)
+    if _wake is not None:
+        _wake.set()
+
+
+def hint_task(deadline: int):
+    for fire_at, _ in db.reminder_times(deadline):
+        hint(fire_at)
+
+
+async def ensure_cron(key: str, kind: str, spec: str):
+    fire_at = await repo.write(db.ensure_cron_job, key, kind, spec, Cron(spec).next_after(time.time()))
+    hint(fire_at)
+
+
+def _start(key: str, fn, payload: dict):
+    task = asyncio.create_task(fn(payload))
+    _running[key] = task
+    task.add_done_callback(lambda t: _finished(key, t))
+
+
+def _finished(key: str, task: asyncio.Task):
+    _running.pop(key, None)
+    if not task.cancelled() and task.exception() is not None:
+        log.error("scheduler: job %s failed", key, exc_info=task.exception())
+
+
+async def _run_due(now: int):
+    for job in await repo.read(db.due_jobs, now):
+        fn = _handlers.get(job["kind"])
+        if fn is None:
+            log.warning("scheduler: no handler for %s (%s)", job["kind"], job["key"])
+        elif job["key"] in _running:
+            log.warning("scheduler: job %s is still running, skipped", job["key"])
+        else:
+            _start(job["key"], fn, json.loads(job["payload"]) if job["payload"] else {})
+        if job["cron"]:
+            next_at = Cron(job["cron"]).next_after(max(now, job["fire_at"]))
+            await repo.write(db.reschedule_job, job["id"], next_at)
+            hint(next_at)
+        else:
+            await repo.write(db.finish_job, job["id"], job["fire_at"])
+
+
+async def _loop():
+    while True:
+        now = time.time()
+        if _heap and _heap[0] <= now:
+            while _heap and _heap[0] <= now:
+                heapq.heappop(_heap)
+            try:
+                await _run_due(int(now))
+            except Exception:
+                log.exception("scheduler: run failed")
+                # снятые с кучи времена потеряны, а задачи остались в jobs — вернуться к ним позже
+                heapq.heappush(_heap, int(now) + ERROR_DELAY)
+                continue
+            await _resync()  # следующее время — из jobs: в куче держим только ближайшие
+            continue
+        _wake.clear()
+        timeout = _heap[0] - now if _heap else None
+        if _poll:
+            timeout = _poll if timeout is None else min(timeout, _poll)
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout)
+        except asyncio.TimeoutError:
+            if _poll:
+                await _resync()
+
+
+async def _resync():
+    try:
+        fire_at = await repo.read(db.next_job_time)
+    except Exception:
+        log.exception("scheduler: resync failed")
+        heapq.heappush(_heap, int(time.time()) + ERROR_DELAY)
+        return
+    if fire_at is not None and (not _heap or fire_at < _heap[0]):
+        heapq.heappush(_heap, fire_at)
+
+
+async def start(poll: float = None):
+    """
+    poll — секунд между проверками jobs на задачи, добавленные другими процессами (None — не нужно).
+    """
+    global _wake, _task, _poll
+    _wake = asyncio.Event()
+    _poll = poll
+    _heap.clear()
+    fire_at = await repo.read(db.next_job_time)
+    if fire_at is not None:
+        heapq.heappush(_heap, fire_at)
+    _task = asyncio.create_task(_loop())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+    running = list(_running.values())
+    for task in running:
+        task.cancel()
+    await asyncio.gather(*running, return_exceptions=True)
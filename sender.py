@@ -0,0 +1,213 @@
+# sender.py
+"""
+Очередь исходящих сообщений.
+Хендлеры только ставят сообщение в очередь и сразу возвращаются; отправкой занимается пул воркеров.
+- token bucket на каждый чат и общий (лимиты Telegram);
+- приоритеты: ответы на действия пользователя раньше уведомлений, уведомления раньше списков и отчётов;
+- порядок сообщений внутри одного чата и одного приоритета сохраняется;
+- TelegramRetryAfter: чат ставится на паузу, сообщение повторяется.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+from config import (SEND_CHAT_BURST, SEND_CHAT_RATE, SEND_FANOUT_LIMIT, SEND_GLOBAL_RATE, SEND_MAX_RETRIES,
+                    SEND_WORKERS)
+
+PRIO_INTERACTIVE = 0
+PRIO_NOTIFY = 1
+PRIO_BULK = 2
+
+log = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.ts = time.monotonic()
+        self.blocked_until = 0.0
+
+    def take(self, now: float) -> float:
+        """
+        Взять токен. 0 — взят, иначе сколько секунд подождать.
+        """
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def block(self, now: float, seconds: float):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def idle(self, now: float) -> bool:
+        return now >= self.blocked_until and self.tokens + (now - self.ts) * self.rate >= self.burst
+
+
+_bot = None
+_ready = None     # asyncio.PriorityQueue[(priority, seq, chat_id)] — чаты, готовые к отправке
+_pending = {}     # chat_id -> heap[(priority, seq, factory, future, attempts)]
+_queued = {}      # chat_id -> лучший приоритет, с которым чат уже стоит в _ready
+_inflight = set()  # чаты, которые сейчас отправляет воркер
+_buckets = {}     # chat_id -> TokenBucket
+_global = None
+_workers = []
+_seq = itertools.count()
+
+metrics.Gauge("bot_send_queue", "Сообщений в очереди на отправку", lambda: sum(len(h) for h in _pending.values()))
+
+
+def _bucket(chat_id) -> TokenBucket:
+    b = _buckets.get(chat_id)
+    if b is None:
+        if len(_buckets) > 10000:
+            now = time.monotonic()
+            for cid in [c for c, x in _buckets.items() if x.idle(now) and c not in _pending]:
+                del _buckets[cid]
+        b = _buckets[chat_id] = TokenBucket(SEND_CHAT_RATE, SEND_CHAT_BURST)
+    return b
+
+
+def _schedule(chat_id, priority: int, seq: int):
+    if chat_id in _inflight or _queued.get(chat_id, PRIO_BULK + 1) <= priority:
+        return
+    _queued[chat_id] = priority
+    _ready.put_nowait((priority, seq, chat_id))
+
+
+def _wake(chat_id):
+    _queued.pop(chat_id, None)
+    _reschedule(chat_id)
+
+
+def _reschedule(chat_id):
+    heap = _pending.get(chat_id)
+    if heap:
+        _schedule(chat_id, heap[0][0], heap[0][1])
+    else:
+        _pending.pop(chat_id, None)
+
+
+def _log_failure(fut: asyncio.Future):
+    if not fut.cancelled() and fut.exception() is not None:
+        log.info("send failed: %r", fut.exception())
+
+
+def submit(chat_id: int, factory, priority: int = PRIO_INTERACTIVE) -> asyncio.Future:
+    """
+    Поставить в очередь вызов factory() -> coroutine (любой метод Bot для чата chat_id).
+    Возвращает future с результатом; ждать его не обязательно.
+    """
+    fut = asyncio.get_running_loop().create_future()
+    fut.add_done_callback(_log_failure)
+    seq = next(_seq)
+    heapq.heappush(_pending.setdefault(chat_id, []), (priority, seq, factory, fut, 0))
+    _schedule(chat_id, priority, seq)
+    return fut
+
+
+def send_message(chat_id: int, text: str, priority: int = PRIO_INTERACTIVE, **kwargs) -> asyncio.Future:
+    return submit(chat_id, lambda: _bot.send_message(chat_id, text, **kwargs), priority)
+
+
+def reply(message, text: str, priority: int = PRIO_INTERACTIVE, **kwargs) -> asyncio.Future:
+    """
+    Ответ в чат сообщения (замена message.answer через очередь).
+    """
+    return send_message(message.chat.id, text, priority, **kwargs)
+
+
+async def fan_out(items, send, limit: int = SEND_FANOUT_LIMIT):
+    """
+    Массовая рассылка: send(item) -> future (send_message/submit). В очереди одновременно
+    не больше limit отправок, чтобы рассылка не вытесняла остальные уведомления.
+    Возвращает (число доставленных, [(item, ошибка)]).
+    """
+    sem = asyncio.Semaphore(max(1, limit))
+
+    async def one(item):
+        async with sem:
+            try:
+                await send(item)
+            except Exception as e:
+                return item, e
+
+    results = await asyncio.gather(*(one(item) for item in items))
+    failed = [r for r in results if r is not None]
+    return len(results) - len(failed), failed
+
+
+async def _worker():
+    loop = asyncio.get_running_loop()
+    while True:
+        _, _, chat_id = await _ready.get()
+        if chat_id in _inflight or not _pending.get(chat_id):
+            continue  # устаревшая запись: чат уже отправляется или пуст
+        _queued.pop(chat_id, None)
+
+        wait = _bucket(chat_id).take(time.monotonic())
+        if wait > 0:
+            _queued[chat_id] = _pending[chat_id][0][0]
+            loop.call_later(wait, _wake, chat_id)
+            continue
+
+        _inflight.add(chat_id)
+        try:
+            wait = _global.take(time.monotonic())
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = _global.take(time.monotonic())
+
+            priority, seq, factory, fut, attempts = heapq.heappop(_pending[chat_id])
+            if fut.done():
+                continue
+            try:
+                result = await factory()
+            except TelegramRetryAfter as e:
+                if attempts < SEND_MAX_RETRIES:
+                    heapq.heappush(_pending[chat_id], (priority, seq, factory, fut, attempts + 1))
+                    _bucket(chat_id).block(time.monotonic(), e.retry_after)
+                else:
+                    fut.set_exception(e)
+            except Exception as e:
+                fut.set_exception(e)
+            else:
+                fut.set_result(result)
+        finally:
+            _inflight.discard(chat_id)
+            _reschedule(chat_id)
+
+
+def start(bot, global_rate: float = SEND_GLOBAL_RATE):
+    """
+    global_rate — общий лимит этого процесса; при WORKERS > 1 лимит бота делится между воркерами.
+    """
+    global _bot, _ready, _global
+    _bot = bot
+    _ready = asyncio.PriorityQueue()
+    _global = TokenBucket(global_rate, global_rate)
+    for _ in range(max(1, SEND_WORKERS)):
+        _workers.append(asyncio.create_task(_worker()))
+
+
+async def stop(timeout: float = 5.0):
+    """
+    Дождаться отправки очереди (не дольше timeout) и остановить воркеров.
+    """
+    deadline = time.monotonic() + timeout
+    while (_pending or _inflight) and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    for w in _workers:
+        w.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
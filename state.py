@@ -0,0 +1,116 @@
+# state.py
+"""
+Состояние незавершённых диалогов (создание задачи, комментарий, файл, смена срока).
+Чтение — из кэша в памяти (O(1)), запись — сразу в кэш и в хранилище (write-through),
+поэтому после перезапуска админ продолжает с того же шага. Брошенные состояния живут FSM_TTL_HOURS.
+"""
+import asyncio
+import json
+import logging
+import time
+
+import db
+import repo
+from config import FSM_STORAGE, FSM_SWEEP_MINUTES, FSM_TTL_HOURS
+
+log = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """
+    Только память процесса — состояние теряется при перезапуске.
+    """
+
+    async def load(self, since: int):
+        return []
+
+    async def save(self, tg_id: int, data: dict, ts: int):
+        pass
+
+    async def delete(self, tg_id: int):
+        pass
+
+    async def delete_expired(self, before: int) -> int:
+        return 0
+
+
+class SQLiteBackend:
+    """
+    Таблица fsm_state в tasks.db.
+    """
+
+    async def load(self, since: int):
+        rows = await repo.read(db.fsm_load, since)
+        return [(r["telegram_id"], json.loads(r["data"]), r["updated_at"]) for r in rows]
+
+    async def save(self, tg_id: int, data: dict, ts: int):
+        await repo.write(db.fsm_save, tg_id, json.dumps(data, ensure_ascii=False), ts)
+
+    async def delete(self, tg_id: int):
+        await repo.write(db.fsm_delete, tg_id)
+
+    async def delete_expired(self, before: int) -> int:
+        return await repo.write(db.fsm_delete_expired, before)
+
+
+BACKENDS = {"memory": MemoryBackend, "sqlite": SQLiteBackend}
+
+
+class StateStore:
+    def __init__(self, backend, ttl_seconds: float):
+        self.backend = backend
+        self.ttl = ttl_seconds
+        self._cache = {}  # tg_id -> (data, updated_at)
+
+    async def load(self):
+        # все строки, и протухшие тоже (их не отдаёт get и уберёт sweep): кэш знает обо всём, что лежит
+        # в хранилище, поэтому pop ходит в хранилище, только если запись есть в кэше
+        self._cache = {tg_id: (data, ts) for tg_id, data, ts in await self.backend.load(0)}
+
+    def get(self, tg_id: int):
+        item = self._cache.get(tg_id)
+        if item is None:
+            return None
+        data, ts = item
+        if ts < time.time() - self.ttl:
+            return None  # протухло — удалит sweep
+        return data
+
+    async def set(self, tg_id: int, data: dict):
+        ts = int(time.time())
+        self._cache[tg_id] = (data, ts)
+        await self.backend.save(tg_id, data, ts)
+
+    async def pop(self, tg_id: int):
+        item = self._cache.get(tg_id)
+        if item is None:
+            return None  # нечего чистить — без записи в хранилище
+        await self.backend.delete(tg_id)
+        # из кэша — только после удаления из хранилища: если delete не удался, следующий pop повторит его
+        if self._cache.get(tg_id) is item:
+            del self._cache[tg_id]
+        return item[0]
+
+    async def sweep(self) -> int:
+        before = int(time.time() - self.ttl)
+        n = await self.backend.delete_expired(before)
+        for tg_id in [k for k, (_, ts) in self._cache.items() if ts < before]:
+            del self._cache[tg_id]
+        return n
+
+    async def sweep_loop(self):
+        while True:
+            await asyncio.sleep(FSM_SWEEP_MINUTES * 60)
+            try:
+                n = await self.sweep()
+                if n:
+                    log.info("fsm sweep: removed %s abandoned states", n)
+            except Exception:
+                log.exception("fsm sweep failed")
+
+
+def create_store() -> StateStore:
+    backend = BACKENDS.get(FSM_STORAGE)
+    if backend is None:
+        raise RuntimeError(f"FSM_STORAGE: неизвестное хранилище {FSM_STORAGE!r} (sqlite / memory)")
+    return StateStore(backend(), FSM_TTL_HOURS * 3600)
@@ -0,0 +1,127 @@
+# webhook.py
+"""
+Приём обновлений через webhook (BOT_MODE=webhook) вместо long polling.
+aiohttp принимает POST от Telegram, проверяет secret token и кладёт update в очередь;
+обработкой занимаются воркеры. Обновления одного пользователя всегда попадают в одну очередь,
+поэтому шаги диалога обрабатываются по порядку.
+Если очереди заполнены дольше WEBHOOK_ENQUEUE_TIMEOUT — отвечаем 503, Telegram повторит доставку позже.
+При WORKERS > 1 своих очередей нет: update отдаётся в sink (cluster.py пишет его в таблицу updates).
+"""
+import asyncio
+import hmac
+import logging
+
+from aiogram.types import Update
+from aiohttp import web
+
+from config import (
+    WEBHOOK_ENQUEUE_TIMEOUT,
+    WEBHOOK_HOST,
+    WEBHOOK_PATH,
+    WEBHOOK_PORT,
+    WEBHOOK_QUEUE_SIZE,
+    WEBHOOK_SECRET,
+    WEBHOOK_URL,
+    WEBHOOK_WORKERS,
+)
+
+log = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def update_user_id(data: dict) -> int:
+    """
+    from.id из сырого update (message / callback_query / ...), 0 — если отправителя нет.
+    """
+    for value in data.values():
+        if isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return int(value["from"].get("id", 0))
+    return 0
+
+
+async def _worker(dp, bot, queue: asyncio.Queue):
+    while True:
+        data = await queue.get()
+        try:
+            update = Update.model_validate(data, context={"bot": bot})
+            await dp.feed_update(bot, update)
+        except Exception:
+            log.exception("update %s failed", data.get("update_id"))
+        finally:
+            queue.task_done()
+
+
+def create_app(dp, bot, secret: str = WEBHOOK_SECRET, path: str = WEBHOOK_PATH,
+               workers: int = WEBHOOK_WORKERS, queue_size: int = WEBHOOK_QUEUE_SIZE,
+               url: str = WEBHOOK_URL, sink=None) -> web.Application:
+    """
+    sink — async fn(data) -> bool вместо своих очередей и воркеров; False — ответить 503.
+    """
+    workers = max(1, workers)
+    queues = [asyncio.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+    tasks = []
+
+    async def handle(request: web.Request):
+        # байтами: compare_digest не сравнивает str с не-ASCII символами, а заголовок присылает кто угодно
+        got = request.headers.get(SECRET_HEADER, "").encode("utf-8", "surrogateescape")
+        if secret and not hmac.compare_digest(got, secret.encode()):
+            return web.Response(status=401)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(data, dict):
+            return web.Response(status=400)
+        if sink is not None:
+            return web.Response(status=200 if await sink(data) else 503)
+        queue = queues[update_user_id(data) % workers]
+        try:
+            await asyncio.wait_for(queue.put(data), WEBHOOK_ENQUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            return web.Response(status=503)
+        return web.Response()
+
+    async def on_startup(app):
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        if sink is None:
+            for q in queues:
+                tasks.append(asyncio.create_task(_worker(dp, bot, q)))
+        if url:
+            await bot.set_webhook(
+                url,
+                secret_token=secret or None,
+                allowed_updates=dp.resolve_used_update_types(),
+            )
+        log.info("webhook: listening on %s (workers=%s)", path, workers)
+
+    async def on_shutdown(app):
+        # доработать то, что уже принято, и только потом останавливать воркеров
+        try:
+            await asyncio.wait_for(asyncio.gather(*(q.join() for q in queues)), 10)
+        except asyncio.TimeoutError:
+            log.warning("webhook: shutdown with %s updates in queue", sum(q.qsize() for q in queues))
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+async def run(dp, bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT, sink=None):
+    """
+    Запустить webhook-сервер и работать до отмены (Ctrl+C / остановка процесса).
+    """
+    runner = web.AppRunner(create_app(dp, bot, sink=sink))
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()